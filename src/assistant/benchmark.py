@@ -0,0 +1,372 @@
+"""Offline throughput benchmark for the research graph.
+
+Drives ``assistant.graph.graph`` end to end against a stand-in Ollama HTTP
+server and fake search backends with configurable latency and payload sizes,
+so changes to the pipeline can be measured without live models or paid APIs:
+
+    python -m assistant.benchmark --concurrency 1 4 8 --sessions 8 --save-baseline baseline.json
+    python -m assistant.benchmark --concurrency 1 4 8 --sessions 8 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+from unittest import mock
+
+import assistant.graph as research_graph
+from assistant.configuration import SearchAPI
+from assistant.context import estimate_tokens
+from assistant.metrics import collect_metrics, timed
+
+warnings.filterwarnings('ignore')
+
+# Vocabulary for generated page text; pages are drawn from it per URL, so
+# different pages do not look like near-duplicates to the cross-loop dedup
+_VOCABULARY = (
+    "model data system research network energy protein market policy climate signal memory "
+    "process circuit language theory sample result method analysis design cost growth risk "
+    "latency storage device sensor neural quantum battery carbon genome trial survey metric"
+).split()
+
+# Length limit stated in a prompt, e.g. the delta notes of the incremental strategy
+_WORD_LIMIT = re.compile(r"at most (\d+) words")
+
+@dataclass
+class BenchmarkSettings:
+    """Knobs of one benchmark run."""
+    concurrency: List[int] = field(default_factory=lambda: [1, 4])
+    sessions: int = 4  # Sessions per concurrency level
+    loops: int = 3  # max_web_research_loops of each session
+    search_api: str = "tavily"
+    search_fanout: int = 1
+    search_latency: float = 0.2  # Seconds per fake search call
+    results_per_query: int = 3
+    payload_bytes: int = 20000  # Raw content size of each fake result
+    llm_latency: float = 0.05  # Seconds before the stub model's first token
+    prompt_token_latency: float = 0.0001  # Prefill seconds per prompt token
+    token_latency: float = 0.002  # Seconds per generated token
+    summary_words: int = 200  # Length of each stub summary (or less, when the prompt asks for at most N words)
+    summary_strategy: str = "rewrite"
+    ollama_max_concurrency: int = 4  # In-flight cap of the Ollama dispatcher
+    pipelined_research: bool = False  # Prefetch the next loop's searches while summarizing
+    seed: int = 0
+
+class StubOllamaServer:
+    """A local stand-in for Ollama's /api/chat endpoint.
+
+    JSON-format requests get a fresh search query (or query list) in the shape
+    the prompt asks for, other requests a summary of ``summary_words`` words.
+    Latency grows with prompt and completion size, and the reported
+    ``prompt_eval_count``/``eval_count`` come from the shared token estimator.
+    """
+
+    def __init__(self, settings: BenchmarkSettings):
+        self.settings = settings
+        self._queries = itertools.count(1)
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path.rstrip('/') != '/api/chat':
+                    self.send_error(404)
+                    return
+                try:
+                    server._chat(self, body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up on the call, e.g. its session was cancelled
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-ollama', daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self) -> "StubOllamaServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _reply(self, body: Dict[str, Any]) -> str:
+        system = body['messages'][0]['content'] if body.get('messages') else ''
+        if not body.get('format'):
+            rng = random.Random(next(self._queries))
+            limit = _WORD_LIMIT.search(system)
+            words = min(self.settings.summary_words, int(limit.group(1))) if limit else self.settings.summary_words
+            return " ".join(rng.choice(_VOCABULARY) for _ in range(words)) + "."
+        queries = [f"benchmark query {next(self._queries)}" for _ in range(max(1, self.settings.search_fanout))]
+        if 'follow_up_queries' in system:
+            return json.dumps({"knowledge_gaps": queries, "follow_up_queries": queries})
+        if 'follow_up_query' in system:
+            return json.dumps({"knowledge_gap": "gap", "follow_up_query": queries[0]})
+        if '"queries"' in system:
+            return json.dumps({"queries": [{"query": query, "aspect": "aspect"} for query in queries]})
+        return json.dumps({"query": queries[0], "aspect": "aspect", "rationale": "benchmark"})
+
+    def _chat(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]) -> None:
+        prompt_tokens = sum(estimate_tokens(message.get('content') or '') for message in body.get('messages', []))
+        words = self._reply(body).split(' ')
+        time.sleep(self.settings.llm_latency + prompt_tokens * self.settings.prompt_token_latency)
+
+        stream = body.get('stream', True)
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/x-ndjson')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+
+        def _send(chunk: Dict[str, Any]) -> None:
+            data = (json.dumps(chunk) + "\n").encode('utf-8')
+            handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            handler.wfile.flush()
+
+        base = {"model": body.get('model'), "created_at": "2024-01-01T00:00:00Z"}
+        pieces = [word + (' ' if i < len(words) - 1 else '') for i, word in enumerate(words)]
+        if not stream:
+            time.sleep(len(pieces) * self.settings.token_latency)
+            pieces = ["".join(pieces)]
+        for piece in pieces:
+            if stream:
+                time.sleep(self.settings.token_latency)
+            _send({**base, "message": {"role": "assistant", "content": piece}, "done": False})
+        _send({
+            **base, "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens, "eval_count": len(words)
+        })
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+
+def fake_search_backend(provider: str, settings: BenchmarkSettings):
+    """Return (sync, async) search functions standing in for one provider.
+
+    Results are deterministic per query, carry ``payload_bytes`` of raw
+    content and are recorded in the session metrics like real searches.
+    """
+    def _response(query: str) -> Dict[str, Any]:
+        results = []
+        for i in range(settings.results_per_query):
+            url = f"https://bench.example/{hashlib.sha1(query.encode()).hexdigest()[:12]}/{i}"
+            rng = random.Random(f"{settings.seed}:{url}")
+            words, size = [], 0
+            while size < settings.payload_bytes:
+                word = rng.choice(_VOCABULARY)
+                words.append(word)
+                size += len(word) + 1
+            raw_content = " ".join(words)
+            results.append({"title": f"{query} ({i + 1})", "url": url, "content": raw_content[:300], "raw_content": raw_content})
+        return {"results": results}
+
+    def search(query, *args, **kwargs):
+        with timed("search", provider) as call:
+            time.sleep(settings.search_latency)
+            response = _response(query)
+            call["bytes"] = len(json.dumps(response))
+        return response
+
+    async def asearch(query, *args, **kwargs):
+        with timed("search", provider) as call:
+            await asyncio.sleep(settings.search_latency)
+            response = _response(query)
+            call["bytes"] = len(json.dumps(response))
+        return response
+
+    return search, asearch
+
+@contextmanager
+def stubbed_environment(settings: BenchmarkSettings) -> Iterator[StubOllamaServer]:
+    """Start the stub Ollama server and swap the graph's search functions for fakes."""
+    with ExitStack() as stack:
+        server = stack.enter_context(StubOllamaServer(settings))
+        for provider in SearchAPI:
+            search, asearch = fake_search_backend(provider.value, settings)
+            stack.enter_context(mock.patch.object(research_graph, f"{provider.value}_search", search))
+            stack.enter_context(mock.patch.object(research_graph, f"a{provider.value}_search", asearch))
+        # Environment variables take precedence over the configurable, so drop
+        # the ones that would point the benchmark at real services
+        stack.enter_context(mock.patch.dict(os.environ))
+        for name in ("OLLAMA_BASE_URL", "LOCAL_LLM", "PLANNER_LLM", "WRITER_LLM", "SEARCH_API", "SEARCH_FANOUT", "MAX_WEB_RESEARCH_LOOPS",
+                     "EARLY_STOPPING", "PIPELINED_RESEARCH", "SEARCH_CACHE_ENABLED", "LLM_CACHE_ENABLED", "RESEARCH_STORE_ENABLED", "SUMMARY_STRATEGY",
+                     "OLLAMA_MAX_CONCURRENCY", "LANGSMITH_TRACING", "METRICS_PATH"):
+            os.environ.pop(name, None)
+        # Keep the generated pages out of the user's content store
+        os.environ["CONTENT_STORE_PATH"] = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "content.sqlite")
+        yield server
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = (len(ordered) - 1) * q
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(sum(values) / len(values), 6) if values else 0.0,
+        "p50": round(_percentile(values, 0.5), 6),
+        "p95": round(_percentile(values, 0.95), 6),
+        "max": round(max(values), 6) if values else 0.0
+    }
+
+def _run_session(index: int, base_url: str, settings: BenchmarkSettings) -> Dict[str, Any]:
+    config = {"configurable": {
+        "ollama_base_url": base_url,
+        "local_llm": "benchmark",
+        "search_api": settings.search_api,
+        "search_fanout": settings.search_fanout,
+        "summary_strategy": settings.summary_strategy,
+        "ollama_max_concurrency": settings.ollama_max_concurrency,
+        "pipelined_research": settings.pipelined_research,
+        "max_web_research_loops": settings.loops,
+        # Every session runs all loops, so levels stay comparable
+        "early_stopping": False,
+        "search_cache_enabled": False
+    }}
+    with collect_metrics(f"benchmark-{index}") as metrics:
+        research_graph.get_graph().invoke({"research_topic": f"benchmark topic {index}"}, config)
+    events = list(metrics.events)
+    return {
+        "wall_seconds": metrics.summary()["wall_seconds"],
+        "events": events,
+        # One summarization call per loop, in loop order
+        "prompt_tokens_per_loop": [
+            event.get("prompt_tokens") or 0 for event in events
+            if event["kind"] == "llm" and event["name"] == "summarize_sources"
+        ]
+    }
+
+def run_level(concurrency: int, base_url: str, settings: BenchmarkSettings) -> Dict[str, Any]:
+    """Run ``settings.sessions`` sessions with at most ``concurrency`` at once."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="benchmark") as executor:
+        sessions = list(executor.map(lambda i: _run_session(i, base_url, settings), range(settings.sessions)))
+    elapsed = time.perf_counter() - started
+
+    stages: Dict[str, List[float]] = {}
+    for session in sessions:
+        for event in session["events"]:
+            stages.setdefault(f"{event['kind']}:{event['name']}", []).append(event["seconds"])
+    loops = max((len(session["prompt_tokens_per_loop"]) for session in sessions), default=0)
+    prompt_tokens_per_loop = []
+    for loop in range(loops):
+        sizes = [session["prompt_tokens_per_loop"][loop] for session in sessions if loop < len(session["prompt_tokens_per_loop"])]
+        prompt_tokens_per_loop.append(round(sum(sizes) / len(sizes), 1))
+
+    return {
+        "concurrency": concurrency,
+        "sessions": len(sessions),
+        "elapsed_seconds": round(elapsed, 6),
+        "sessions_per_minute": round(len(sessions) / elapsed * 60, 3),
+        "session_seconds": _distribution([session["wall_seconds"] for session in sessions]),
+        "stage_seconds": {name: _distribution(values) for name, values in sorted(stages.items())},
+        "summary_prompt_tokens_per_loop": prompt_tokens_per_loop
+    }
+
+def run_benchmark(settings: BenchmarkSettings) -> Dict[str, Any]:
+    """Run every concurrency level of the benchmark against the stubs."""
+    with stubbed_environment(settings) as server:
+        # Warm up imports, clients and connection pools outside the measurement
+        _run_session(-1, server.base_url, BenchmarkSettings(**{**asdict(settings), "loops": 1}))
+        levels = [run_level(concurrency, server.base_url, settings) for concurrency in settings.concurrency]
+    return {"settings": asdict(settings), "levels": levels}
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Describe where `report` is more than `tolerance` (a fraction) worse than `baseline`."""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        previous = baseline_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+        concurrency = level["concurrency"]
+        if level["sessions_per_minute"] < previous["sessions_per_minute"] * (1 - tolerance):
+            regressions.append(
+                f"concurrency {concurrency}: {level['sessions_per_minute']} sessions/min "
+                f"(baseline {previous['sessions_per_minute']})"
+            )
+        for name, stats in level["stage_seconds"].items():
+            before = previous["stage_seconds"].get(name)
+            if before and stats["p50"] > before["p50"] * (1 + tolerance):
+                regressions.append(f"concurrency {concurrency}: {name} p50 {stats['p50']}s (baseline {before['p50']}s)")
+    return regressions
+
+def _print_report(report: Dict[str, Any]) -> None:
+    for level in report["levels"]:
+        print(
+            f"concurrency {level['concurrency']:>3}: {level['sessions_per_minute']:8.2f} sessions/min, "
+            f"session p50 {level['session_seconds']['p50']:.3f}s p95 {level['session_seconds']['p95']:.3f}s, "
+            f"summary prompt tokens per loop {level['summary_prompt_tokens_per_loop']}",
+            file=sys.stderr
+        )
+        for name, stats in level["stage_seconds"].items():
+            print(f"    {name:<28} p50 {stats['p50']:.4f}s  p95 {stats['p95']:.4f}s", file=sys.stderr)
+
+def main():
+    defaults = BenchmarkSettings()
+    parser = argparse.ArgumentParser(description="Benchmark the research graph against stubbed Ollama and search providers")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=defaults.concurrency, help="Concurrency levels to measure")
+    parser.add_argument('--sessions', type=int, default=defaults.sessions, help="Sessions per concurrency level")
+    parser.add_argument('--loops', type=int, default=defaults.loops, help="Research loops per session")
+    parser.add_argument('--search-api', choices=[api.value for api in SearchAPI], default=defaults.search_api)
+    parser.add_argument('--search-fanout', type=int, default=defaults.search_fanout)
+    parser.add_argument('--search-latency', type=float, default=defaults.search_latency, help="Seconds per search call")
+    parser.add_argument('--results-per-query', type=int, default=defaults.results_per_query)
+    parser.add_argument('--payload-bytes', type=int, default=defaults.payload_bytes, help="Raw content size per search result")
+    parser.add_argument('--llm-latency', type=float, default=defaults.llm_latency, help="Seconds before the first token")
+    parser.add_argument('--prompt-token-latency', type=float, default=defaults.prompt_token_latency, help="Prefill seconds per prompt token")
+    parser.add_argument('--token-latency', type=float, default=defaults.token_latency, help="Seconds per generated token")
+    parser.add_argument('--summary-words', type=int, default=defaults.summary_words)
+    parser.add_argument('--summary-strategy', choices=['rewrite', 'incremental'], default=defaults.summary_strategy)
+    parser.add_argument('--ollama-max-concurrency', type=int, default=defaults.ollama_max_concurrency, help="In-flight Ollama requests")
+    parser.add_argument('--pipelined-research', action='store_true', help="Prefetch the next loop's searches while summarizing")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write the report to PATH as the new baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="Compare against a saved baseline; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Allowed slowdown against the baseline (fraction)")
+    args = parser.parse_args()
+
+    settings = BenchmarkSettings(**{
+        name: getattr(args, name) for name in BenchmarkSettings.__dataclass_fields__ if hasattr(args, name)
+    })
+    report = run_benchmark(settings)
+    _print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    print(json.dumps(report), flush=True)
+    if regressions:
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
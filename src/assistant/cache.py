@@ -0,0 +1,326 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different spellings share a cache entry."""
+    return " ".join(query.lower().split())
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite database (in WAL mode) shared between the threads of one process."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+# Rows read per step when evicting, oldest first through the last_access index
+_EVICTION_BATCH = 64
+
+def _table_size(conn: sqlite3.Connection, table: str) -> int:
+    """Return the total size of the entries of `table`, read once when a store opens."""
+    return conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+def _stored_size(conn: sqlite3.Connection, table: str, key: str) -> int:
+    """Return the size of the entry a write to `key` replaces, 0 if there is none."""
+    row = conn.execute(f"SELECT size FROM {table} WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+def _evict_to_size(conn: sqlite3.Connection, table: str, total: int, max_bytes: int) -> tuple:
+    """Delete the least recently used rows of `table` until its entries, `total` bytes in all, fit in `max_bytes`.
+
+    Only the oldest rows are read, a batch at a time, so a write that stays
+    under the cap costs nothing here.
+
+    Returns:
+        tuple: The new total size and the number of rows evicted
+    """
+    evicted = 0
+    while total > max_bytes:
+        rows = conn.execute(
+            f"SELECT key, size FROM {table} ORDER BY last_access ASC LIMIT ?", (_EVICTION_BATCH,)
+        ).fetchall()
+        if not rows:
+            return 0, evicted
+        keys = []
+        for key, size in rows:
+            if total <= max_bytes:
+                break
+            keys.append((key,))
+            total -= size
+        conn.executemany(f"DELETE FROM {table} WHERE key = ?", keys)
+        evicted += len(keys)
+    return total, evicted
+
+class SearchCache:
+    """Disk-backed search response cache with TTL expiry and LRU eviction.
+
+    Entries are keyed by provider, normalized query and the request parameters
+    that change the response (e.g. ``max_results`` or ``include_raw_content``).
+    The cache is safe to share between threads of one process.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400, max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY,"
+            " provider TEXT NOT NULL,"
+            " query TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_last_access ON search_cache (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_created_at ON search_cache (created_at)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(provider: str, query: str, **params: Any) -> str:
+        """Return the cache key for a provider, query and request parameters."""
+        material = json.dumps([provider, normalize_query(query), params], sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, provider: str, query: str, **params: Any) -> Optional[Dict[str, Any]]:
+        """Return the cached response, or None on a miss or an expired entry."""
+        key = self.make_key(provider, query, **params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._entries -= 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, provider: str, query: str, response: Dict[str, Any], **params: Any) -> None:
+        """Store a response and evict expired and least recently used entries beyond the size cap."""
+        key = self.make_key(provider, query, **params)
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute("SELECT 1 FROM search_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, provider, query, response, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, normalize_query(query), json.dumps(response), now, now)
+            )
+            self._entries += 0 if replaced else 1
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def configure(self, ttl_seconds: float, max_entries: int) -> None:
+        """Apply a new TTL and entry cap, evicting right away what no longer fits."""
+        with self._lock:
+            if (ttl_seconds, max_entries) == (self.ttl_seconds, self.max_entries):
+                return
+            self.ttl_seconds = ttl_seconds
+            self.max_entries = max_entries
+            self._evict_locked(time.time())
+            self._conn.commit()
+
+    def _evict_locked(self, now: float) -> None:
+        """Delete expired entries, then the least recently used ones beyond max_entries."""
+        self._entries -= self._conn.execute(
+            "DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        if self._entries > self.max_entries:
+            excess = self._entries - self.max_entries
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN"
+                " (SELECT key FROM search_cache ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            self._entries -= excess
+            self.evictions += excess
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and the current number of entries."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": self._entries}
+
+class LLMCache:
+    """Disk-backed cache of chat model replies with LRU eviction by total size.
+
+    Entries are keyed by an opaque request key covering the model, output
+    format, options and messages of a call; only the reply text is stored.
+    Replies are deterministic at temperature 0, so entries do not expire.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+        self._bytes = _table_size(self._conn, "llm_cache")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached reply, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, model: str, response: str) -> None:
+        """Store a reply and evict the least recently used entries beyond the size cap."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._bytes += size - _stored_size(self._conn, "llm_cache", key)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now)
+            )
+            self._bytes, evicted = _evict_to_size(self._conn, "llm_cache", self._bytes, self.max_bytes)
+            self.evictions += evicted
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters, the number of entries and their total size."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": entries, "bytes": self._bytes}
+
+class ContentStore:
+    """Content-addressed, size-bounded store for page text kept out of the graph state.
+
+    Texts are stored zlib-compressed under the SHA-256 of their content, so the
+    state (and every checkpoint of it) only carries the key. Identical pages
+    fetched by different sessions share one entry.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS content ("
+            " key TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS content_last_access ON content (last_access)")
+        self._conn.commit()
+        self._bytes = _table_size(self._conn, "content")
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def put(self, text: str) -> str:
+        """Store `text` and return its key."""
+        key = self.make_key(text)
+        data = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self._bytes += len(data) - _stored_size(self._conn, "content", key)
+            self._conn.execute(
+                "INSERT INTO content (key, data, size, last_access) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET last_access = excluded.last_access",
+                (key, data, len(data), time.time())
+            )
+            self._bytes, _ = _evict_to_size(self._conn, "content", self._bytes, self.max_bytes)
+            self._conn.commit()
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the text stored under `key`, or None if it was evicted."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM content WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE content SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+_caches: Dict[str, SearchCache] = {}
+_caches_lock = threading.Lock()
+
+def get_search_cache(configurable) -> Optional[SearchCache]:
+    """Return the process-wide search cache for a Configuration, or None when caching is disabled."""
+    if not configurable.search_cache_enabled:
+        return None
+    path = os.path.abspath(os.path.expanduser(configurable.search_cache_path))
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = SearchCache(path, configurable.search_cache_ttl, configurable.search_cache_max_entries)
+            _caches[path] = cache
+        else:
+            cache.configure(configurable.search_cache_ttl, configurable.search_cache_max_entries)
+        return cache
+
+_llm_caches: Dict[str, LLMCache] = {}
+
+def get_llm_cache(configurable) -> Optional[LLMCache]:
+    """Return the process-wide LLM response cache for a Configuration, or None when disabled."""
+    if not configurable.llm_cache_enabled:
+        return None
+    path = os.path.abspath(os.path.expanduser(configurable.llm_cache_path))
+    with _caches_lock:
+        cache = _llm_caches.get(path)
+        if cache is None:
+            cache = _llm_caches[path] = LLMCache(path, int(configurable.llm_cache_max_mb * 1024 * 1024))
+        else:
+            cache.max_bytes = int(configurable.llm_cache_max_mb * 1024 * 1024)
+        return cache
+
+_content_stores: Dict[str, ContentStore] = {}
+
+def get_content_store(configurable) -> Optional[ContentStore]:
+    """Return the process-wide content store for a Configuration, or None when disabled."""
+    if not configurable.content_store_enabled:
+        return None
+    path = os.path.abspath(os.path.expanduser(configurable.content_store_path))
+    with _caches_lock:
+        store = _content_stores.get(path)
+        if store is None:
+            store = _content_stores[path] = ContentStore(path, int(configurable.content_store_max_mb * 1024 * 1024))
+        else:
+            store.max_bytes = int(configurable.content_store_max_mb * 1024 * 1024)
+        return store
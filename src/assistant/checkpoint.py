@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from assistant.graph import get_builder
+
+# Types of the research state that checkpoints may restore
+_STATE_TYPES = [("assistant.state", "SourceRecord")]
+
+_lock = threading.Lock()
+
+def _serializer() -> JsonPlusSerializer:
+    try:
+        return JsonPlusSerializer(allowed_msgpack_modules=_STATE_TYPES)
+    except TypeError:
+        # Releases without the allowlist restore any type
+        return JsonPlusSerializer()
+
+_graphs: Dict[str, object] = {}
+
+def get_checkpointer(path: str) -> SqliteSaver:
+    """Open a SQLite checkpointer at `path`, creating the directory if needed."""
+    path = os.path.abspath(os.path.expanduser(path))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # SqliteSaver serializes access with its own lock, so worker threads can share it
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSaver(conn, serde=_serializer())
+
+def get_checkpointed_graph(path: str):
+    """Return the research graph compiled with a durable checkpointer at `path`.
+
+    Runs must pass a ``thread_id`` in ``config["configurable"]``; invoking the
+    graph with ``None`` input and the same ``thread_id`` resumes after the last
+    completed node.
+    """
+    key = os.path.abspath(os.path.expanduser(path))
+    with _lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = _graphs[key] = get_builder().compile(checkpointer=get_checkpointer(key))
+        return graph
+
+def delete_session(path: str, session_id: str) -> None:
+    """Delete every checkpoint of a research session from the database at `path`."""
+    get_checkpointed_graph(path).checkpointer.delete_thread(session_id)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import socket
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Union
+
+import httpcore
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from assistant import deadline
+
+# The Ollama and search provider SDKs are imported by the factories that need
+# them: a run only uses one provider, and their import cost would otherwise
+# sit on every process start
+if TYPE_CHECKING:
+    from langchain_ollama import ChatOllama
+    from tavily import AsyncTavilyClient, TavilyClient
+
+DEFAULT_POOL_SIZE = 10
+
+_lock = threading.Lock()
+_clients: Dict[Hashable, Any] = {}
+# Async connection pools are bound to the event loop that first used them, so
+# clients created inside a running loop are registered per loop
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = weakref.WeakKeyDictionary()
+
+def _shared(key: Hashable, factory: Callable[[], Any], loop_scoped: bool = False) -> Any:
+    """Return the client registered under `key`, creating it with `factory` on first use."""
+    loop = None
+    if loop_scoped:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+    with _lock:
+        registry = _clients if loop is None else _loop_clients.setdefault(loop, {})
+        client = registry.get(key)
+        if client is None:
+            client = registry[key] = factory()
+        return client
+
+def _httpx_limits(pool_size: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+
+def _mount_pool(session: requests.Session, pool_size: int) -> requests.Session:
+    """Mount keep-alive adapters sized to `pool_size` on a requests session."""
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class _DeadlineStream(httpcore.NetworkStream):
+    """A connection whose blocking reads end by the deadline of the calling session, or when it is cancelled."""
+
+    def __init__(self, stream: httpcore.NetworkStream):
+        self._stream = stream
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        left = deadline.remaining()
+        if left is not None:
+            timeout = max(0.0, left) if timeout is None else min(timeout, max(0.0, left))
+        scope = deadline.current()
+        remove = scope.on_cancel(self._abort) if scope is not None else (lambda: None)
+        try:
+            return self._stream.read(max_bytes, timeout)
+        finally:
+            remove()
+
+    def _abort(self) -> None:
+        # Runs in the cancelling thread: shutting the socket down wakes the blocked read
+        sock = self._stream.get_extra_info("socket")
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname: Optional[str] = None, timeout: Optional[float] = None) -> httpcore.NetworkStream:
+        return _DeadlineStream(self._stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info: str) -> Any:
+        return self._stream.get_extra_info(info)
+
+class _DeadlineBackend(httpcore.NetworkBackend):
+    def __init__(self):
+        self._backend = httpcore.SyncBackend()
+
+    def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None, local_address: Optional[str] = None, socket_options=None) -> httpcore.NetworkStream:
+        return _DeadlineStream(self._backend.connect_tcp(host, port, timeout, local_address, socket_options))
+
+    def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options=None) -> httpcore.NetworkStream:
+        return _DeadlineStream(self._backend.connect_unix_socket(path, timeout, socket_options))
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+class _DeadlineTransport(httpx.HTTPTransport):
+    """Pooled transport for long blocking calls (Ollama): a cancelled session
+    closes its connection, even while the server is still reading the prompt
+    and has sent nothing, and no read outlasts the session's deadline."""
+
+    def __init__(self, limits: httpx.Limits):
+        super().__init__(limits=limits)
+        self._pool = httpcore.ConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=_DeadlineBackend()
+        )
+
+def get_http_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Return the shared, connection-pooled requests session."""
+    return _shared(("requests", pool_size), lambda: _mount_pool(requests.Session(), pool_size))
+
+def get_async_http_client(pool_size: int = DEFAULT_POOL_SIZE) -> httpx.AsyncClient:
+    """Return the connection-pooled httpx client for the running event loop."""
+    return _shared(
+        ("httpx", pool_size),
+        lambda: httpx.AsyncClient(limits=_httpx_limits(pool_size)),
+        loop_scoped=True
+    )
+
+def get_tavily_client(api_key: str, pool_size: int = DEFAULT_POOL_SIZE) -> "TavilyClient":
+    """Return the shared Tavily client for an API key."""
+    def _create():
+        from tavily import TavilyClient
+        client = TavilyClient(api_key=api_key)
+        _mount_pool(client.session, pool_size)
+        return client
+    return _shared(("tavily", api_key, pool_size), _create)
+
+def get_async_tavily_client(api_key: str, pool_size: int = DEFAULT_POOL_SIZE) -> "AsyncTavilyClient":
+    """Return the async Tavily client for an API key and the running event loop."""
+    def _create():
+        from tavily import AsyncTavilyClient
+        # Tavily sets its auth headers on the httpx client, so it gets a dedicated one
+        return AsyncTavilyClient(api_key=api_key, client=httpx.AsyncClient(limits=_httpx_limits(pool_size)))
+    return _shared(("atavily", api_key, pool_size), _create, loop_scoped=True)
+
+def get_chat_model(base_url: str, model: str, json_mode: bool = False, pool_size: int = DEFAULT_POOL_SIZE, keep_alive: Optional[Union[str, int]] = None, num_ctx: Optional[int] = None, num_predict: Optional[int] = None, timeout: Optional[float] = None, schema: Optional[str] = None) -> "ChatOllama":
+    """Return the shared ChatOllama instance for a base URL, model, output format and options.
+
+    `timeout` (seconds) bounds connecting to Ollama and each wait for the next
+    chunk of a reply; sync calls also end by the deadline of their session or
+    as soon as it is cancelled, even before the first chunk. `schema` (a JSON schema, serialized) constrains JSON
+    replies to that shape instead of any JSON.
+    """
+    def _create():
+        from langchain_ollama import ChatOllama
+        kwargs = {"format": json.loads(schema) if schema else "json"} if json_mode else {}
+        return ChatOllama(
+            model=model,
+            temperature=0,
+            base_url=base_url,
+            keep_alive=keep_alive,
+            num_ctx=num_ctx,
+            num_predict=num_predict,
+            client_kwargs={"limits": _httpx_limits(pool_size), "timeout": timeout},
+            # Async calls stop through task cancellation; sync ones need the transport
+            sync_client_kwargs={"transport": _DeadlineTransport(_httpx_limits(pool_size))},
+            **kwargs
+        )
+    key = ("ollama", base_url, model, json_mode, pool_size, keep_alive, num_ctx, num_predict, timeout, schema)
+    return _shared(key, _create, loop_scoped=True)
+
+def close_clients() -> None:
+    """Close pooled sync sessions and forget every registered client."""
+    with _lock:
+        for client in _clients.values():
+            session = client if isinstance(client, requests.Session) else getattr(client, "session", None)
+            if isinstance(session, requests.Session):
+                session.close()
+        _clients.clear()
+        _loop_clients.clear()
@@ -1,9 +1,8 @@
 import os
 from dataclasses import dataclass, fields
-from typing import Any, Optional, Union
+from typing import Any, Optional
 
 from langchain_core.runnables import RunnableConfig
-from dataclasses import dataclass
 
 from enum import Enum
 
@@ -21,6 +20,146 @@ class Configuration:
     ollama_base_url: str = "http://localhost:11434"  # Add Ollama base URL
     search_api: SearchAPI = SearchAPI.PERPLEXITY  # Default to PERPLEXITY
     
+    # Model roles, both defaulting to local_llm: the planner writes the short
+    # JSON search queries and reflections, the writer summarizes. With a
+    # positive writer_latency_budget (seconds), summarization switches to the
+    # planner for writer_fallback_cooldown seconds whenever the writer's
+    # moving-average call latency exceeds the budget
+    planner_llm: Optional[str] = None
+    writer_llm: Optional[str] = None
+    writer_latency_budget: float = 0.0
+    writer_fallback_cooldown: float = 300.0
+    
+    # Search fan-out: number of queries searched per loop, how many run at once
+    # and the per-call timeout in seconds
+    search_fanout: int = 1
+    search_concurrency: int = 4
+    search_timeout: float = 60.0
+    
+    # Prompt token budget for each summarization call (as Ollama counts them:
+    # the estimate is calibrated per model from the prompt_eval_count of earlier
+    # calls), the share of it reserved for the existing summary, and the raw
+    # content cap per source. Raw content is split into passages of about
+    # `passage_tokens`, and the `passages_per_source` that best match the topic
+    # and search query (BM25) are sent instead of the start of the page; 0 sends
+    # the start of the page
+    context_token_budget: int = 6000
+    summary_token_share: float = 0.4
+    max_tokens_per_source: int = 1000
+    passage_tokens: int = 120
+    passages_per_source: int = 6
+    
+    # Summarization strategy: "rewrite" regenerates the running summary every
+    # loop; "incremental" writes a delta note of at most `delta_note_words` per
+    # loop (one per source, `note_concurrency` at a time, with
+    # `notes_per_source`) and merges the notes once when research ends
+    summary_strategy: str = "rewrite"
+    delta_note_words: int = 150
+    notes_per_source: bool = False
+    note_concurrency: int = 4
+    
+    # Skip pages already processed in an earlier loop (same canonical URL,
+    # same content, or MinHash similarity at or above the threshold)
+    dedupe_across_loops: bool = True
+    near_duplicate_threshold: float = 0.85
+    
+    # Content-addressed store for the page text of the latest sources, which the
+    # graph state (and its checkpoints) reference by hash instead of holding.
+    # Disabled, the page text is kept in the state and nothing is written to disk.
+    # A resumed session whose pages were evicted since summarizes their snippets
+    content_store_enabled: bool = False
+    content_store_path: str = "~/.cache/ollama-deep-researcher/content.sqlite"
+    content_store_max_mb: float = 200.0  # Least recently used pages are evicted beyond this size
+    
+    # Persistent research store of finished summaries and fetched page passages,
+    # searched with SQLite full-text search (BM25). A new run whose topic shares
+    # at least `summary_match_threshold` (0-1) of its terms with a stored topic
+    # younger than `summary_max_age` seconds is answered with that summary.
+    # `local_passages` adds the `local_passages_k` best stored passages per
+    # query to each loop's search results ("augment"), skips the web search
+    # when enough of them cover the query ("prefer"), or does neither ("off")
+    research_store_enabled: bool = False
+    research_store_path: str = "~/.cache/ollama-deep-researcher/research.sqlite"
+    research_store_max_passages: int = 100000  # Oldest passages are evicted beyond this count
+    summary_reuse: bool = True
+    summary_match_threshold: float = 0.8
+    summary_max_age: float = 604800.0
+    local_passages: str = "augment"
+    local_passages_k: int = 3
+    
+    # Pipelined research: while the summarizer writes loop N, the follow-up
+    # queries of loop N+1 are written from the summary so far plus the new
+    # sources and their searches prefetched; reflection is then skipped
+    pipelined_research: bool = False
+    
+    # Deadlines: the LLM calls and searches of a graph node are given up on
+    # `node_timeout` seconds after the node started, and a session stops after
+    # `research_timeout` seconds (0 for no limit), finalizing the summary so far
+    node_timeout: float = 600.0
+    research_timeout: float = 0.0
+    
+    # SQLite database holding checkpoints of research sessions run with a session
+    # id. A session's checkpoints are deleted once it finishes, so only failed
+    # runs (the ones worth resuming) stay, unless keep_finished_sessions is set
+    checkpoint_path: str = "~/.cache/ollama-deep-researcher/checkpoints.sqlite"
+    keep_finished_sessions: bool = False
+    
+    # Early stopping (opt-in): end research once `convergence_patience`
+    # consecutive loops each changed the summary by less than
+    # `convergence_threshold` (0-1), but never before `min_web_research_loops` loops
+    early_stopping: bool = False
+    convergence_threshold: float = 0.1
+    convergence_patience: int = 1
+    min_web_research_loops: int = 2
+    
+    # Metrics export after each session: "jsonl" appends the session's events to
+    # `metrics_path`, "prometheus" rewrites it with the process-wide totals
+    metrics_path: Optional[str] = None
+    metrics_format: str = "jsonl"
+    
+    # Search provider rate limits (requests per second, 0 for unlimited) shared
+    # by all sessions of a process, with a burst allowance; 429s, 5xx responses
+    # and connection errors are retried with jittered exponential backoff,
+    # honoring Retry-After (a retry that would start past the deadline fails fast)
+    tavily_rate_limit: float = 2.0
+    perplexity_rate_limit: float = 0.8
+    exa_rate_limit: float = 5.0
+    rate_limit_burst: int = 4
+    search_max_retries: int = 3
+    search_backoff_base: float = 1.0  # Seconds; doubles with every retry
+    search_backoff_max: float = 30.0  # Caps the computed backoff; Retry-After is honored in full
+    
+    # Ollama dispatch: how long a model stays loaded after a call, its context
+    # size (0 fits context_token_budget plus the reply; Ollama reloads a model
+    # whose num_ctx changes, so it is fixed per model), reply caps for JSON and
+    # summary calls (0 for none), the in-flight request cap per base URL, and
+    # per-model overrides as JSON, e.g. {"gemma4:31b": {"num_ctx": 16384}}
+    ollama_keep_alive: str = "30m"
+    ollama_num_ctx: int = 0
+    json_num_predict: int = 1024
+    summary_num_predict: int = 0
+    ollama_max_concurrency: int = 4
+    ollama_model_options: Optional[str] = None
+    
+    # Constrain query and reflection replies to their JSON schemas (Ollama 0.5
+    # or later); off asks for any JSON. Near-valid replies are repaired either way
+    json_schema_output: bool = True
+    
+    # Connection pool size for the shared Ollama and search clients
+    http_pool_size: int = 10
+    
+    # Persistent search result cache
+    search_cache_enabled: bool = False
+    search_cache_path: str = "~/.cache/ollama-deep-researcher/search_cache.sqlite"
+    search_cache_ttl: float = 86400.0  # Seconds before a cached response expires
+    search_cache_max_entries: int = 10000
+    
+    # Persistent LLM response cache, keyed by model, format, options and
+    # messages, so reruns and resumed sessions reuse earlier replies
+    llm_cache_enabled: bool = False
+    llm_cache_path: str = "~/.cache/ollama-deep-researcher/llm_cache.sqlite"
+    llm_cache_max_mb: float = 100.0  # Least recently used replies are evicted beyond this size
+    
     # API Keys
     tavily_api_key: Optional[str] = None
     perplexity_api_key: Optional[str] = None
@@ -48,10 +187,19 @@ class Configuration:
             if f.init
         }
         
-        # Handle boolean conversion for langsmith_tracing
-        if "langsmith_tracing" in values:
-            if isinstance(values["langsmith_tracing"], str):
-                values["langsmith_tracing"] = values["langsmith_tracing"].lower() == "true"
+        # Handle boolean conversion for values read from the environment
+        for f in fields(cls):
+            if f.type is bool and isinstance(values.get(f.name), str):
+                values[f.name] = values[f.name].lower() == "true"
+        
+        # Handle numeric conversion for values read from the environment
+        for f in fields(cls):
+            if f.type in (int, float) and isinstance(values.get(f.name), str):
+                try:
+                    values[f.name] = f.type(values[f.name])
+                except ValueError:
+                    # If invalid value, remove it to use default
+                    del values[f.name]
         
         # Handle search_api conversion from string to enum
         if "search_api" in values:
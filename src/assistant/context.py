@@ -0,0 +1,278 @@
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Word pieces, single digits and individual punctuation marks, which is roughly
+# how the SentencePiece/BPE vocabularies of Ollama models split English text
+_TOKEN_PIECES = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+_WORDS = re.compile(r"\w+")
+# Long words are split into several sub-word tokens. A starting point only:
+# vocabularies differ, so budgets are scaled by each model's calibrated ratio
+_CHARS_PER_SUBWORD = 6
+_SENTENCE_END = re.compile(r"(?<=[.!?])(\s+)")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when "
+    "where which who why will with about into than then there these those their".split()
+)
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in `text`.
+
+    Counts word pieces instead of dividing characters by four, so code, numbers
+    and punctuation-heavy pages are not badly underestimated.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        tokens += math.ceil(len(piece) / _CHARS_PER_SUBWORD) if piece[0].isalpha() else 1
+    return tokens
+
+# Prompt tokens Ollama counted (prompt_eval_count) per estimated token, per
+# model, as a running average over the calls seen by this process
+_ratios: Dict[str, float] = {}
+_ratios_lock = threading.Lock()
+_CALIBRATION_WEIGHT = 0.2  # Weight of the latest call in the running ratio
+_CALIBRATION_MIN_TOKENS = 200  # Shorter prompts are dominated by the chat template
+# Ratios outside this range are not estimation error but, e.g., a prompt
+# Ollama partly reused from its KV cache and did not count again
+_CALIBRATION_RANGE = (0.5, 2.0)
+
+def calibrate_tokens(model: str, estimated: int, actual: Optional[int]) -> None:
+    """Update the ratio of `model` from a call whose prompt was estimated at
+    `estimated` tokens and counted as `actual` by Ollama."""
+    if not actual or estimated < _CALIBRATION_MIN_TOKENS:
+        return
+    ratio = actual / estimated
+    if not _CALIBRATION_RANGE[0] <= ratio <= _CALIBRATION_RANGE[1]:
+        return
+    with _ratios_lock:
+        previous = _ratios.get(model)
+        _ratios[model] = ratio if previous is None else previous + _CALIBRATION_WEIGHT * (ratio - previous)
+
+def token_ratio(model: str) -> float:
+    """Ollama's token count per estimated token for `model`; 1.0 until calibrated."""
+    with _ratios_lock:
+        return _ratios.get(model, 1.0)
+
+def calibrated_budget(model: str, token_budget: int) -> int:
+    """The number of estimated tokens that `model` counts as `token_budget` tokens."""
+    return max(1, int(token_budget / token_ratio(model)))
+
+def trim_to_tokens(text: str, max_tokens: int, marker: str = "... [truncated]") -> str:
+    """Trim `text` to at most `max_tokens` estimated tokens, preferring a sentence boundary."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_tokens -= estimate_tokens(marker)
+
+    # Keep whole sentences while they fit, with their original separators
+    parts = _SENTENCE_END.split(text)
+    kept, used = [], 0
+    for i in range(0, len(parts), 2):
+        cost = estimate_tokens(parts[i])
+        if used + cost > max_tokens:
+            break
+        if i:
+            kept.append(parts[i - 1])
+        kept.append(parts[i])
+        used += cost
+    if kept:
+        return "".join(kept) + marker
+
+    # A single sentence is longer than the budget: cut on a word boundary
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + marker
+
+def split_passages(text: str, max_tokens: int) -> List[str]:
+    """Split `text` into passages of whole sentences of at most `max_tokens` estimated tokens.
+
+    Sentences longer than the budget are cut on word boundaries into passages
+    of their own.
+    """
+    passages, current, used = [], [], 0
+    for sentence in _SENTENCE_END.split(text)[::2]:
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        cost = estimate_tokens(sentence)
+        if current and used + cost > max_tokens:
+            passages.append(" ".join(current))
+            current, used = [], 0
+        if cost <= max_tokens:
+            current.append(sentence)
+            used += cost
+            continue
+        words, piece, piece_tokens = sentence.split(" "), [], 0
+        for word in words:
+            word_tokens = estimate_tokens(word) + 1
+            if piece and piece_tokens + word_tokens > max_tokens:
+                passages.append(" ".join(piece))
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            passages.append(" ".join(piece))
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+def query_terms(text: str) -> List[str]:
+    """Lower-cased content words of a topic or query."""
+    return [word for word in _WORDS.findall(text.lower()) if word not in _STOPWORDS and len(word) > 1]
+
+def relevance(text: str, terms: List[str]) -> float:
+    """Share of the query terms that occur in `text`, weighted by how often they occur."""
+    if not terms or not text:
+        return 0.0
+    words = _WORDS.findall(text.lower())
+    if not words:
+        return 0.0
+    counts: Dict[str, int] = {}
+    for word in words:
+        counts[word] = counts.get(word, 0) + 1
+    matched = [term for term in set(terms) if term in counts]
+    coverage = len(matched) / len(set(terms))
+    density = sum(counts[term] for term in matched) / len(words)
+    return coverage + density
+
+def bm25_scores(passages: List[str], terms: List[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of each passage for the query terms, with IDF over `passages`."""
+    terms = set(terms)
+    if not passages or not terms:
+        return [0.0] * len(passages)
+    counts, lengths = [], []
+    for passage in passages:
+        words = _WORDS.findall(passage.lower())
+        tf: Dict[str, int] = {}
+        for word in words:
+            if word in terms:
+                tf[word] = tf.get(word, 0) + 1
+        counts.append(tf)
+        lengths.append(len(words))
+    average_length = sum(lengths) / len(lengths) or 1.0
+    idf = {}
+    for term in terms:
+        df = sum(term in tf for tf in counts)
+        idf[term] = math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+    return [
+        sum(idf[term] * n * (k1 + 1) / (n + k1 * (1 - b + b * length / average_length)) for term, n in tf.items())
+        for tf, length in zip(counts, lengths)
+    ]
+
+def select_passages(passages: List[Tuple[str, float]], max_tokens: int, limit: int) -> str:
+    """Join the `limit` best scoring passages that fit in `max_tokens`, in document order.
+
+    Args:
+        passages: (passage, score) pairs in document order
+
+    Returns:
+        str: The selected passages separated by elision marks, or "" when no
+            passage matches the query
+    """
+    chosen, used = [], 0
+    for index in sorted(range(len(passages)), key=lambda i: passages[i][1], reverse=True):
+        if len(chosen) == limit or passages[index][1] <= 0:
+            break
+        cost = estimate_tokens(passages[index][0])
+        if used + cost <= max_tokens:
+            chosen.append(index)
+            used += cost
+    return " [...] ".join(passages[index][0] for index in sorted(chosen))
+
+def format_source(source: Dict[str, Any], raw_content_tokens: int = 0, passages: str = "") -> str:
+    """Format one source the way deduplicate_and_format_sources does.
+
+    With `passages`, those stand in for the leading `raw_content_tokens` of the
+    raw content.
+    """
+    text = f"Source {source['title']}:\n===\n"
+    text += f"URL: {source['url']}\n===\n"
+    text += f"Most relevant content from source: {source['content']}\n===\n"
+    if raw_content_tokens > 0 and passages:
+        text += f"Most relevant passages of the full source, limited to {raw_content_tokens} tokens: {passages}\n\n"
+    elif raw_content_tokens > 0 and source.get('raw_content'):
+        text += f"Full source content limited to {raw_content_tokens} tokens: {trim_to_tokens(source['raw_content'], raw_content_tokens)}\n\n"
+    return text
+
+def build_sources_context(research_topic: str, sources: List[Dict[str, Any]], token_budget: int, max_tokens_per_source: int, search_query: str = "", passage_tokens: int = 0, passages_per_source: int = 0) -> str:
+    """Format the most relevant sources so the result fits in `token_budget` tokens.
+
+    Sources are ranked by relevance to the research topic. Each kept source
+    contributes its snippet plus as much raw content as its share of the
+    remaining budget allows, capped at `max_tokens_per_source`. With
+    `passages_per_source`, that raw content is the source's best passages of
+    about `passage_tokens` tokens by BM25 against the topic and `search_query`
+    instead of the start of the page.
+    """
+    unique_sources = {}
+    for source in sources:
+        unique_sources.setdefault(source['url'], source)
+
+    terms = query_terms(research_topic)
+    ranked = sorted(
+        unique_sources.values(),
+        key=lambda source: relevance(f"{source.get('title', '')} {source.get('content', '')} {source.get('raw_content') or ''}", terms),
+        reverse=True
+    )
+
+    # First pass: snippets of the most relevant sources that fit
+    header = "Sources:\n\n"
+    remaining = token_budget - estimate_tokens(header)
+    kept = []
+    for source in ranked:
+        cost = estimate_tokens(format_source(source))
+        if cost > remaining:
+            continue
+        kept.append(source)
+        remaining -= cost
+
+    # Score the passages of all kept pages together, so words every page uses weigh little
+    scored: Dict[int, List[Tuple[str, float]]] = {}
+    passage_terms = query_terms(f"{research_topic} {search_query}")
+    if passages_per_source > 0 and passage_terms:
+        for i, source in enumerate(kept):
+            if source.get('raw_content'):
+                scored[i] = [(passage, 0.0) for passage in split_passages(source['raw_content'], max(1, passage_tokens))]
+        scores = iter(bm25_scores([passage for passages in scored.values() for passage, _ in passages], passage_terms))
+        for i, passages in scored.items():
+            scored[i] = [(passage, next(scores)) for passage, _ in passages]
+
+    # Second pass: share what is left of the budget as raw content, best sources first
+    formatted = []
+    for i, source in enumerate(kept):
+        raw_tokens = 0
+        if source.get('raw_content') and remaining > 0:
+            raw_tokens = min(max_tokens_per_source, remaining // (len(kept) - i))
+        # Pages without a matching passage fall back to their leading text
+        passages = select_passages(scored[i], raw_tokens, passages_per_source) if i in scored and raw_tokens > 0 else ""
+        formatted.append(format_source(source, raw_tokens, passages))
+        remaining -= estimate_tokens(formatted[-1]) - estimate_tokens(format_source(source))
+    return (header + "".join(formatted)).strip()
+
+def build_summary_context(research_topic: str, existing_summary: str, sources: List[Dict[str, Any]], token_budget: int, summary_share: float, max_tokens_per_source: int, search_query: str = "", passage_tokens: int = 0, passages_per_source: int = 0) -> Tuple[str, str]:
+    """Split a per-call token budget between the running summary and new sources.
+
+    The summary is guaranteed `summary_share` of the budget (and keeps more if
+    the sources do not need it); sources get the rest, formatted by
+    build_sources_context.
+
+    Returns:
+        tuple: (existing summary, formatted sources), each trimmed to its share
+    """
+    summary_tokens = estimate_tokens(existing_summary or "")
+    summary_allowance = int(token_budget * summary_share)
+    sources_budget = token_budget - min(summary_tokens, summary_allowance)
+    sources_text = build_sources_context(research_topic, sources, sources_budget, max_tokens_per_source, search_query, passage_tokens, passages_per_source)
+    summary_budget = token_budget - estimate_tokens(sources_text)
+    return trim_to_tokens(existing_summary or "", summary_budget), sources_text
@@ -0,0 +1,257 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+class ResearchCancelled(Exception):
+    """The research session was cancelled by its caller."""
+
+class DeadlineExceeded(TimeoutError):
+    """A call ran past the deadline of its node or research session."""
+
+class Deadline:
+    """Cancellation scope of a research session, with an optional time limit.
+
+    Scopes nest: a scope is cancelled with its parent and expires no later
+    than it. Cancellation is cooperative: `check` raises once the scope is
+    cancelled or expired, `acall`, `wait` and `sleep` stop waiting right away, and
+    blocking calls are bounded by their `client_timeout`.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["Deadline"] = None):
+        self.expires = time.monotonic() + seconds if seconds and seconds > 0 else None
+        self.parent = parent
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self._detach = parent.on_cancel(lambda: self.cancel(parent.reason)) if parent is not None else None
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run `callback` when the scope is cancelled (right away if it already is); returns a remover."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self, reason: Optional[str] = None) -> None:
+        """Cancel the scope and every scope nested in it.
+
+        A failing callback is reported and does not keep the others from running.
+        """
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason or "cancelled"
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Warning: cancellation callback failed: {e!r}", file=sys.stderr)
+
+    def close(self) -> None:
+        """Stop following the parent's cancellation."""
+        if self._detach is not None:
+            self._detach()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before this scope or a parent expires, or None without a time limit."""
+        limits = []
+        scope = self
+        while scope is not None:
+            if scope.expires is not None:
+                limits.append(scope.expires - time.monotonic())
+            scope = scope.parent
+        return min(limits) if limits else None
+
+    def stop_reason(self) -> Optional[str]:
+        """"cancelled" (or the reason given to cancel), "deadline" once expired, else None."""
+        if self.reason is not None:
+            return self.reason
+        remaining = self.remaining()
+        return "deadline" if remaining is not None and remaining <= 0 else None
+
+    def error(self) -> Optional[BaseException]:
+        """The exception for a call stopped by this scope, or None while it may go on."""
+        reason = self.stop_reason()
+        if reason == "deadline":
+            return DeadlineExceeded("Research deadline reached")
+        if reason is not None:
+            return ResearchCancelled(f"Research {reason}")
+        return None
+
+# Scope of the research session running in the current context, and the
+# monotonic time by which the current graph node must finish. LangGraph copies
+# the context into the threads and tasks that run nodes, like the metrics recorder.
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("research_deadline", default=None)
+_node_expires: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("node_deadline", default=None)
+
+def current() -> Optional[Deadline]:
+    """The scope of the session running in this context, if any."""
+    return _current.get()
+
+@contextmanager
+def scope(deadline: Deadline) -> Iterator[Deadline]:
+    """Run the block inside `deadline`."""
+    token = _current.set(deadline)
+    node_token = _node_expires.set(None)
+    try:
+        yield deadline
+    finally:
+        _node_expires.reset(node_token)
+        _current.reset(token)
+
+@contextmanager
+def session(seconds: Optional[float] = None) -> Iterator[Deadline]:
+    """Run the block in a new scope expiring after `seconds` (None or 0 for no limit), nested in the current one."""
+    deadline = Deadline(seconds, parent=current())
+    try:
+        with scope(deadline):
+            yield deadline
+    finally:
+        deadline.close()
+
+def start_node(seconds: Optional[float]) -> None:
+    """Give the graph node running in this context `seconds` (None or 0 for no limit) to finish."""
+    _node_expires.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+def stop_reason() -> Optional[str]:
+    """Why the current session must stop ("cancelled", "deadline", ...), or None to keep going."""
+    deadline = current()
+    return deadline.stop_reason() if deadline is not None else None
+
+def remaining() -> Optional[float]:
+    """Seconds a call may still take under the node and session deadlines, or None without a limit."""
+    deadline = current()
+    limits = [deadline.remaining()] if deadline is not None else []
+    node_expires = _node_expires.get()
+    if node_expires is not None:
+        limits.append(node_expires - time.monotonic())
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+def check() -> None:
+    """Raise if the session was cancelled or a deadline has passed."""
+    deadline = current()
+    error = deadline.error() if deadline is not None else None
+    if error is not None:
+        raise error
+    timeout = remaining()
+    if timeout is not None and timeout <= 0:
+        raise DeadlineExceeded("Node deadline reached")
+
+def _stopped(deadline: Optional[Deadline], timeout: Optional[float]) -> BaseException:
+    """The exception for a call that stopped waiting, built from the scope itself.
+
+    Safe to call from any thread, e.g. a cancellation callback running in the
+    thread that cancelled the scope rather than in the session's context.
+    """
+    error = deadline.error() if deadline is not None else None
+    if error is not None:
+        return error
+    if timeout is None:
+        return DeadlineExceeded("Call was given up on")
+    return DeadlineExceeded(f"Call did not finish within {timeout:.1f}s")
+
+def client_timeout(timeout: Optional[float] = None) -> Optional[float]:
+    """`timeout` shortened to the time left under the node and session deadlines.
+
+    Blocking clients are given this as their request timeout, so a call ends
+    by the deadline in the thread that made it. Raises when no time is left.
+    """
+    check()
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+def call(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Call `fn` in the calling thread unless the session already stopped or a deadline passed.
+
+    Nothing is abandoned on another thread: `fn` must bound itself, by giving
+    its clients `client_timeout()` or by calling `check()` between steps (the
+    Ollama dispatcher does so between the chunks of a reply, and its wait for
+    a slot ends as soon as the session is cancelled).
+    """
+    check()
+    return fn(*args, **kwargs)
+
+def sleep(seconds: float) -> None:
+    """Sleep for `seconds`, waking as soon as the session is cancelled; then raise if it stopped."""
+    deadline = current()
+    if seconds > 0:
+        woken = threading.Event()
+        remove = deadline.on_cancel(woken.set) if deadline is not None else (lambda: None)
+        try:
+            woken.wait(seconds)
+        finally:
+            remove()
+    check()
+
+def wait(future: "concurrent.futures.Future[T]") -> T:
+    """Wait for `future`, giving up when the node or session deadline passes or the session is cancelled.
+
+    The future's work is left to its owner; only the wait is bounded.
+    """
+    check()
+    deadline = current()
+    timeout = remaining()
+    settled = threading.Event()
+    future.add_done_callback(lambda _: settled.set())
+    remove = deadline.on_cancel(settled.set) if deadline is not None else (lambda: None)
+    try:
+        settled.wait(max(0.0, timeout) if timeout is not None else None)
+    finally:
+        remove()
+    if future.done():
+        return future.result()
+    raise _stopped(deadline, timeout)
+
+async def acall(awaitable: Awaitable[T]) -> T:
+    """Async counterpart of call; an awaitable given up on is cancelled."""
+    deadline = current()
+    timeout = remaining()
+    if deadline is None and timeout is None:
+        return await awaitable
+    try:
+        check()
+    except BaseException:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(awaitable)
+    cancelled = loop.create_future()
+
+    def _signal():
+        if not cancelled.done():
+            cancelled.set_result(None)
+
+    remove = deadline.on_cancel(lambda: loop.call_soon_threadsafe(_signal)) if deadline is not None else (lambda: None)
+    try:
+        done, _ = await asyncio.wait({task, cancelled}, timeout=max(0.0, timeout) if timeout is not None else None, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        task.cancel()
+        raise
+    finally:
+        remove()
+    if task in done:
+        return task.result()
+    task.cancel()
+    # Retrieve the call's outcome so an error it raised first is not reported as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    raise _stopped(deadline, timeout)
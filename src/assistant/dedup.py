@@ -0,0 +1,115 @@
+import hashlib
+import re
+import zlib
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from assistant.context import estimate_tokens
+
+# Query parameters that only track the visit and never change the page
+_TRACKING_PARAMS = frozenset({"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src", "igshid", "yclid"})
+_WORDS = re.compile(r"\w+")
+_SHINGLE_SIZE = 5
+_NUM_PERMUTATIONS = 32
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed (a, b) pairs for the MinHash permutations, derived deterministically so
+# signatures stored in a checkpoint stay comparable across processes
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME)
+    for i in range(_NUM_PERMUTATIONS)
+]
+# Shorter texts (e.g. Perplexity's "See above" citations) are only deduplicated by URL
+MIN_CONTENT_CHARS = 200
+# Near-duplicate pages share their opening, so long pages are only shingled this far
+_MAX_SHINGLE_WORDS = 5000
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so trivially different links to the same page compare equal."""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    scheme = "https" if parts.scheme.lower() in ("http", "https") else parts.scheme.lower()
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+def _normalized_words(text: str) -> List[str]:
+    return _WORDS.findall(text.lower())
+
+def content_hash(text: str) -> str:
+    """Hash of the whitespace- and case-normalized text."""
+    return hashlib.sha1(" ".join(_normalized_words(text)).encode("utf-8")).hexdigest()
+
+def minhash_signature(text: str) -> List[int]:
+    """MinHash signature over word shingles, for near-duplicate detection."""
+    words = _normalized_words(text)[:_MAX_SHINGLE_WORDS]
+    shingles = {
+        zlib.crc32(" ".join(words[i:i + _SHINGLE_SIZE]).encode("utf-8"))
+        for i in range(max(1, len(words) - _SHINGLE_SIZE + 1))
+    }
+    return [
+        min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles)
+        for a, b in _PERMUTATIONS
+    ]
+
+def similarity(signature: List[int], other: List[int]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / len(signature)
+
+def empty_index() -> Dict[str, list]:
+    """A new seen-source index; plain lists so it serializes with the graph state."""
+    return {"urls": [], "hashes": [], "signatures": []}
+
+def filter_seen_sources(sources: List[Dict[str, Any]], index: Dict[str, list], near_duplicate_threshold: float, max_tokens_per_source: int, match_urls: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, list], int, int]:
+    """Drop sources already processed in earlier loops and record the new ones.
+
+    A source is a duplicate if its canonical URL was seen, its normalized
+    content hash was seen, or its MinHash similarity to a seen page reaches
+    `near_duplicate_threshold`. Pass `match_urls=False` for providers whose
+    content is generated per query (Perplexity answers), where the same
+    citation URL does not mean the same content.
+
+    Returns:
+        tuple: (new sources, updated index, number dropped, estimated prompt tokens saved)
+    """
+    urls = set(index.get("urls", []))
+    hashes = set(index.get("hashes", []))
+    signatures = list(index.get("signatures", []))
+    new_urls, new_hashes = list(index.get("urls", [])), list(index.get("hashes", []))
+
+    kept, dropped, tokens_saved = [], 0, 0
+    for source in sources:
+        url = canonicalize_url(source["url"])
+        text = source.get("raw_content") or source.get("content") or ""
+        check_content = len(text) >= MIN_CONTENT_CHARS
+        digest = content_hash(text) if check_content else None
+        signature = minhash_signature(text) if check_content else None
+
+        duplicate = (match_urls and url in urls) or (digest is not None and digest in hashes)
+        if not duplicate and signature is not None:
+            duplicate = any(similarity(signature, seen) >= near_duplicate_threshold for seen in signatures)
+
+        if duplicate:
+            dropped += 1
+            tokens_saved += estimate_tokens(source.get("content") or "") + min(
+                estimate_tokens(source.get("raw_content") or ""), max_tokens_per_source
+            )
+            continue
+
+        kept.append(source)
+        urls.add(url)
+        new_urls.append(url)
+        if digest is not None:
+            hashes.add(digest)
+            new_hashes.append(digest)
+            signatures.append(signature)
+
+    return kept, {"urls": new_urls, "hashes": new_hashes, "signatures": signatures}, dropped, tokens_saved
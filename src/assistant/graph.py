@@ -1,273 +1,955 @@
-import json
+import asyncio
+import difflib
 import os
+import threading
+import time
+from functools import partial
+
+from typing import Optional
 
 from typing_extensions import Literal
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from langchain_ollama import ChatOllama
 from langgraph.graph import START, END, StateGraph
-from langsmith import trace
 
+from assistant.cache import get_content_store, get_search_cache
 from assistant.configuration import Configuration, SearchAPI
-from assistant.utils import deduplicate_and_format_sources, tavily_search, format_sources, perplexity_search, exa_search
-from assistant.state import SummaryState, SummaryStateInput, SummaryStateOutput
-from assistant.prompts import query_writer_instructions, summarizer_instructions, reflection_instructions
+from assistant.context import build_sources_context, build_summary_context, calibrate_tokens, calibrated_budget, estimate_tokens, query_terms, trim_to_tokens
+from assistant.dedup import canonicalize_url, empty_index, filter_seen_sources
+from assistant.llm import ainvoke_chat, invoke_chat, select_model
+from assistant.metrics import llm_token_counts, record, timed, timed_node
+from assistant.ratelimit import get_rate_limiter
+from assistant.research_store import get_research_store
+from assistant import deadline, speculation as speculations
+from assistant.utils import deduplicate_and_format_sources, tavily_search, format_sources, perplexity_search, exa_search, parallel_search, merge_search_responses, atavily_search, aperplexity_search, aexa_search, aparallel_search, bounded_map, abounded_map
+from assistant.structured import FollowUpQueries, FollowUpQuery, SearchQueries, SearchQuery, parse_reply, strip_thinking
+from assistant.state import SourceRecord, SummaryState, SummaryStateInput, SummaryStateOutput
+from assistant.prompts import query_writer_instructions, summarizer_instructions, reflection_instructions, multi_query_writer_instructions, multi_reflection_instructions, delta_note_instructions, merge_notes_instructions
 
-# Nodes   
-def generate_query(state: SummaryState, config: RunnableConfig):
-    """ Generate a query for web search """
-    
-    # Add timeout to config
-    if not config:
-        config = {}
-    if "configurable" not in config:
-        config["configurable"] = {}
-    config["configurable"]["timeout"] = 300  # 5 minutes timeout
-    
+def _node_configuration(config: RunnableConfig) -> Configuration:
+    """ Resolve the node configuration, start the node's deadline and enable tracing if configured """
     configurable = Configuration.from_runnable_config(config)
-    
+
+    # Every LLM call and search of the node must finish within node_timeout
+    deadline.start_node(configurable.node_timeout)
+
     # Enable tracing if configured
     if configurable.langsmith_tracing and configurable.langsmith_api_key:
         os.environ["LANGCHAIN_TRACING_V2"] = "true"
         os.environ["LANGCHAIN_ENDPOINT"] = configurable.langsmith_endpoint
         os.environ["LANGCHAIN_API_KEY"] = configurable.langsmith_api_key
         os.environ["LANGCHAIN_PROJECT"] = configurable.langsmith_project
-    
-    try:
-        # Format the prompt
+
+    return configurable
+
+def _invoke_llm(configurable: Configuration, node: str, messages: list, schema=None):
+    """ Call the chat model through the Ollama dispatcher, recording latency and token counts for the node
+
+    A JSON call passes the reply model `schema` its output is constrained to.
+    """
+    with timed("llm", node) as call:
+        result = deadline.call(invoke_chat, configurable, messages, json_mode=schema is not None, stats=call, schema=schema)
+        # A coalesced call reuses another session's reply and a cached one costs
+        # no tokens; only replies Ollama generated for this call are counted
+        if not call.get("coalesced"):
+            call.update(llm_token_counts(result))
+            _calibrate(call, messages)
+    return result
+
+async def _ainvoke_llm(configurable: Configuration, node: str, messages: list, schema=None):
+    """ Async counterpart of _invoke_llm """
+    with timed("llm", node) as call:
+        result = await deadline.acall(ainvoke_chat(configurable, messages, json_mode=schema is not None, stats=call, schema=schema))
+        if not call.get("coalesced"):
+            call.update(llm_token_counts(result))
+            _calibrate(call, messages)
+    return result
+
+def _calibrate(call: dict, messages: list) -> None:
+    """ Calibrate the token estimator with the prompt tokens Ollama counted for a call """
+    if call.get("prompt_tokens") and not call.get("cached"):
+        estimated = sum(estimate_tokens(message.content) for message in messages)
+        calibrate_tokens(call["model"], estimated, call["prompt_tokens"])
+
+def _context_budget(configurable: Configuration) -> int:
+    """ The context token budget in estimated tokens, calibrated for the model that will write """
+    model, _ = select_model(configurable, json_mode=False)
+    return calibrated_budget(model, configurable.context_token_budget)
+
+def _search_function(configurable: Configuration, research_loop_count: int):
+    """ Return the search callable for the configured API and whether its results carry raw content """
+    cache = get_search_cache(configurable)
+    limiter = get_rate_limiter(configurable, configurable.search_api.value)
+    if configurable.search_api == SearchAPI.TAVILY:
+        return partial(tavily_search, include_raw_content=True, max_results=1, timeout=configurable.search_timeout, cache=cache, pool_size=configurable.http_pool_size, limiter=limiter), True
+    elif configurable.search_api == SearchAPI.PERPLEXITY:
+        return partial(perplexity_search, perplexity_search_loop_count=research_loop_count, timeout=configurable.search_timeout, cache=cache, pool_size=configurable.http_pool_size, limiter=limiter), False
+    elif configurable.search_api == SearchAPI.EXA:
+        return partial(exa_search, max_results=3, timeout=configurable.search_timeout, cache=cache, pool_size=configurable.http_pool_size, limiter=limiter), True
+    else:
+        raise ValueError(f"Unsupported search API: {configurable.search_api}")
+
+def _async_search_function(configurable: Configuration, research_loop_count: int):
+    """ Async counterpart of _search_function """
+    cache = get_search_cache(configurable)
+    limiter = get_rate_limiter(configurable, configurable.search_api.value)
+    if configurable.search_api == SearchAPI.TAVILY:
+        return partial(atavily_search, include_raw_content=True, max_results=1, timeout=configurable.search_timeout, cache=cache, pool_size=configurable.http_pool_size, limiter=limiter), True
+    elif configurable.search_api == SearchAPI.PERPLEXITY:
+        return partial(aperplexity_search, perplexity_search_loop_count=research_loop_count, timeout=configurable.search_timeout, cache=cache, pool_size=configurable.http_pool_size, limiter=limiter), False
+    elif configurable.search_api == SearchAPI.EXA:
+        return partial(aexa_search, max_results=3, timeout=configurable.search_timeout, cache=cache, pool_size=configurable.http_pool_size, limiter=limiter), True
+    else:
+        raise ValueError(f"Unsupported search API: {configurable.search_api}")
+
+def _parse_json(node: str, content: str, schema):
+    """ Parse a JSON reply into its reply model, recording a "parse" event for the parse-failure rate """
+    with timed("parse", node) as outcome:
+        reply, repaired = parse_reply(content, schema)
+        if repaired:
+            outcome["repaired"] = 1
+    return reply
+
+def _unique_queries(queries: list, limit: int) -> list:
+    """ Keep up to `limit` distinct non-empty queries """
+    unique = []
+    for query in queries:
+        if query and query.strip() and query.strip() not in unique:
+            unique.append(query.strip())
+    return unique[:limit]
+
+# Prompt construction and response handling shared by the sync and async nodes
+
+def _query_messages(state: SummaryState, configurable: Configuration) -> list:
+    """ Build the messages asking the LLM for the initial search query or queries """
+    if configurable.search_fanout > 1:
+        query_writer_instructions_formatted = multi_query_writer_instructions.format(
+            research_topic=state.research_topic,
+            number_of_queries=configurable.search_fanout
+        )
+    else:
         query_writer_instructions_formatted = query_writer_instructions.format(research_topic=state.research_topic)
+    return [SystemMessage(content=query_writer_instructions_formatted),
+            HumanMessage(content="Generate a query for web search:")]
+
+def _query_schema(configurable: Configuration):
+    """ Reply model of the query writer """
+    return SearchQueries if configurable.search_fanout > 1 else SearchQuery
+
+def _query_update(state: SummaryState, configurable: Configuration, content: str) -> dict:
+    """ Parse the query writer output into a state update """
+    reply = _parse_json("generate_query", content, _query_schema(configurable))
+    if configurable.search_fanout > 1:
+        queries = _unique_queries([item.query for item in reply.queries], configurable.search_fanout)
+    else:
+        queries = _unique_queries([reply.query], 1)
+    if not queries:
+        raise ValueError("No queries in LLM response")
+    return {"search_query": queries[0], "search_queries": queries if configurable.search_fanout > 1 else []}
 
-        # Generate a query
-        configurable = Configuration.from_runnable_config(config)
-        llm_json_mode = ChatOllama(
-            model=configurable.local_llm,
-            temperature=0,
-            format="json",
-            base_url=configurable.ollama_base_url
+# Recorded instead of search results when every source was seen in an earlier loop
+NO_NEW_SOURCES = "Sources:\n\nNo new sources found in this research loop."
+
+def _store_sources(configurable: Configuration, sources: list, include_raw_content: bool) -> list:
+    """ Compact search results into SourceRecords, moving page text to the content store when it is enabled """
+    store = get_content_store(configurable) if include_raw_content else None
+    return [
+        SourceRecord(
+            url=source["url"],
+            title=source.get("title") or "",
+            content=source.get("content") or "",
+            raw_key=store.put(source["raw_content"]) if store and source.get("raw_content") else None,
+            raw_content=source.get("raw_content") if include_raw_content and store is None else None
+        )
+        for source in sources
+    ]
+
+def _load_sources(configurable: Configuration, records: list) -> list:
+    """ Expand SourceRecords into source dicts with their page text for prompt building """
+    store = None
+    sources = []
+    for source in records:
+        # Checkpoints written before SourceRecords hold plain dicts
+        if isinstance(source, dict):
+            sources.append(source)
+            continue
+        raw_content = source.raw_content
+        if source.raw_key:
+            store = store or get_content_store(configurable)
+            # None when the page was evicted (or the store disabled) since a resumed
+            # session was checkpointed: the source is then summarized from its snippet
+            raw_content = store.get(source.raw_key) if store else None
+        sources.append({"url": source.url, "title": source.title, "content": source.content, "raw_content": raw_content})
+    return sources
+
+def _web_research_update(state: SummaryState, configurable: Configuration, search_responses: list, include_raw_content: bool) -> dict:
+    """ Merge the search responses of one loop into a state update """
+    search_results = merge_search_responses(search_responses)
+    update = {"research_loop_count": state.research_loop_count + 1}
+
+    # Keep the passages of newly fetched pages for later loops and sessions
+    store = get_research_store(configurable)
+    if store is not None:
+        store.add_passages(state.research_topic, [source for source in search_results['results'] if not source.get("local")])
+
+    # Drop pages that an earlier loop already fetched and summarized
+    if configurable.dedupe_across_loops:
+        results, seen_sources, dropped, tokens_saved = filter_seen_sources(
+            search_results['results'],
+            state.seen_sources or empty_index(),
+            near_duplicate_threshold=configurable.near_duplicate_threshold,
+            max_tokens_per_source=configurable.max_tokens_per_source,
+            match_urls=configurable.search_api != SearchAPI.PERPLEXITY
+        )
+        search_results = {"results": results}
+        total = len(results) + dropped
+        update["new_source_share"] = len(results) / total if total else None
+        update["seen_sources"] = seen_sources
+        update["duplicate_sources_dropped"] = state.duplicate_sources_dropped + dropped
+        update["duplicate_tokens_saved"] = state.duplicate_tokens_saved + tokens_saved
+
+    if not search_results['results']:
+        update.update({"sources_gathered": [], "latest_sources": [], "web_research_results": [NO_NEW_SOURCES]})
+        return update
+
+    # The state keeps snippets only; page text is read back from the content store
+    search_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=configurable.max_tokens_per_source, include_raw_content=False)
+    update.update({
+        "sources_gathered": [format_sources(search_results)],
+        "latest_sources": _store_sources(configurable, search_results['results'], include_raw_content),
+        "web_research_results": [search_str]
+    })
+    return update
+
+def _web_research_error(state: SummaryState, configurable: Configuration, e: Exception) -> dict:
+    """ Record a failed search in the summary, or re-raise if there is nothing to keep """
+    # If we have a running summary, continue with a note about the error
+    if state.running_summary:
+        error_note = f"\n\nNote: Search failed during research loop {state.research_loop_count + 1} using {configurable.search_api.value} API. Error: {str(e)}"
+        return {
+            "sources_gathered": [f"[Search failed in loop {state.research_loop_count + 1}]"],
+            "latest_sources": [],
+            "research_loop_count": state.research_loop_count + 1,
+            "web_research_results": [error_note],
+            "running_summary": state.running_summary + error_note
+        }
+    # If this is the first search and it failed, raise the error
+    raise e
+
+# Passages a query needs to match for "prefer" to skip the web search must
+# contain at least this share of its terms
+LOCAL_COVERAGE = 0.5
+
+def _local_search(state: SummaryState, configurable: Configuration, queries: list) -> tuple:
+    """ Look up stored passages for a loop's queries, skipping pages this session already used
+
+    Returns:
+        tuple: (search response with one source per URL or None, whether the
+            passages cover every query well enough to skip the web search)
+    """
+    store = get_research_store(configurable)
+    if store is None or configurable.local_passages == "off":
+        return None, False
+    seen_urls = set((state.seen_sources or {}).get("urls", []))
+    sources, covered = {}, True
+    with timed("search", "research_store") as call:
+        for query in queries:
+            passages = store.search_passages(query, configurable.local_passages_k, exclude_urls=seen_urls)
+            covered = covered and sum(passage["coverage"] >= LOCAL_COVERAGE for passage in passages) >= configurable.local_passages_k
+            for passage in passages:
+                source = sources.setdefault(passage["url"], {
+                    "url": passage["url"],
+                    "title": f"{passage['title']} (from local research store)",
+                    "passages": [],
+                    "local": True
+                })
+                if passage["text"] not in source["passages"]:
+                    source["passages"].append(passage["text"])
+        call["results"] = len(sources)
+    if not sources:
+        return None, False
+    results = [
+        {"url": source["url"], "title": source["title"], "content": "\n\n".join(source["passages"]), "raw_content": None, "local": True}
+        for source in sources.values()
+    ]
+    return {"results": results}, covered and configurable.local_passages == "prefer"
+
+def _with_local_sources(search_responses: list, local: Optional[dict]) -> list:
+    """ Append the stored passages of pages the web search did not return again """
+    if local is None:
+        return search_responses
+    fetched = {canonicalize_url(source["url"]) for response in search_responses for source in response.get("results", [])}
+    results = [source for source in local["results"] if canonicalize_url(source["url"]) not in fetched]
+    return search_responses + [{"results": results}] if results else search_responses
+
+def _summary_messages(state: SummaryState, configurable: Configuration) -> list:
+    """ Build the summarizer messages from the existing summary and the latest results """
+    existing_summary = state.running_summary
+    most_recent_web_research = state.web_research_results[-1]
+
+    # Fit the existing summary and the ranked new sources into the token budget
+    if state.latest_sources:
+        existing_summary, most_recent_web_research = build_summary_context(
+            state.research_topic,
+            existing_summary,
+            _load_sources(configurable, state.latest_sources),
+            token_budget=_context_budget(configurable),
+            summary_share=configurable.summary_token_share,
+            max_tokens_per_source=configurable.max_tokens_per_source,
+            search_query=" ".join(state.search_queries or [state.search_query or ""]),
+            passage_tokens=configurable.passage_tokens,
+            passages_per_source=configurable.passages_per_source
+        )
+
+    # Build the human message
+    if existing_summary:
+        human_message_content = (
+            f"<User Input> \n {state.research_topic} \n <User Input>\n\n"
+            f"<Existing Summary> \n {existing_summary} \n <Existing Summary>\n\n"
+            f"<New Search Results> \n {most_recent_web_research} \n <New Search Results>"
         )
-        result = llm_json_mode.invoke(
-            [SystemMessage(content=query_writer_instructions_formatted),
-            HumanMessage(content=f"Generate a query for web search:")]
-        )   
-        query = json.loads(result.content)
-        
-        return {"search_query": query['query']}
+    else:
+        human_message_content = (
+            f"<User Input> \n {state.research_topic} \n <User Input>\n\n"
+            f"<Search Results> \n {most_recent_web_research} \n <Search Results>"
+        )
+    return [SystemMessage(content=summarizer_instructions),
+            HumanMessage(content=human_message_content)]
+
+def summary_change(previous: Optional[str], current: str) -> float:
+    """ Share of the summary that changed between loops, from 0 (identical) to 1 (all new) """
+    if not previous:
+        return 1.0
+    matcher = difflib.SequenceMatcher(None, previous.split(), current.split(), autojunk=False)
+    return 1.0 - matcher.ratio()
+
+def _summary_update(state: SummaryState, content: str) -> dict:
+    """ Clean the summarizer output into a state update """
+    running_summary = strip_thinking(content)
+
+    return {
+        "running_summary": running_summary,
+        "loop_gains": [summary_change(state.running_summary, running_summary)]
+    }
+
+def _summary_error(state: SummaryState, e: Exception) -> dict:
+    """ Keep the research going when summarization fails """
+    # If LLM fails but we have existing summary, preserve it with error note
+    if state.running_summary:
+        error_note = f"\n\nNote: Failed to summarize new sources due to LLM error: {str(e)}"
+        return {"running_summary": state.running_summary + error_note, "loop_gains": [None]}
+    # If this is the first summary and LLM failed, return raw search results
+    most_recent_web_research = state.web_research_results[-1] if state.web_research_results else ""
+    return {"running_summary": f"Research on: {state.research_topic}\n\nRaw search results:\n{most_recent_web_research}", "loop_gains": [None]}
+
+# Incremental strategy: one short note per loop, merged once in finalize_summary
+
+# What the note writer replies when a batch of sources adds nothing
+NO_NEW_INFORMATION = "NO NEW INFORMATION"
+
+def _note_batches(state: SummaryState, configurable: Configuration) -> list:
+    """ Split the latest sources into the batches that each get a delta note """
+    sources = _load_sources(configurable, state.latest_sources)
+    if configurable.notes_per_source and len(sources) > 1:
+        return [[source] for source in sources]
+    return [sources]
+
+def _delta_note_messages(state: SummaryState, configurable: Configuration, sources: list) -> list:
+    """ Build the messages asking for a delta note on one batch of new sources """
+    if sources:
+        sources_text = build_sources_context(
+            state.research_topic,
+            sources,
+            token_budget=_context_budget(configurable),
+            max_tokens_per_source=configurable.max_tokens_per_source,
+            search_query=" ".join(state.search_queries or [state.search_query or ""]),
+            passage_tokens=configurable.passage_tokens,
+            passages_per_source=configurable.passages_per_source
+        )
+    else:
+        sources_text = state.web_research_results[-1]
+    return [SystemMessage(content=delta_note_instructions.format(note_words=configurable.delta_note_words)),
+            HumanMessage(content=(
+                f"<User Input> \n {state.research_topic} \n <User Input>\n\n"
+                f"<Search Results> \n {sources_text} \n <Search Results>"
+            ))]
+
+def note_novelty(previous: Optional[str], note: str) -> float:
+    """ Share of the note's content words that earlier notes did not contain """
+    terms = set(query_terms(note))
+    if not terms:
+        return 0.0
+    return len(terms - set(query_terms(previous or ""))) / len(terms)
+
+def _delta_note_update(state: SummaryState, batches: list, contents: list) -> dict:
+    """ Record the delta notes of one loop and extend the working notes with them """
+    notes = [strip_thinking(content).strip() for content in contents]
+    notes = [note for note in notes if note and NO_NEW_INFORMATION not in note]
+    if not notes:
+        return {"running_summary": state.running_summary or "", "loop_gains": [0.0]}
+    note = "\n".join(notes)
+    # The working notes stand in for the summary while researching (reflection,
+    # early stopping, partial results); finalize_summary merges them into the report
+    running_summary = f"{state.running_summary}\n\n{note}" if state.running_summary else note
+    return {
+        "delta_notes": [{
+            "loop": state.research_loop_count,
+            "note": note,
+            "urls": [source["url"] for batch in batches for source in batch]
+        }],
+        "running_summary": running_summary,
+        "loop_gains": [note_novelty(state.running_summary, note)]
+    }
+
+def _note_groups(notes: list, token_budget: int) -> list:
+    """ Pack notes, in order, into groups that each fit `token_budget` tokens """
+    # Capping each note at half the budget guarantees every round merges at least two notes
+    notes = [trim_to_tokens(note, max(1, token_budget // 2)) for note in notes]
+    groups, current, used = [], [], 0
+    for note in notes:
+        cost = estimate_tokens(note)
+        if current and used + cost > token_budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(note)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+def _merge_messages(state: SummaryState, notes: list) -> list:
+    """ Build the messages merging a group of notes into one summary """
+    notes_text = "\n\n".join(f"Note {i}:\n{note}" for i, note in enumerate(notes, 1))
+    return [SystemMessage(content=merge_notes_instructions),
+            HumanMessage(content=(
+                f"<User Input> \n {state.research_topic} \n <User Input>\n\n"
+                f"<Research Notes> \n {notes_text} \n <Research Notes>"
+            ))]
+
+def _merge_error(state: SummaryState, e: Exception) -> str:
+    """ Fall back to the unmerged notes when merging fails """
+    return f"{state.running_summary}\n\nNote: Failed to merge the research notes due to LLM error: {str(e)}"
+
+def _reflection_messages(state: SummaryState, configurable: Configuration, knowledge: Optional[str] = None) -> list:
+    """ Build the messages asking the LLM for follow-up queries, based on the summary unless `knowledge` is given """
+    knowledge = state.running_summary if knowledge is None else knowledge
+    if configurable.search_fanout > 1:
+        return [SystemMessage(content=multi_reflection_instructions.format(research_topic=state.research_topic, number_of_queries=configurable.search_fanout)),
+                HumanMessage(content=f"Identify knowledge gaps and generate follow-up web search queries based on our existing knowledge: {knowledge}")]
+    return [SystemMessage(content=reflection_instructions.format(research_topic=state.research_topic)),
+            HumanMessage(content=f"Identify a knowledge gap and generate a follow-up web search query based on our existing knowledge: {knowledge}")]
+
+def _reflection_schema(configurable: Configuration):
+    """ Reply model of the reflection step """
+    return FollowUpQueries if configurable.search_fanout > 1 else FollowUpQuery
+
+def _reflection_update(configurable: Configuration, content: str, node: str = "reflect_on_summary"):
+    """ Parse the reflection output into a state update, or None to use the fallback """
+    try:
+        reply = _parse_json(node, content, _reflection_schema(configurable))
+    except ValueError:
+        return None  # Recorded as a parse failure; fall through to fallback
+    if configurable.search_fanout > 1:
+        queries = _unique_queries(reply.follow_up_queries, configurable.search_fanout)
+        if queries:
+            return {"search_query": queries[0], "search_queries": queries}
+    else:
+        queries = _unique_queries([reply.follow_up_query], 1)
+        if queries:
+            return {"search_query": queries[0], "search_queries": []}
+    return None
+
+def _reflection_fallback(state: SummaryState, configurable: Configuration) -> dict:
+    """ Generate a simple follow-up query based on research topic, a different one each loop """
+    fallback_queries = [
+        f"latest developments in {state.research_topic}",
+        f"important aspects of {state.research_topic}",
+        f"key information about {state.research_topic}",
+        f"Tell me more about {state.research_topic}"
+    ]
+    # Rotate by loop, so consecutive fallbacks do not search the same query
+    offset = state.research_loop_count % len(fallback_queries)
+    fallback_queries = fallback_queries[offset:] + fallback_queries[:offset]
+    if configurable.search_fanout > 1:
+        queries = fallback_queries[:configurable.search_fanout]
+        return {"search_query": queries[0], "search_queries": queries}
+    return {"search_query": fallback_queries[0], "search_queries": []}
+
+# Pipelined mode: while summarize_sources writes loop N, the follow-up queries
+# of loop N+1 are written from the summary so far plus the new sources, and
+# their searches are prefetched. route_summary then skips reflection, and
+# web_research picks the prefetched responses up; finalize_summary cancels a
+# prefetch that research stopped before using
+
+def _should_speculate(state: SummaryState, configurable: Configuration) -> bool:
+    """ Whether to speculate on the next loop: pipelined mode, and not the last loop """
+    return configurable.pipelined_research and state.research_loop_count <= configurable.max_web_research_loops
+
+def _speculation_messages(state: SummaryState, configurable: Configuration) -> list:
+    """ Build the reflection messages from the summary so far and the snippets being summarized """
+    knowledge = state.running_summary or ""
+    if state.web_research_results and state.web_research_results[-1] != NO_NEW_SOURCES:
+        knowledge = f"{knowledge}\n\n{state.web_research_results[-1]}".strip()
+    return _reflection_messages(state, configurable, knowledge)
+
+def _speculative_queries(configurable: Configuration, content: str) -> dict:
+    """ Parse speculative follow-up queries, failing rather than falling back to generic ones """
+    update = _reflection_update(configurable, content, "speculate_queries")
+    if not update:
+        raise ValueError("No follow-up queries in LLM response")
+    return update
+
+def _run_searches(configurable: Configuration, search_fn, queries: list) -> list:
+    """ Search all queries of a loop, fanning out when there are several """
+    if len(queries) == 1:
+        return [deadline.call(search_fn, queries[0])]
+    search_responses, errors = deadline.call(
+        parallel_search,
+        search_fn,
+        queries,
+        max_concurrency=configurable.search_concurrency,
+        timeout=configurable.search_timeout
+    )
+    # Partial results are still useful; only fail when every query failed
+    if not search_responses:
+        raise errors[0]
+    return search_responses
+
+async def _arun_searches(configurable: Configuration, search_fn, queries: list) -> list:
+    """ Async counterpart of _run_searches """
+    search_responses, errors = await deadline.acall(aparallel_search(
+        search_fn,
+        queries,
+        max_concurrency=configurable.search_concurrency,
+        timeout=configurable.search_timeout
+    ))
+    if not search_responses:
+        raise errors[0]
+    return search_responses
+
+def _speculate(state: SummaryState, configurable: Configuration):
+    """ Start writing the next loop's queries and prefetching their searches in the background """
+    if not _should_speculate(state, configurable):
+        return None
+
+    def run(speculation):
+        try:
+            result = _invoke_llm(configurable, "speculate_queries", _speculation_messages(state, configurable), schema=_reflection_schema(configurable))
+            update = _speculative_queries(configurable, result.content)
+        except Exception as e:
+            speculation.queries.set_exception(e)
+            return
+        speculation.queries.set_result(update)
+        if speculation.cancelled.is_set():
+            return
+        try:
+            search_fn, include_raw_content = _search_function(configurable, state.research_loop_count)
+            queries = update["search_queries"] or [update["search_query"]]
+            speculation.responses.set_result((_run_searches(configurable, search_fn, queries), include_raw_content))
+        except Exception as e:
+            speculation.responses.set_exception(e)
+
+    return speculations.start(run)
+
+def _aspeculate(state: SummaryState, configurable: Configuration):
+    """ Async counterpart of _speculate, running the prefetch as a task """
+    if not _should_speculate(state, configurable):
+        return None
+
+    async def run(speculation):
+        try:
+            result = await _ainvoke_llm(configurable, "speculate_queries", _speculation_messages(state, configurable), schema=_reflection_schema(configurable))
+            update = _speculative_queries(configurable, result.content)
+        except Exception as e:
+            speculation.queries.set_exception(e)
+            return
+        speculation.queries.set_result(update)
+        try:
+            search_fn, include_raw_content = _async_search_function(configurable, state.research_loop_count)
+            queries = update["search_queries"] or [update["search_query"]]
+            speculation.responses.set_result((await _arun_searches(configurable, search_fn, queries), include_raw_content))
+        except Exception as e:
+            speculation.responses.set_exception(e)
+
+    return speculations.astart(run)
+
+def _speculation_update(speculation) -> dict:
+    """ Point the next loop at the speculative queries, or leave it to reflection if they failed """
+    if speculation is None:
+        return {}
+    try:
+        # Bounded by the node deadline, like the summarizer call it ran next to
+        return {**deadline.wait(speculation.queries), "speculation_id": speculation.id}
+    except Exception:
+        speculations.discard(speculation.id)
+        return {}
+
+async def _aspeculation_update(speculation) -> dict:
+    """ Async counterpart of _speculation_update """
+    if speculation is None:
+        return {}
+    try:
+        return {**await deadline.acall(asyncio.wrap_future(speculation.queries)), "speculation_id": speculation.id}
+    except Exception:
+        speculations.discard(speculation.id)
+        return {}
+
+def _wait_for_prefetch(speculation) -> Optional[tuple]:
+    """ Wait for a claimed prefetch: (search responses, include_raw_content), or None to search anew """
+    if speculation is None:
+        return None
+    started = time.perf_counter()
+    try:
+        prefetched = deadline.wait(speculation.responses)
+    except Exception as e:
+        # A failed prefetch is a miss; the loop searches again itself
+        record("speculation", "miss", time.perf_counter() - started, error=type(e).__name__)
+        return None
+    # A hit's seconds are the part of the prefetch the loop still had to wait for
+    record("speculation", "hit", time.perf_counter() - started)
+    return prefetched
+
+async def _await_prefetch(speculation) -> Optional[tuple]:
+    """ Async counterpart of _wait_for_prefetch """
+    if speculation is None:
+        return None
+    started = time.perf_counter()
+    try:
+        prefetched = await deadline.acall(asyncio.wrap_future(speculation.responses))
     except Exception as e:
+        record("speculation", "miss", time.perf_counter() - started, error=type(e).__name__)
+        return None
+    record("speculation", "hit", time.perf_counter() - started)
+    return prefetched
+
+def _claim_prefetch(state: SummaryState):
+    """ Claim the prefetch of this loop's queries; a checkpoint restored elsewhere has none """
+    speculation = speculations.take(state.speculation_id)
+    if speculation is None and state.speculation_id:
+        record("speculation", "miss", 0.0)
+    return speculation
+
+# Nodes
+def generate_query(state: SummaryState, config: RunnableConfig):
+    """ Generate a query for web search """
+    configurable = _node_configuration(config)
+    try:
+        result = _invoke_llm(configurable, "generate_query", _query_messages(state, configurable), schema=_query_schema(configurable))
+        return _query_update(state, configurable, result.content)
+    except Exception:
         # If LLM fails, use the research topic as the query
-        return {"search_query": state.research_topic}
+        return {"search_query": state.research_topic, "search_queries": []}
 
 def web_research(state: SummaryState, config: RunnableConfig):
     """ Gather information from the web """
-    
-    # Add timeout to config
-    if not config:
-        config = {}
-    if "configurable" not in config:
-        config["configurable"] = {}
-    config["configurable"]["timeout"] = 300  # 5 minutes timeout
-    
-    # Configure 
-    configurable = Configuration.from_runnable_config(config)
-    
-    # Enable tracing if configured
-    if configurable.langsmith_tracing and configurable.langsmith_api_key:
-        os.environ["LANGCHAIN_TRACING_V2"] = "true"
-        os.environ["LANGCHAIN_ENDPOINT"] = configurable.langsmith_endpoint
-        os.environ["LANGCHAIN_API_KEY"] = configurable.langsmith_api_key
-        os.environ["LANGCHAIN_PROJECT"] = configurable.langsmith_project
-
+    configurable = _node_configuration(config)
+    prefetched = _wait_for_prefetch(_claim_prefetch(state))
+    queries = state.search_queries or [state.search_query]
+    local, sufficient = _local_search(state, configurable, queries)
     try:
-        # Search the web
-        if configurable.search_api == SearchAPI.TAVILY:
-            search_results = tavily_search(state.search_query, include_raw_content=True, max_results=1)
-            search_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000, include_raw_content=True)
-        elif configurable.search_api == SearchAPI.PERPLEXITY:
-            search_results = perplexity_search(state.search_query, state.research_loop_count)
-            search_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000, include_raw_content=False)
-        elif configurable.search_api == SearchAPI.EXA:
-            search_results = exa_search(state.search_query, max_results=3)
-            search_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000, include_raw_content=True)
+        if prefetched:
+            search_responses, include_raw_content = prefetched
+        elif sufficient:
+            # Stored passages already cover every query: skip the paid search
+            search_responses, include_raw_content = [], False
         else:
-            raise ValueError(f"Unsupported search API: {configurable.search_api}")
+            # Search the web, fanning out over all queries for this loop
+            search_fn, include_raw_content = _search_function(configurable, state.research_loop_count)
+            search_responses = _run_searches(configurable, search_fn, queries)
     except Exception as e:
-        # If we have a running summary, continue with a note about the error
-        if state.running_summary:
-            error_note = f"\n\nNote: Search failed during research loop {state.research_loop_count + 1} using {configurable.search_api.value} API. Error: {str(e)}"
-            return {
-                "sources_gathered": state.sources_gathered + [f"[Search failed in loop {state.research_loop_count + 1}]"],
-                "research_loop_count": state.research_loop_count + 1,
-                "web_research_results": state.web_research_results + [error_note],
-                "running_summary": state.running_summary + error_note
-            }
-        # If this is the first search and it failed, raise the error
-        raise
-        
-    return {
-        "sources_gathered": [format_sources(search_results)], 
-        "research_loop_count": state.research_loop_count + 1, 
-        "web_research_results": [search_str]
-    }
+        if local is None:
+            return {**_web_research_error(state, configurable, e), "speculation_id": None}
+        # Continue on the stored passages alone
+        search_responses, include_raw_content = [], False
+    search_responses = _with_local_sources(search_responses, local)
+    return {**_web_research_update(state, configurable, search_responses, include_raw_content), "speculation_id": None}
 
 def summarize_sources(state: SummaryState, config: RunnableConfig):
-    """ Summarize the gathered sources """
-    
-    # Add timeout to config
-    if not config:
-        config = {}
-    if "configurable" not in config:
-        config["configurable"] = {}
-    config["configurable"]["timeout"] = 300  # 5 minutes timeout
-    
-    configurable = Configuration.from_runnable_config(config)
-    
-    # Enable tracing if configured
-    if configurable.langsmith_tracing and configurable.langsmith_api_key:
-        os.environ["LANGCHAIN_TRACING_V2"] = "true"
-        os.environ["LANGCHAIN_ENDPOINT"] = configurable.langsmith_endpoint
-        os.environ["LANGCHAIN_API_KEY"] = configurable.langsmith_api_key
-        os.environ["LANGCHAIN_PROJECT"] = configurable.langsmith_project
-    
+    """ Summarize the gathered sources, speculating on the next loop in pipelined mode """
+    configurable = _node_configuration(config)
+    speculation = _speculate(state, configurable)
+    update = _summarize(state, configurable)
+    return {**update, **_speculation_update(speculation)}
+
+def _summarize(state: SummaryState, configurable: Configuration) -> dict:
+    # Nothing new to add: keep the summary and skip the LLM call
+    if state.running_summary and state.web_research_results[-1] == NO_NEW_SOURCES:
+        return {"loop_gains": [0.0]}
     try:
-        # Existing summary
-        existing_summary = state.running_summary
+        if configurable.summary_strategy == "incremental":
+            return _write_delta_notes(state, configurable)
+        result = _invoke_llm(configurable, "summarize_sources", _summary_messages(state, configurable))
+        return _summary_update(state, result.content)
+    except Exception as e:
+        return _summary_error(state, e)
 
-        # Most recent web research
-        most_recent_web_research = state.web_research_results[-1]
+def _write_delta_notes(state: SummaryState, configurable: Configuration) -> dict:
+    """ Summarize the new sources into delta notes, one batch per LLM call """
+    batches = _note_batches(state, configurable)
+    write_note = lambda batch: _invoke_llm(configurable, "summarize_sources", _delta_note_messages(state, configurable, batch)).content
+    if len(batches) == 1:
+        return _delta_note_update(state, batches, [write_note(batches[0])])
+    contents, errors = bounded_map(write_note, batches, max_concurrency=configurable.note_concurrency)
+    # Notes on the other sources are still useful; only fail when every call failed
+    if not contents:
+        raise errors[0]
+    return _delta_note_update(state, batches, contents)
 
-        # Build the human message
-        if existing_summary:
-            human_message_content = (
-                f"<User Input> \n {state.research_topic} \n <User Input>\n\n"
-                f"<Existing Summary> \n {existing_summary} \n <Existing Summary>\n\n"
-                f"<New Search Results> \n {most_recent_web_research} \n <New Search Results>"
-            )
-        else:
-            human_message_content = (
-                f"<User Input> \n {state.research_topic} \n <User Input>\n\n"
-                f"<Search Results> \n {most_recent_web_research} \n <Search Results>"
-            )
-
-        # Run the LLM
-        configurable = Configuration.from_runnable_config(config)
-        llm = ChatOllama(
-            model=configurable.local_llm,
-            temperature=0,
-            base_url=configurable.ollama_base_url
-        )
-        result = llm.invoke(
-            [SystemMessage(content=summarizer_instructions),
-            HumanMessage(content=human_message_content)]
-        )
+def reflect_on_summary(state: SummaryState, config: RunnableConfig):
+    """ Reflect on the summary and generate a follow-up query """
+    configurable = _node_configuration(config)
+    try:
+        result = _invoke_llm(configurable, "reflect_on_summary", _reflection_messages(state, configurable), schema=_reflection_schema(configurable))
+        update = _reflection_update(configurable, result.content)
+        if update:
+            return update
+    except Exception as e:
+        # Add error note to summary before falling through to fallback
+        error_note = f"\n\nNote: Failed to generate follow-up query due to LLM error: {str(e)}"
+        state.running_summary += error_note
+    return _reflection_fallback(state, configurable)
 
-        running_summary = result.content
+# Async nodes, so a single event loop can run many research sessions at once
+async def agenerate_query(state: SummaryState, config: RunnableConfig):
+    """ Generate a query for web search """
+    configurable = _node_configuration(config)
+    try:
+        result = await _ainvoke_llm(configurable, "generate_query", _query_messages(state, configurable), schema=_query_schema(configurable))
+        return _query_update(state, configurable, result.content)
+    except Exception:
+        # If LLM fails, use the research topic as the query
+        return {"search_query": state.research_topic, "search_queries": []}
+
+async def aweb_research(state: SummaryState, config: RunnableConfig):
+    """ Gather information from the web """
+    configurable = _node_configuration(config)
+    prefetched = await _await_prefetch(_claim_prefetch(state))
+    queries = state.search_queries or [state.search_query]
+    local, sufficient = _local_search(state, configurable, queries)
+    try:
+        if prefetched:
+            search_responses, include_raw_content = prefetched
+        elif sufficient:
+            # Stored passages already cover every query: skip the paid search
+            search_responses, include_raw_content = [], False
+        else:
+            # Search the web, fanning out over all queries for this loop
+            search_fn, include_raw_content = _async_search_function(configurable, state.research_loop_count)
+            search_responses = await _arun_searches(configurable, search_fn, queries)
+    except Exception as e:
+        if local is None:
+            return {**_web_research_error(state, configurable, e), "speculation_id": None}
+        # Continue on the stored passages alone
+        search_responses, include_raw_content = [], False
+    search_responses = _with_local_sources(search_responses, local)
+    return {**_web_research_update(state, configurable, search_responses, include_raw_content), "speculation_id": None}
 
-        # TODO: This is a hack to remove the <think> tags w/ Deepseek models 
-        # It appears very challenging to prompt them out of the responses 
-        while "<think>" in running_summary and "</think>" in running_summary:
-            start = running_summary.find("<think>")
-            end = running_summary.find("</think>") + len("</think>")
-            running_summary = running_summary[:start] + running_summary[end:]
+async def asummarize_sources(state: SummaryState, config: RunnableConfig):
+    """ Summarize the gathered sources, speculating on the next loop in pipelined mode """
+    configurable = _node_configuration(config)
+    speculation = _aspeculate(state, configurable)
+    update = await _asummarize(state, configurable)
+    return {**update, **await _aspeculation_update(speculation)}
 
-        return {"running_summary": running_summary}
+async def _asummarize(state: SummaryState, configurable: Configuration) -> dict:
+    # Nothing new to add: keep the summary and skip the LLM call
+    if state.running_summary and state.web_research_results[-1] == NO_NEW_SOURCES:
+        return {"loop_gains": [0.0]}
+    try:
+        if configurable.summary_strategy == "incremental":
+            return await _awrite_delta_notes(state, configurable)
+        result = await _ainvoke_llm(configurable, "summarize_sources", _summary_messages(state, configurable))
+        return _summary_update(state, result.content)
     except Exception as e:
-        # If LLM fails but we have existing summary, preserve it with error note
-        if existing_summary:
-            error_note = f"\n\nNote: Failed to summarize new sources due to LLM error: {str(e)}"
-            return {"running_summary": existing_summary + error_note}
-        # If this is the first summary and LLM failed, return raw search results
-        return {"running_summary": f"Research on: {state.research_topic}\n\nRaw search results:\n{most_recent_web_research}"}
+        return _summary_error(state, e)
 
-def reflect_on_summary(state: SummaryState, config: RunnableConfig):
-    """ Reflect on the summary and generate a follow-up query """
+async def _awrite_delta_notes(state: SummaryState, configurable: Configuration) -> dict:
+    """ Async counterpart of _write_delta_notes """
+    batches = _note_batches(state, configurable)
 
-    # Add timeout to config
-    if not config:
-        config = {}
-    if "configurable" not in config:
-        config["configurable"] = {}
-    config["configurable"]["timeout"] = 300  # 5 minutes timeout
-    
-    configurable = Configuration.from_runnable_config(config)
-    
-    # Enable tracing if configured
-    if configurable.langsmith_tracing and configurable.langsmith_api_key:
-        os.environ["LANGCHAIN_TRACING_V2"] = "true"
-        os.environ["LANGCHAIN_ENDPOINT"] = configurable.langsmith_endpoint
-        os.environ["LANGCHAIN_API_KEY"] = configurable.langsmith_api_key
-        os.environ["LANGCHAIN_PROJECT"] = configurable.langsmith_project
-    
+    async def write_note(batch):
+        result = await _ainvoke_llm(configurable, "summarize_sources", _delta_note_messages(state, configurable, batch))
+        return result.content
+
+    contents, errors = await abounded_map(write_note, batches, max_concurrency=configurable.note_concurrency)
+    # Notes on the other sources are still useful; only fail when every call failed
+    if not contents:
+        raise errors[0]
+    return _delta_note_update(state, batches, contents)
+
+async def areflect_on_summary(state: SummaryState, config: RunnableConfig):
+    """ Reflect on the summary and generate a follow-up query """
+    configurable = _node_configuration(config)
     try:
-        # Generate a query
-        configurable = Configuration.from_runnable_config(config)
-        llm_json_mode = ChatOllama(
-            model=configurable.local_llm,
-            temperature=0,
-            format="json",
-            base_url=configurable.ollama_base_url
-        )
-        result = llm_json_mode.invoke(
-            [SystemMessage(content=reflection_instructions.format(research_topic=state.research_topic)),
-            HumanMessage(content=f"Identify a knowledge gap and generate a follow-up web search query based on our existing knowledge: {state.running_summary}")]
-        )   
-        
-        try:
-            follow_up_query = json.loads(result.content)
-            query = follow_up_query.get('follow_up_query')
-            if query:
-                return {"search_query": query}
-        except (json.JSONDecodeError, AttributeError):
-            pass  # Fall through to fallback
-            
+        result = await _ainvoke_llm(configurable, "reflect_on_summary", _reflection_messages(state, configurable), schema=_reflection_schema(configurable))
+        update = _reflection_update(configurable, result.content)
+        if update:
+            return update
     except Exception as e:
         # Add error note to summary before falling through to fallback
         error_note = f"\n\nNote: Failed to generate follow-up query due to LLM error: {str(e)}"
         state.running_summary += error_note
+    return _reflection_fallback(state, configurable)
 
-    # Fallback: Generate a simple follow-up query based on research topic
-    fallback_queries = [
-        f"latest developments in {state.research_topic}",
-        f"important aspects of {state.research_topic}",
-        f"key information about {state.research_topic}",
-        f"Tell me more about {state.research_topic}"
-    ]
-    import random
-    return {"search_query": random.choice(fallback_queries)}
+def _stop_reason(state: SummaryState, configurable: Configuration) -> Optional[str]:
+    """ Why research should stop after the current loop, or None to keep going """
+    # A cancelled or timed out session finalizes the summary it has so far
+    reason = deadline.stop_reason()
+    if reason == "deadline":
+        return f"Reached the research deadline after {state.research_loop_count} research loops"
+    if reason is not None:
+        return f"Research {reason} after {state.research_loop_count} research loops"
+    if state.research_loop_count > configurable.max_web_research_loops:
+        return f"Reached the maximum of {configurable.max_web_research_loops} research loops"
+    if not configurable.early_stopping or state.research_loop_count < configurable.min_web_research_loops:
+        return None
+
+    # Stop once enough consecutive loops added (almost) nothing new
+    patience = max(1, configurable.convergence_patience)
+    recent = state.loop_gains[-patience:]
+    if len(recent) < patience or any(gain is None or gain >= configurable.convergence_threshold for gain in recent):
+        return None
+    share = "" if state.new_source_share is None else f"; {state.new_source_share:.0%} of the latest sources were new"
+    return (
+        f"Converged after {state.research_loop_count} research loops: the summary changed by "
+        f"{recent[-1]:.0%} (threshold {configurable.convergence_threshold:.0%}){share}"
+    )
+
+def _finalize_update(state: SummaryState, configurable: Configuration, summary: str) -> dict:
+    """ Add the sources to the final summary """
 
-def finalize_summary(state: SummaryState):
-    """ Finalize the summary """
-    
     # Format all accumulated sources into a single bulleted list
     all_sources = "\n".join(source for source in state.sources_gathered)
-    state.running_summary = f"## Summary\n\n{state.running_summary}\n\n ### Sources:\n{all_sources}"
-    return {"running_summary": state.running_summary}
+    stop_reason = _stop_reason(state, configurable)
+    stopped = deadline.stop_reason() is not None
+    if stopped:
+        summary = f"{summary}\n\nNote: Research ended early. {stop_reason}."
+    running_summary = f"## Summary\n\n{summary}\n\n ### Sources:\n{all_sources}"
+
+    # Later runs on a near-identical topic are answered with this summary; partial ones are not kept
+    store = get_research_store(configurable)
+    if store is not None and not stopped:
+        store.add_summary(state.research_topic, running_summary)
+    return {
+        "running_summary": running_summary,
+        "stop_reason": stop_reason
+    }
+
+def finalize_summary(state: SummaryState, config: RunnableConfig):
+    """ Finalize the summary, merging the delta notes of the incremental strategy """
+    configurable = _node_configuration(config)
+    # Research stopped early: the next loop's prefetch is not needed
+    speculations.discard(state.speculation_id)
+    summary = state.running_summary
+    # A stopped session keeps its notes unmerged rather than wait for the LLM
+    if configurable.summary_strategy == "incremental" and state.delta_notes and deadline.stop_reason() is None:
+        try:
+            # Reduce in rounds until a single merged summary is left
+            notes = [note["note"] for note in state.delta_notes]
+            while True:
+                notes = [
+                    strip_thinking(_invoke_llm(configurable, "finalize_summary", _merge_messages(state, group)).content).strip()
+                    for group in _note_groups(notes, _context_budget(configurable))
+                ]
+                if len(notes) == 1:
+                    break
+            summary = notes[0]
+        except Exception as e:
+            summary = _merge_error(state, e)
+    return _finalize_update(state, configurable, summary)
+
+async def afinalize_summary(state: SummaryState, config: RunnableConfig):
+    """ Finalize the summary, merging the delta notes of the incremental strategy """
+    configurable = _node_configuration(config)
+    speculations.discard(state.speculation_id)
+    summary = state.running_summary
+    # A stopped session keeps its notes unmerged rather than wait for the LLM
+    if configurable.summary_strategy == "incremental" and state.delta_notes and deadline.stop_reason() is None:
+        try:
+            # Reduce in rounds until a single merged summary is left, merging each round's groups concurrently
+            notes = [note["note"] for note in state.delta_notes]
+            while True:
+                results = await asyncio.gather(*(
+                    _ainvoke_llm(configurable, "finalize_summary", _merge_messages(state, group))
+                    for group in _note_groups(notes, _context_budget(configurable))
+                ))
+                notes = [strip_thinking(result.content).strip() for result in results]
+                if len(notes) == 1:
+                    break
+            summary = notes[0]
+        except Exception as e:
+            summary = _merge_error(state, e)
+    return _finalize_update(state, configurable, summary)
+
+def route_summary(state: SummaryState, config: RunnableConfig) -> Literal["finalize_summary", "reflect_on_summary", "web_research"]:
+    """ Reflect on the new summary, unless pipelined mode already wrote the next queries or the session stopped """
+    if state.speculation_id or deadline.stop_reason() is not None:
+        return route_research(state, config)
+    return "reflect_on_summary"
 
 def route_research(state: SummaryState, config: RunnableConfig) -> Literal["finalize_summary", "web_research"]:
-    """ Route the research based on the follow-up query """
+    """ Route the research: stop at the loop limit or once loops stop adding information """
 
     configurable = Configuration.from_runnable_config(config)
-    if state.research_loop_count <= configurable.max_web_research_loops:
-        return "web_research"
-    else:
-        return "finalize_summary" 
-    
-# Add nodes and edges 
-builder = StateGraph(SummaryState, input=SummaryStateInput, output=SummaryStateOutput, config_schema=Configuration)
-
-# Add nodes with tracing
-builder.add_node("generate_query", generate_query)
-builder.add_node("web_research", web_research)
-builder.add_node("summarize_sources", summarize_sources)
-builder.add_node("reflect_on_summary", reflect_on_summary)
-builder.add_node("finalize_summary", finalize_summary)
-
-# Add edges
-builder.add_edge(START, "generate_query")
-builder.add_edge("generate_query", "web_research")
-builder.add_edge("web_research", "summarize_sources")
-builder.add_edge("summarize_sources", "reflect_on_summary")
-builder.add_conditional_edges("reflect_on_summary", route_research)
-builder.add_edge("finalize_summary", END)
-
-# Compile the graph
-graph = builder.compile()
+    if _stop_reason(state, configurable) is not None:
+        return "finalize_summary"
+    return "web_research"
+
+def build_graph(generate_query_node, web_research_node, summarize_sources_node, reflect_on_summary_node, finalize_summary_node) -> StateGraph:
+    """ Wire the research nodes into a StateGraph """
+    builder = StateGraph(SummaryState, input=SummaryStateInput, output=SummaryStateOutput, config_schema=Configuration)
+
+    # Add nodes, timing each invocation for the session metrics
+    builder.add_node("generate_query", timed_node("generate_query", generate_query_node))
+    builder.add_node("web_research", timed_node("web_research", web_research_node))
+    builder.add_node("summarize_sources", timed_node("summarize_sources", summarize_sources_node))
+    builder.add_node("reflect_on_summary", timed_node("reflect_on_summary", reflect_on_summary_node))
+    builder.add_node("finalize_summary", timed_node("finalize_summary", finalize_summary_node))
+
+    # Add edges
+    builder.add_edge(START, "generate_query")
+    builder.add_edge("generate_query", "web_research")
+    builder.add_edge("web_research", "summarize_sources")
+    builder.add_conditional_edges("summarize_sources", route_summary)
+    builder.add_conditional_edges("reflect_on_summary", route_research)
+    builder.add_edge("finalize_summary", END)
+    return builder
+
+# Graphs are built and compiled on first use, keeping them off the import path
+# of processes that only need part of them (or none, e.g. argument errors)
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def get_builder(asynchronous: bool = False) -> StateGraph:
+    """Return the uncompiled research graph with sync or async nodes."""
+    with _graphs_lock:
+        key = ("builder", asynchronous)
+        if key not in _graphs:
+            if asynchronous:
+                _graphs[key] = build_graph(agenerate_query, aweb_research, asummarize_sources, areflect_on_summary, afinalize_summary)
+            else:
+                _graphs[key] = build_graph(generate_query, web_research, summarize_sources, reflect_on_summary, finalize_summary)
+        return _graphs[key]
+
+def get_graph(asynchronous: bool = False):
+    """Return the compiled research graph: sync for threads, async for a shared event loop."""
+    builder = get_builder(asynchronous)
+    with _graphs_lock:
+        key = ("graph", asynchronous)
+        if key not in _graphs:
+            _graphs[key] = builder.compile()
+        return _graphs[key]
+
+_LAZY_ATTRIBUTES = {
+    "builder": lambda: get_builder(),
+    "abuilder": lambda: get_builder(asynchronous=True),
+    "graph": lambda: get_graph(),
+    "agraph": lambda: get_graph(asynchronous=True),
+}
+
+def __getattr__(name):
+    # Keeps `from assistant.graph import graph` working on top of the lazy getters
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
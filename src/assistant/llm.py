@@ -0,0 +1,427 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+from langgraph.constants import TAG_NOSTREAM
+from pydantic import BaseModel
+
+from assistant import deadline
+from assistant.cache import LLMCache, get_llm_cache
+from assistant.clients import get_chat_model
+from assistant.configuration import Configuration
+from assistant.structured import schema_format
+
+# Short JSON calls (query writing, reflection) go before long summarization calls
+PRIORITY_JSON = 0
+PRIORITY_SUMMARY = 1
+
+# JSON replies are never streamed as progress, even when a node runs them
+# next to its summarizer call (e.g. speculative queries in pipelined mode)
+_JSON_CALL_CONFIG = {"tags": [TAG_NOSTREAM]}
+
+# Prompt tokens the summarizer adds on top of context_token_budget (instructions, tags)
+_PROMPT_OVERHEAD_TOKENS = 1024
+# Reply allowance when summary_num_predict does not cap the summary
+_DEFAULT_REPLY_TOKENS = 2048
+# Weight of the latest call in a model's moving-average latency
+_LATENCY_SMOOTHING = 0.3
+
+class _Waiter:
+    __slots__ = ("event", "future", "loop", "granted", "cancelled")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self) -> bool:
+        """Signal the waiter; False if its event loop is gone."""
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+            return True
+        except RuntimeError:
+            return False
+
+class PrioritySlots:
+    """Caps in-flight requests, handing free slots to the highest-priority waiter first.
+
+    Works for threads and event loops at the same time, so the sync and async
+    graphs of one process share the cap. Waiters of equal priority are served
+    in arrival order.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._order = itertools.count()
+
+    def _grant_locked(self) -> None:
+        """Hand free slots to waiting callers, best priority first (lock held)."""
+        while self._waiters and self.in_flight < self.limit:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled:
+                continue
+            waiter.granted = waiter.wake()
+            if waiter.granted:
+                self.in_flight += 1
+
+    def _enqueue(self, priority: int, waiter: _Waiter) -> bool:
+        """Take a slot right away, or queue the waiter; True if a slot was taken."""
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return True
+            heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+            return False
+
+    def acquire(self, priority: int) -> None:
+        """Wait for a slot, giving up when the session is cancelled or a deadline passes."""
+        waiter = _Waiter()
+        if self._enqueue(priority, waiter):
+            return
+        scope = deadline.current()
+        remove = scope.on_cancel(waiter.event.set) if scope is not None else (lambda: None)
+        try:
+            timeout = deadline.remaining()
+            waiter.event.wait(max(0.0, timeout) if timeout is not None else None)
+        finally:
+            remove()
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                # Drop out of the queue, so the slot goes to a caller still waiting
+                waiter.cancelled = True
+        if not granted:
+            deadline.check()
+            raise deadline.DeadlineExceeded("Gave up waiting for an Ollama slot")
+        # Cancelled just as the slot was handed over: pass it on
+        try:
+            deadline.check()
+        except BaseException:
+            self.release()
+            raise
+
+    async def aacquire(self, priority: int) -> None:
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._enqueue(priority, waiter):
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            # The slot was handed over just as the caller gave up: pass it on
+            if granted:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_locked()
+
+    def resize(self, limit: int) -> None:
+        """Change the cap; extra slots go to waiting callers right away."""
+        with self._lock:
+            self.limit = max(1, limit)
+            self._grant_locked()
+
+class LatencyTracker:
+    """Moving-average call latency of one model, deciding when to fall back from it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.average: Optional[float] = None
+        self.fallback_until = 0.0
+
+    def observe(self, seconds: float, budget: float, cooldown: float) -> None:
+        with self._lock:
+            if self.average is None:
+                self.average = seconds
+            else:
+                self.average += _LATENCY_SMOOTHING * (seconds - self.average)
+            if budget > 0 and self.average > budget:
+                # Use the fallback for a while, then measure the model afresh
+                self.fallback_until = time.monotonic() + cooldown
+                self.average = None
+
+    def in_fallback(self) -> bool:
+        return time.monotonic() < self.fallback_until
+
+class OllamaDispatcher:
+    """Schedules the chat calls of every session against one Ollama base URL.
+
+    At most ``limit`` requests are in flight, JSON calls are served before
+    summarization calls, and identical concurrent requests share one call.
+    """
+
+    def __init__(self, limit: int):
+        self.slots = PrioritySlots(limit)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, concurrent.futures.Future] = {}
+        self._latency: Dict[str, LatencyTracker] = {}
+
+    def latency(self, model: str) -> LatencyTracker:
+        """The latency tracker of a model served by this host."""
+        with self._lock:
+            return self._latency.setdefault(model, LatencyTracker())
+
+    def _join(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        """Return the in-flight future for `key` and whether the caller must run the call."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = self._in_flight[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: str, future: concurrent.futures.Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def invoke(self, model, messages: List[BaseMessage], priority: int, stats: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> BaseMessage:
+        key = request_key(model, messages)
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            stats["coalesced"] = True
+            try:
+                return future.result()
+            except (deadline.ResearchCancelled, deadline.DeadlineExceeded):
+                # The leader's session stopped; make the call unless this one did too
+                deadline.check()
+                stats.pop("coalesced", None)
+        try:
+            queued = time.perf_counter()
+            self.slots.acquire(priority)
+            stats["queued_seconds"] = round(time.perf_counter() - queued, 6)
+            try:
+                result = _stream_reply(model, messages, config)
+            finally:
+                self.slots.release()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ainvoke(self, model, messages: List[BaseMessage], priority: int, stats: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> BaseMessage:
+        key = request_key(model, messages)
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            stats["coalesced"] = True
+            try:
+                # Shielded, so a cancelled follower does not cancel the leader's call
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except (deadline.ResearchCancelled, deadline.DeadlineExceeded):
+                deadline.check()
+                stats.pop("coalesced", None)
+        try:
+            queued = time.perf_counter()
+            await self.slots.aacquire(priority)
+            stats["queued_seconds"] = round(time.perf_counter() - queued, 6)
+            try:
+                result = await model.ainvoke(messages, config)
+            finally:
+                self.slots.release()
+        except asyncio.CancelledError:
+            # Followers from other sessions make the call themselves instead
+            self._finish(key, future, error=deadline.ResearchCancelled("Coalesced call was cancelled"))
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+def _stream_reply(model, messages: List[BaseMessage], config: Optional[Dict[str, Any]] = None) -> BaseMessage:
+    """Stream a reply in the calling thread, checking the session's deadlines between chunks.
+
+    Giving up closes the stream, so Ollama stops generating and the caller's
+    slot is free again right away. Before the first chunk (while Ollama reads
+    the prompt) the client's transport ends the wait instead, by closing the
+    connection of a cancelled session or timing out at its deadline.
+    """
+    reply = None
+    try:
+        for chunk in model.stream(messages, config):
+            deadline.check()
+            reply = chunk if reply is None else reply + chunk
+    except Exception:
+        # A connection the transport closed or timed out is reported as the stop it was
+        deadline.check()
+        raise
+    if reply is None:
+        raise ValueError("No data received from Ollama stream")
+    return message_chunk_to_message(reply)
+
+def request_key(model, messages: List[BaseMessage]) -> str:
+    """Identity of a chat request: model, format, options and the message contents."""
+    payload = json.dumps({
+        "model": model.model,
+        "base_url": model.base_url,
+        "format": model.format,
+        "options": [model.num_ctx, model.num_predict, model.temperature],
+        "messages": [[message.type, message.content] for message in messages]
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+_dispatchers: Dict[str, OllamaDispatcher] = {}
+_dispatchers_lock = threading.Lock()
+
+def get_dispatcher(configurable: Configuration) -> OllamaDispatcher:
+    """Return the process-wide dispatcher for the configured Ollama base URL."""
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(configurable.ollama_base_url)
+        if dispatcher is None:
+            dispatcher = _dispatchers[configurable.ollama_base_url] = OllamaDispatcher(configurable.ollama_max_concurrency)
+        elif dispatcher.slots.limit != max(1, configurable.ollama_max_concurrency):
+            dispatcher.slots.resize(configurable.ollama_max_concurrency)
+        return dispatcher
+
+def model_options(configurable: Configuration, model: str) -> Dict[str, Any]:
+    """Keep-alive and context size for `model`, with its ollama_model_options overrides applied."""
+    num_ctx = configurable.ollama_num_ctx
+    if num_ctx <= 0:
+        # Fit the budgeted summarizer prompt and its reply, rounded up to whole KiB of tokens
+        reply = configurable.summary_num_predict if configurable.summary_num_predict > 0 else _DEFAULT_REPLY_TOKENS
+        num_ctx = -(-(configurable.context_token_budget + _PROMPT_OVERHEAD_TOKENS + reply) // 1024) * 1024
+    options = {"keep_alive": configurable.ollama_keep_alive, "num_ctx": num_ctx}
+    overrides = configurable.ollama_model_options
+    if isinstance(overrides, str):
+        overrides = json.loads(overrides) if overrides.strip() else {}
+    options.update((overrides or {}).get(model, {}))
+    return options
+
+def select_model(configurable: Configuration, json_mode: bool) -> Tuple[str, bool]:
+    """Pick the model for a call: the planner for JSON calls, the writer otherwise.
+
+    Returns:
+        tuple: (model name, whether the writer is over its latency budget and
+            the planner stands in for it)
+    """
+    planner = configurable.planner_llm or configurable.local_llm
+    if json_mode:
+        return planner, False
+    writer = configurable.writer_llm or configurable.local_llm
+    if configurable.writer_latency_budget > 0 and writer != planner:
+        if get_dispatcher(configurable).latency(writer).in_fallback():
+            return planner, True
+    return writer, False
+
+def chat_model(configurable: Configuration, model: str, json_mode: bool = False, schema: Optional[Type[BaseModel]] = None):
+    """Return the shared ChatOllama for a model and output format.
+
+    JSON calls are constrained to the JSON schema of `schema` when given and
+    json_schema_output is on, and to any JSON otherwise.
+    """
+    options = model_options(configurable, model)
+    num_predict = configurable.json_num_predict if json_mode else configurable.summary_num_predict
+    return get_chat_model(
+        configurable.ollama_base_url,
+        model,
+        json_mode=json_mode,
+        pool_size=configurable.http_pool_size,
+        keep_alive=options["keep_alive"],
+        num_ctx=options["num_ctx"],
+        num_predict=num_predict if num_predict > 0 else None,
+        timeout=configurable.node_timeout if configurable.node_timeout > 0 else None,
+        schema=schema_format(schema) if json_mode and schema is not None and configurable.json_schema_output else None
+    )
+
+def _prepare_call(configurable: Configuration, json_mode: bool, schema: Optional[Type[BaseModel]], stats: Dict[str, Any]):
+    """Select the model of a call and record the choice in `stats`."""
+    model, fallback = select_model(configurable, json_mode)
+    stats["model"] = model
+    if fallback:
+        stats["fallback"] = True
+    # Only the writer's own calls count towards its latency budget
+    track = not json_mode and not fallback and configurable.writer_latency_budget > 0
+    return chat_model(configurable, model, json_mode, schema), track
+
+def _observe_latency(configurable: Configuration, stats: Dict[str, Any], started: float) -> None:
+    # Only completed calls are samples: a failed call says nothing about how
+    # long the writer takes, and a cancelled one ended when the caller gave up
+    if stats.get("coalesced"):
+        return
+    seconds = time.perf_counter() - started - stats.get("queued_seconds", 0.0)
+    get_dispatcher(configurable).latency(stats["model"]).observe(
+        seconds, configurable.writer_latency_budget, configurable.writer_fallback_cooldown
+    )
+
+def _cached_reply(configurable: Configuration, llm, messages: List[BaseMessage], stats: Dict[str, Any]) -> Tuple[Optional[LLMCache], Optional[str], Optional[BaseMessage]]:
+    """Look the call up in the LLM response cache.
+
+    Returns:
+        tuple: (cache or None when disabled, request key, cached reply or None)
+    """
+    cache = get_llm_cache(configurable)
+    if cache is None:
+        return None, None, None
+    key = request_key(llm, messages)
+    content = cache.get(key)
+    if content is None:
+        return cache, key, None
+    stats["cached"] = True
+    return cache, key, AIMessage(content=content)
+
+def invoke_chat(configurable: Configuration, messages: List[BaseMessage], json_mode: bool = False, stats: Optional[Dict[str, Any]] = None, schema: Optional[Type[BaseModel]] = None) -> BaseMessage:
+    """Run one chat call through the dispatcher of the configured Ollama host.
+
+    `stats` receives the ``model`` used (and ``fallback`` when the planner
+    stood in for a slow writer), ``queued_seconds`` spent waiting for a slot,
+    ``coalesced`` when an identical in-flight call supplied the result, or
+    ``cached`` when the reply came from the LLM response cache. `schema` is
+    the reply model a JSON call is constrained to.
+    """
+    stats = stats if stats is not None else {}
+    llm, track = _prepare_call(configurable, json_mode, schema, stats)
+    cache, key, cached = _cached_reply(configurable, llm, messages, stats)
+    if cached is not None:
+        return cached
+    priority = PRIORITY_JSON if json_mode else PRIORITY_SUMMARY
+    started = time.perf_counter()
+    result = get_dispatcher(configurable).invoke(llm, messages, priority, stats, _JSON_CALL_CONFIG if json_mode else None)
+    if track:
+        _observe_latency(configurable, stats, started)
+    if cache is not None and not stats.get("coalesced"):
+        cache.set(key, stats["model"], result.content)
+    return result
+
+async def ainvoke_chat(configurable: Configuration, messages: List[BaseMessage], json_mode: bool = False, stats: Optional[Dict[str, Any]] = None, schema: Optional[Type[BaseModel]] = None) -> BaseMessage:
+    """Async counterpart of invoke_chat."""
+    stats = stats if stats is not None else {}
+    llm, track = _prepare_call(configurable, json_mode, schema, stats)
+    cache, key, cached = _cached_reply(configurable, llm, messages, stats)
+    if cached is not None:
+        return cached
+    priority = PRIORITY_JSON if json_mode else PRIORITY_SUMMARY
+    started = time.perf_counter()
+    result = await get_dispatcher(configurable).ainvoke(llm, messages, priority, stats, _JSON_CALL_CONFIG if json_mode else None)
+    if track:
+        _observe_latency(configurable, stats, started)
+    if cache is not None and not stats.get("coalesced"):
+        cache.set(key, stats["model"], result.content)
+    return result
@@ -0,0 +1,188 @@
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Recorder of the research session running in the current context. LangGraph
+# copies the context into the threads and tasks that run nodes, so everything a
+# session does is recorded without threading the recorder through every call.
+_current: contextvars.ContextVar[Optional["SessionMetrics"]] = contextvars.ContextVar("research_metrics", default=None)
+
+_COUNTERS = ("prompt_tokens", "completion_tokens", "bytes", "retries", "cached", "repaired")
+
+class SessionMetrics:
+    """Timings and counters for the node, LLM and search calls of one research session."""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.started = time.time()
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, name: str, seconds: float, **fields: Any) -> None:
+        """Record one call of `kind` ("node", "llm", "search", "speculation" or "parse") named `name`."""
+        event = {"kind": kind, "name": name, "seconds": round(seconds, 6), "timestamp": time.time()}
+        event.update({key: value for key, value in fields.items() if value is not None})
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate the events per kind and name."""
+        stages: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            stage = stages.setdefault(f"{event['kind']}:{event['name']}", {
+                "kind": event["kind"], "name": event["name"], "calls": 0, "errors": 0,
+                "total_seconds": 0.0, "max_seconds": 0.0, **{counter: 0 for counter in _COUNTERS}
+            })
+            stage["calls"] += 1
+            stage["errors"] += 1 if event.get("error") else 0
+            stage["total_seconds"] += event["seconds"]
+            stage["max_seconds"] = max(stage["max_seconds"], event["seconds"])
+            for counter in _COUNTERS:
+                stage[counter] += event.get(counter) or 0
+        for stage in stages.values():
+            stage["mean_seconds"] = round(stage["total_seconds"] / stage["calls"], 6)
+            stage["total_seconds"] = round(stage["total_seconds"], 6)
+        summary = {
+            "session_id": self.session_id,
+            "wall_seconds": round(time.time() - self.started, 6),
+            "stages": sorted(stages.values(), key=lambda stage: stage["total_seconds"], reverse=True)
+        }
+        # Outcomes of the next-loop prefetches of pipelined research
+        outcomes = {stage["name"]: stage["calls"] for stage in stages.values() if stage["kind"] == "speculation"}
+        if outcomes:
+            speculated = sum(outcomes.values())
+            summary["speculation"] = {
+                "hits": outcomes.get("hit", 0),
+                "misses": outcomes.get("miss", 0),
+                "cancelled": outcomes.get("cancelled", 0),
+                "hit_rate": round(outcomes.get("hit", 0) / speculated, 3)
+            }
+        # Outcomes of parsing the JSON replies of query writing and reflection
+        parses = [stage for stage in stages.values() if stage["kind"] == "parse"]
+        if parses:
+            replies = sum(stage["calls"] for stage in parses)
+            failed = sum(stage["errors"] for stage in parses)
+            summary["parsing"] = {
+                "replies": replies,
+                "repaired": sum(stage["repaired"] for stage in parses),
+                "failed": failed,
+                "failure_rate": round(failed / replies, 3)
+            }
+        return summary
+
+    def to_jsonl(self) -> str:
+        """One JSON document per recorded event."""
+        with self._lock:
+            return "".join(json.dumps({"session_id": self.session_id, **event}) + "\n" for event in self.events)
+
+class MetricsRegistry:
+    """Process-wide totals across sessions, exported in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions = 0
+        self.stages: Dict[tuple, Dict[str, float]] = {}
+
+    def add(self, metrics: SessionMetrics) -> None:
+        with self._lock:
+            self.sessions += 1
+            for stage in metrics.summary()["stages"]:
+                totals = self.stages.setdefault((stage["kind"], stage["name"]), {})
+                for key in ("calls", "errors", "total_seconds") + _COUNTERS:
+                    totals[key] = totals.get(key, 0) + stage[key]
+
+    def to_prometheus(self) -> str:
+        metrics = [
+            ("research_stage_calls_total", "calls", "Number of calls per research stage"),
+            ("research_stage_errors_total", "errors", "Number of failed calls per research stage"),
+            ("research_stage_seconds_total", "total_seconds", "Wall time spent per research stage"),
+            ("research_llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens reported by Ollama"),
+            ("research_llm_completion_tokens_total", "completion_tokens", "Completion tokens reported by Ollama"),
+            ("research_search_bytes_total", "bytes", "Bytes of search results fetched"),
+            ("research_retries_total", "retries", "Retried calls per research stage"),
+            ("research_llm_cached_total", "cached", "LLM calls answered from the response cache"),
+            ("research_json_repaired_total", "repaired", "JSON replies parsed only after repair"),
+        ]
+        with self._lock:
+            lines = [
+                "# HELP research_sessions_total Research sessions completed by this process",
+                "# TYPE research_sessions_total counter",
+                f"research_sessions_total {self.sessions}",
+            ]
+            for metric, key, help_text in metrics:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for (kind, name), totals in sorted(self.stages.items()):
+                    lines.append(f'{metric}{{kind="{kind}",name="{name}"}} {totals.get(key, 0):g}')
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def current_metrics() -> Optional[SessionMetrics]:
+    """The recorder of the session running in this context, if any."""
+    return _current.get()
+
+@contextmanager
+def collect_metrics(session_id: Optional[str] = None) -> Iterator[SessionMetrics]:
+    """Record the metrics of everything run inside the block into a new SessionMetrics."""
+    metrics = SessionMetrics(session_id)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        registry.add(metrics)
+
+def record(kind: str, name: str, seconds: float, **fields: Any) -> None:
+    """Record a call on the current session, if metrics are being collected."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record(kind, name, seconds, **fields)
+
+@contextmanager
+def timed(kind: str, name: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """Time the block and record it on the current session.
+
+    Yields the event fields, so the block can add counters such as ``bytes``
+    once it knows them. Exceptions are recorded as ``error`` and re-raised.
+    """
+    fields = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields["error"] = type(e).__name__
+        raise
+    finally:
+        record(kind, name, time.perf_counter() - start, **fields)
+
+def timed_node(name: str, node: Callable) -> Callable:
+    """Wrap a sync or async graph node so each invocation is recorded as a "node" event."""
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def _anode(*args, **kwargs):
+            with timed("node", name):
+                return await node(*args, **kwargs)
+        return _anode
+
+    @functools.wraps(node)
+    def _node(*args, **kwargs):
+        with timed("node", name):
+            return node(*args, **kwargs)
+    return _node
+
+def llm_token_counts(message: Any) -> Dict[str, Optional[int]]:
+    """Prompt and completion token counts from a ChatOllama response."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    metadata = getattr(message, "response_metadata", None) or {}
+    return {
+        "prompt_tokens": usage.get("input_tokens", metadata.get("prompt_eval_count")),
+        "completion_tokens": usage.get("output_tokens", metadata.get("eval_count")),
+    }
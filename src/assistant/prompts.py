@@ -23,6 +23,32 @@ Example output:
 
 Provide your response in JSON format:"""
 
+multi_query_writer_instructions="""Your goal is to generate {number_of_queries} targeted web search queries.
+The queries will gather information related to a specific topic, each one covering a different aspect of it.
+
+<TOPIC>
+{research_topic}
+</TOPIC>
+
+<FORMAT>
+Format your response as a JSON object with this exact key:
+   - "queries": A list of {number_of_queries} objects, each with the keys:
+       - "query": The actual search query string
+       - "aspect": The specific aspect of the topic being researched
+</FORMAT>
+
+<EXAMPLE>
+Example output:
+{{
+    "queries": [
+        {{"query": "machine learning transformer architecture explained", "aspect": "technical architecture"}},
+        {{"query": "transformer model training cost benchmarks", "aspect": "performance"}}
+    ]
+}}
+</EXAMPLE>
+
+Provide your response in JSON format:"""
+
 summarizer_instructions="""
 <GOAL>
 Generate a high-quality summary of the web search results and keep it concise / related to the user topic.
@@ -74,4 +100,62 @@ Example output:
 }}
 </EXAMPLE>
 
-Provide your analysis in JSON format:"""
\ No newline at end of file
+Provide your analysis in JSON format:"""
+
+multi_reflection_instructions = """You are an expert research assistant analyzing a summary about {research_topic}.
+
+<GOAL>
+1. Identify {number_of_queries} distinct knowledge gaps or areas that need deeper exploration
+2. Generate one follow-up question per gap that would help expand your understanding
+3. Focus on technical details, implementation specifics, or emerging trends that weren't fully covered
+</GOAL>
+
+<REQUIREMENTS>
+Ensure each follow-up question is self-contained and includes necessary context for web search.
+</REQUIREMENTS>
+
+<FORMAT>
+Format your response as a JSON object with these exact keys:
+- knowledge_gaps: A list describing what information is missing or needs clarification
+- follow_up_queries: A list of {number_of_queries} specific questions, one per gap
+</FORMAT>
+
+<EXAMPLE>
+Example output:
+{{
+    "knowledge_gaps": ["The summary lacks performance benchmarks", "Deployment costs are not covered"],
+    "follow_up_queries": ["What are typical performance benchmarks for [specific technology]?", "How much does it cost to deploy [specific technology] in production?"]
+}}
+</EXAMPLE>
+
+Provide your analysis in JSON format:"""
+delta_note_instructions = """
+<GOAL>
+Extract the facts from the web search results that are relevant to the user topic, as a short research note.
+</GOAL>
+
+<REQUIREMENTS>
+1. Write at most {note_words} words as a list of concise bullet points.
+2. Keep specific details: names, numbers, dates and how things work.
+3. Skip anything that is not relevant to the user topic.
+4. If the results contain nothing relevant, reply with exactly: NO NEW INFORMATION
+</REQUIREMENTS>
+
+<FORMATTING>
+- Start directly with the bullet points, without preamble or titles. Do not use XML tags in the output.
+</FORMATTING>"""
+
+merge_notes_instructions = """
+<GOAL>
+Merge the research notes into a single high-quality summary of the user topic.
+</GOAL>
+
+<REQUIREMENTS>
+1. Use every relevant fact from the notes; do not add information that is not in them.
+2. Combine points about the same subject and drop repeated facts.
+3. Organize the summary into coherent paragraphs with a smooth flow of information.
+</REQUIREMENTS>
+
+<FORMATTING>
+- Start directly with the summary, without preamble or titles. Do not use XML tags in the output.
+</FORMATTING>"""
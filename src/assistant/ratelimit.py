@@ -0,0 +1,191 @@
+import asyncio
+import email.utils
+import random
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import requests
+
+from assistant import deadline
+
+T = TypeVar("T")
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+class TokenBucket:
+    """Thread-safe token bucket with AIMD rate adaptation.
+
+    Callers reserve a token and sleep for the returned wait, so waiters are
+    served in order and the lock is never held while sleeping. After a 429 the
+    rate is halved (down to a quarter of the configured rate); every success then
+    raises it back by a twentieth of the configured rate.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def configure(self, rate: float, burst: int = 1) -> None:
+        """Set the configured rate (requests per second, 0 for unlimited) and burst size."""
+        with self._lock:
+            self.max_rate = max(0.0, rate)
+            self.rate = self.max_rate
+            self.burst = max(1, burst)
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def penalize(self) -> None:
+        """Back off after the provider signalled rate limiting."""
+        with self._lock:
+            if self.max_rate > 0:
+                self.rate = max(self.max_rate / 4, self.rate / 2)
+
+    def reward(self) -> None:
+        """Recover towards the configured rate after a successful call."""
+        with self._lock:
+            if self.max_rate > 0:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status code carried by a provider client exception, if any."""
+    # Only a loaded Tavily SDK can have raised its errors, so it is not imported here
+    tavily_errors = sys.modules.get("tavily.errors")
+    if tavily_errors is not None and isinstance(error, tavily_errors.UsageLimitExceededError):
+        return 429
+    if isinstance(error, (requests.HTTPError, httpx.HTTPStatusError)) and error.response is not None:
+        return error.response.status_code
+    return None
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from the Retry-After header of the failed response, if present."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None and getattr(response, "headers", None) is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed when repeated."""
+    if isinstance(error, (requests.ConnectionError, httpx.ConnectError, httpx.RemoteProtocolError)):
+        return True
+    return status_code(error) in RETRY_STATUS_CODES
+
+class RateLimiter:
+    """Rate limit and retry policy for one search provider."""
+
+    def __init__(self, rate: float, burst: int, max_retries: int, backoff_base: float, backoff_max: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.configure(rate, burst, max_retries, backoff_base, backoff_max)
+
+    def configure(self, rate: float, burst: int, max_retries: int, backoff_base: float, backoff_max: float) -> None:
+        if (rate, burst) != (self.bucket.max_rate, self.bucket.burst):
+            self.bucket.configure(rate, burst)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retry number `attempt` (from 0), or None to give up.
+
+        A provider's Retry-After is honored in full; only the computed
+        exponential backoff is capped at `backoff_max`. Gives up when the
+        retry could not start before the node or session deadline.
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        if status_code(error) == 429:
+            self.bucket.penalize()
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter: spread retries of concurrent sessions over the window
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        remaining = deadline.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    def call(self, fn: Callable[[], T], stats: Optional[Dict[str, Any]] = None) -> T:
+        """Call `fn` within the rate limit, retrying transient failures.
+
+        The number of retries is stored under ``"retries"`` in `stats`.
+        """
+        attempt = 0
+        while True:
+            # Waits end early when the session is cancelled, e.g. a long Retry-After
+            deadline.sleep(self.bucket.reserve())
+            try:
+                result = fn()
+                self.bucket.reward()
+                return result
+            except Exception as e:
+                delay = self.backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                if stats is not None:
+                    stats["retries"] = attempt
+                deadline.sleep(delay)
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], stats: Optional[Dict[str, Any]] = None) -> T:
+        """Async counterpart of call."""
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.bucket.reserve())
+            try:
+                result = await fn()
+                self.bucket.reward()
+                return result
+            except Exception as e:
+                delay = self.backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                if stats is not None:
+                    stats["retries"] = attempt
+                await asyncio.sleep(delay)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(configurable, provider: str) -> RateLimiter:
+    """Return the process-wide limiter of a search provider, updated to the Configuration.
+
+    Every session of the process shares it, so concurrent sessions together
+    stay within the provider's limit.
+    """
+    settings = (
+        getattr(configurable, f"{provider}_rate_limit"),
+        configurable.rate_limit_burst,
+        configurable.search_max_retries,
+        configurable.search_backoff_base,
+        configurable.search_backoff_max
+    )
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = RateLimiter(*settings)
+        else:
+            limiter.configure(*settings)
+        return limiter
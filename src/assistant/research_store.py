@@ -0,0 +1,203 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from assistant.cache import connect_sqlite
+from assistant.context import query_terms, split_passages
+from assistant.dedup import canonicalize_url
+
+# Stored passages are split on sentence boundaries to about this many tokens
+PASSAGE_TOKENS = 200
+# Stored topics ranked by BM25 that are compared term by term with a new topic
+_TOPIC_CANDIDATES = 20
+# Passages read per BM25 page for each one returned, leaving room for excluded URLs
+_PASSAGE_CANDIDATES = 4
+
+def _match_expression(terms: List[str]) -> str:
+    """FTS5 query matching any of `terms`; quoting keeps them from being read as operators."""
+    return " OR ".join(f'"{term}"' for term in terms)
+
+class ResearchStore:
+    """Disk-backed store of finished research summaries and fetched source passages.
+
+    Both are indexed with SQLite FTS5, so near-duplicate topics and passages
+    relevant to a search query are found by BM25 ranking without an embedding
+    model. Passages are deduplicated by content; the oldest are evicted beyond
+    `max_passages`. The store is safe to share between threads of one process.
+    """
+
+    def __init__(self, path: str, max_passages: int = 100000):
+        self.path = path
+        self.max_passages = max_passages
+        self.summary_hits = 0
+        self.summary_misses = 0
+        self.passages_served = 0
+        self._lock = threading.Lock()
+
+        self._conn = connect_sqlite(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " id INTEGER PRIMARY KEY,"
+            " topic TEXT NOT NULL,"
+            " terms TEXT NOT NULL,"
+            " summary TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5("
+            " terms, content='summaries', content_rowid='id');"
+            "CREATE TRIGGER IF NOT EXISTS summaries_ai AFTER INSERT ON summaries BEGIN"
+            " INSERT INTO summaries_fts (rowid, terms) VALUES (new.id, new.terms); END;"
+            "CREATE TRIGGER IF NOT EXISTS summaries_ad AFTER DELETE ON summaries BEGIN"
+            " INSERT INTO summaries_fts (summaries_fts, rowid, terms) VALUES ('delete', old.id, old.terms); END;"
+            "CREATE TABLE IF NOT EXISTS passages ("
+            " id INTEGER PRIMARY KEY,"
+            " hash TEXT NOT NULL UNIQUE,"
+            " url TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5("
+            " title, text, content='passages', content_rowid='id', tokenize='porter unicode61');"
+            "CREATE TRIGGER IF NOT EXISTS passages_ai AFTER INSERT ON passages BEGIN"
+            " INSERT INTO passages_fts (rowid, title, text) VALUES (new.id, new.title, new.text); END;"
+            "CREATE TRIGGER IF NOT EXISTS passages_ad AFTER DELETE ON passages BEGIN"
+            " INSERT INTO passages_fts (passages_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text); END;"
+        )
+        self._conn.commit()
+        self._passages = self._conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+
+    def add_summary(self, topic: str, summary: str) -> None:
+        """Store the final summary of a topic, replacing an earlier one with the same terms."""
+        terms = " ".join(sorted(set(query_terms(topic))))
+        if not terms or not summary:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries WHERE terms = ?", (terms,))
+            self._conn.execute(
+                "INSERT INTO summaries (topic, terms, summary, created_at) VALUES (?, ?, ?, ?)",
+                (topic, terms, summary, time.time())
+            )
+            self._conn.commit()
+
+    def find_summary(self, topic: str, threshold: float, max_age: float) -> Optional[Dict[str, Any]]:
+        """Return the stored summary of the most similar topic, or None below `threshold`.
+
+        Returns:
+            dict: ``topic``, ``summary``, ``created_at`` and ``similarity`` of the match
+        """
+        terms = sorted(set(query_terms(topic)))
+        best = None
+        if terms:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT s.topic, s.terms, s.summary, s.created_at FROM summaries_fts"
+                    " JOIN summaries s ON s.id = summaries_fts.rowid"
+                    " WHERE summaries_fts MATCH ? AND s.created_at >= ?"
+                    " ORDER BY bm25(summaries_fts) LIMIT ?",
+                    (_match_expression(terms), time.time() - max_age, _TOPIC_CANDIDATES)
+                ).fetchall()
+            wanted = set(terms)
+            for stored_topic, stored_terms, summary, created_at in rows:
+                candidate = set(stored_terms.split())
+                similarity = len(wanted & candidate) / len(wanted | candidate)
+                if similarity >= threshold and (best is None or similarity > best["similarity"]):
+                    best = {"topic": stored_topic, "summary": summary, "created_at": created_at, "similarity": round(similarity, 3)}
+        with self._lock:
+            if best is None:
+                self.summary_misses += 1
+            else:
+                self.summary_hits += 1
+        return best
+
+    def add_passages(self, topic: str, sources: List[Dict[str, Any]]) -> int:
+        """Split the page text (or snippet) of search results into passages and store the new ones.
+
+        Returns:
+            int: Number of passages added
+        """
+        now = time.time()
+        rows = []
+        for source in sources:
+            text = source.get("raw_content") or source.get("content") or ""
+            for passage in split_passages(text, PASSAGE_TOKENS):
+                rows.append((hashlib.sha256(passage.encode("utf-8")).hexdigest(), source["url"], source.get("title") or "", passage, topic, now))
+        if not rows:
+            return 0
+        with self._lock:
+            # rowcount, unlike total_changes, leaves out the rows the FTS triggers write
+            added = self._conn.executemany(
+                "INSERT OR IGNORE INTO passages (hash, url, title, text, topic, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            ).rowcount
+            self._passages += added
+            if self._passages > self.max_passages:
+                self._conn.execute(
+                    "DELETE FROM passages WHERE id IN (SELECT id FROM passages ORDER BY id ASC LIMIT ?)",
+                    (self._passages - self.max_passages,)
+                )
+                self._passages = self.max_passages
+            self._conn.commit()
+        return added
+
+    def search_passages(self, query: str, limit: int, exclude_urls: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Return up to `limit` stored passages for `query`, best BM25 match first.
+
+        Passages of pages whose canonical URL is in `exclude_urls` are skipped.
+        Each passage carries ``url``, ``title``, ``text`` and ``coverage``, the
+        share of the query terms it contains.
+        """
+        terms = sorted(set(query_terms(query)))
+        if not terms or limit <= 0:
+            return []
+        passages = []
+        page = max(1, limit * _PASSAGE_CANDIDATES)
+        offset = 0
+        while len(passages) < limit:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT p.url, p.title, p.text FROM passages_fts"
+                    " JOIN passages p ON p.id = passages_fts.rowid"
+                    " WHERE passages_fts MATCH ?"
+                    " ORDER BY bm25(passages_fts) LIMIT ? OFFSET ?",
+                    (_match_expression(terms), page, offset)
+                ).fetchall()
+            for url, title, text in rows:
+                if exclude_urls and canonicalize_url(url) in exclude_urls:
+                    continue
+                words = set(query_terms(f"{title} {text}"))
+                passages.append({"url": url, "title": title, "text": text, "coverage": sum(term in words for term in terms) / len(terms)})
+                if len(passages) == limit:
+                    break
+            if len(rows) < page:
+                break
+            offset += page
+        with self._lock:
+            self.passages_served += len(passages)
+        return passages
+
+    def stats(self) -> Dict[str, int]:
+        """Return summary hit/miss counters, passages served and the number of stored entries."""
+        with self._lock:
+            summaries = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            return {
+                "summary_hits": self.summary_hits, "summary_misses": self.summary_misses,
+                "passages_served": self.passages_served, "summaries": summaries, "passages": self._passages
+            }
+
+_stores: Dict[str, ResearchStore] = {}
+_stores_lock = threading.Lock()
+
+def get_research_store(configurable) -> Optional[ResearchStore]:
+    """Return the process-wide research store for a Configuration, or None when it is disabled."""
+    if not configurable.research_store_enabled:
+        return None
+    path = os.path.abspath(os.path.expanduser(configurable.research_store_path))
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ResearchStore(path, configurable.research_store_max_passages)
+        else:
+            store.max_passages = configurable.research_store_max_passages
+        return store
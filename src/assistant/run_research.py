@@ -1,43 +1,584 @@
+import argparse
+import contextlib
 import json
+import os
+import signal
+import socketserver
 import sys
+import threading
+import time
 import warnings
-from assistant.graph import graph
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from assistant import deadline, speculation as speculations
+from assistant.cache import get_llm_cache, get_search_cache
+from assistant.checkpoint import delete_session, get_checkpointed_graph
+from assistant.configuration import Configuration
+from assistant.graph import get_graph
+from assistant.metrics import collect_metrics, registry, timed
+from assistant.research_store import get_research_store
 
 # Filter out warnings so they don't interfere with JSON output
 warnings.filterwarnings('ignore')
 
-def main():
+def build_config(max_loops=None, llm_model=None, search_api=None, overrides=None, session_id=None, planner_llm=None, writer_llm=None):
+    """Build the RunnableConfig passed to the compiled graph."""
+    configurable = {}
+    if max_loops is not None:
+        configurable['max_web_research_loops'] = int(max_loops)
+    if llm_model:
+        configurable['local_llm'] = llm_model
+    if planner_llm:
+        configurable['planner_llm'] = planner_llm
+    if writer_llm:
+        configurable['writer_llm'] = writer_llm
+    if search_api:
+        configurable['search_api'] = search_api
+    if overrides:
+        configurable.update(overrides)
+    if session_id:
+        # Sessions with an id are checkpointed under it and can be resumed
+        configurable['thread_id'] = session_id
+    return {'configurable': configurable}
+
+def _reused_summary(topic, config):
+    """Look up a stored summary of a near-identical topic in the research store.
+
+    Returns:
+        dict: Response serving the stored summary, or None to research the topic
+    """
+    configurable = Configuration.from_runnable_config(config)
+    store = get_research_store(configurable)
+    if store is None or not configurable.summary_reuse:
+        return None
+    with timed('search', 'summary_lookup'):
+        match = store.find_summary(topic, configurable.summary_match_threshold, configurable.summary_max_age)
+    if match is None:
+        return None
+    return {
+        'summary': match['summary'],
+        'reused_from': {
+            'topic': match['topic'],
+            'created_at': datetime.fromtimestamp(match['created_at'], timezone.utc).isoformat(),
+            'similarity': match['similarity']
+        }
+    }
+
+def _prepare_run(topic, config, resume):
+    """Pick the graph and input for a run.
+
+    Returns:
+        tuple: (graph, input, finished response) where the response is set when
+            a resumed session had already completed or a stored summary of a
+            near-identical topic answers a new run
+    """
+    session_id = config['configurable'].get('thread_id')
+    if not session_id:
+        if resume:
+            raise ValueError("Resuming requires a session id")
+        reused = _reused_summary(topic, config)
+        if reused is not None:
+            return None, None, reused
+        return get_graph(), {'research_topic': topic}, None
+
+    session_graph = get_checkpointed_graph(Configuration.from_runnable_config(config).checkpoint_path)
+    snapshot = session_graph.get_state(config)
+    if not resume:
+        # Reusing a session id would merge into the old run's accumulated state
+        if snapshot.values:
+            raise ValueError(f"Research session '{session_id}' already exists; resume it or use a new session id")
+        return session_graph, {'research_topic': topic}, _reused_summary(topic, config)
+    if not snapshot.values:
+        raise ValueError(f"No checkpoint found for research session '{session_id}'")
+    if not snapshot.next:
+        # Finished before its checkpoints could be deleted, or kept on purpose
+        _drop_finished_session(config)
+        return session_graph, None, {'summary': snapshot.values.get('running_summary') or 'No summary available'}
+    # None input continues from the last completed node
+    return session_graph, None, None
+
+def _drop_finished_session(config):
+    """Delete the checkpoints of a session that ran to completion, unless keep_finished_sessions is set.
+
+    Failed runs keep theirs so they can be resumed; without this, every run of
+    a long-lived server would stay in the checkpoint database.
+    """
+    session_id = config['configurable'].get('thread_id')
+    configurable = Configuration.from_runnable_config(config)
+    if not session_id or configurable.keep_finished_sessions:
+        return
     try:
-        topic = sys.argv[1]
-        max_loops = int(sys.argv[2])
-        llm_model = sys.argv[3]
-        search_api = sys.argv[4]
-
-        result = graph.invoke(
-            {'research_topic': topic}, 
-            {'configurable': {
-                'max_web_research_loops': max_loops, 
-                'local_llm': llm_model, 
-                'search_api': search_api
-            }}
-        )
-        # Ensure we're writing to stderr for logs and stdout for JSON only
-        print(json.dumps({'summary': result.get('running_summary', 'No summary available')}), flush=True)
+        delete_session(configurable.checkpoint_path, session_id)
     except Exception as e:
-        # Try to extract any partial results from the graph state
+        print(f"Warning: could not delete checkpoints of session {session_id}: {e}", file=sys.stderr)
+
+def _with_session(response, config):
+    session_id = config['configurable'].get('thread_id')
+    return {**response, 'session_id': session_id} if session_id else response
+
+_export_lock = threading.Lock()
+
+def export_metrics(metrics, configurable):
+    """Write a finished session's metrics to ``configurable.metrics_path``, if set."""
+    if not configurable.metrics_path:
+        return
+    path = os.path.expanduser(configurable.metrics_path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _export_lock:
+        if configurable.metrics_format == 'prometheus':
+            # Rewrite atomically so a scraper never reads a half-written file
+            with open(f"{path}.tmp", 'w') as f:
+                f.write(registry.to_prometheus())
+            os.replace(f"{path}.tmp", path)
+        else:
+            with open(path, 'a') as f:
+                f.write(metrics.to_jsonl())
+
+def _with_metrics(response, metrics, config):
+    """Attach the session metrics (and cache and research store stats) to a response and export them."""
+    configurable = Configuration.from_runnable_config(config)
+    record = metrics.summary()
+    cache = get_search_cache(configurable)
+    if cache:
+        record['search_cache'] = cache.stats()
+    llm_cache = get_llm_cache(configurable)
+    if llm_cache:
+        record['llm_cache'] = llm_cache.stats()
+    store = get_research_store(configurable)
+    if store:
+        record['research_store'] = store.stats()
+    try:
+        export_metrics(metrics, configurable)
+    except OSError as e:
+        print(f"Warning: could not export metrics: {e}", file=sys.stderr)
+    return {**response, 'metrics': record}
+
+def research(topic, config, resume=False):
+    """Run (or resume) one research session and return the JSON-serialisable response.
+
+    The response carries a ``metrics`` record with the wall time, token counts
+    and bytes fetched per node, LLM call and search. A session cancelled by
+    the caller or running past ``research_timeout`` returns the summary so far.
+    """
+    research_timeout = Configuration.from_runnable_config(config).research_timeout
+    with collect_metrics(config['configurable'].get('thread_id')) as metrics, deadline.session(research_timeout) as scope:
         try:
-            partial_result = graph.get_state()
-            summary = partial_result.get('running_summary', '')
+            response = _research(topic, config, resume)
+        finally:
+            # A prefetch the session never claimed (it failed or stopped) is not needed
+            speculations.release(scope)
+    return _with_metrics(response, metrics, config)
+
+def _research(topic, config, resume):
+    session_graph = None
+    try:
+        session_graph, graph_input, finished = _prepare_run(topic, config, resume)
+        if finished is not None:
+            return _with_session(finished, config)
+        result = session_graph.invoke(graph_input, config)
+        _drop_finished_session(config)
+        response = {'summary': result.get('running_summary', 'No summary available')}
+        if result.get('stop_reason'):
+            response['stop_reason'] = result['stop_reason']
+        return _with_session(response, config)
+    except Exception as e:
+        # Only sessions with an id are checkpointed, so only they keep partial results
+        if session_graph is not None and config['configurable'].get('thread_id'):
+            try:
+                summary = session_graph.get_state(config).values.get('running_summary', '')
+            except Exception as state_error:
+                print(f"Warning: could not read the partial results of the session: {state_error}", file=sys.stderr)
+                summary = ''
             if summary:
-                print(json.dumps({
+                return _with_session({
                     'summary': f"{summary}\n\nNote: Research process ended early due to error: {str(e)}",
                     'error': str(e)
-                }), flush=True)
-                return
-        except:
-            pass
+                }, config)
         # If we couldn't get partial results, just return the error
-        print(json.dumps({'error': str(e)}), flush=True)
+        return _with_session({'error': str(e)}, config)
+
+def stream_research(topic, config, resume=False):
+    """Run one research session, yielding progress events as they happen.
+
+    Events are dicts with an ``event`` key: ``node_start``/``node_end`` per node,
+    ``search_queries`` with the generated queries, ``sources`` with the sources
+    found in a loop (plus running totals of duplicates skipped and tokens
+    saved) and ``token`` with output chunks of the summarizer (and, with the
+    incremental strategy, of the final note merge). The last event is always
+    ``result``, carrying the same fields research() returns, including
+    ``stop_reason`` and ``metrics``.
+    """
+    result = None
+    research_timeout = Configuration.from_runnable_config(config).research_timeout
+    with collect_metrics(config['configurable'].get('thread_id')) as metrics, deadline.session(research_timeout) as scope:
+        try:
+            for event in _stream_research(topic, config, resume):
+                if event.get('event') == 'result':
+                    result = event
+                else:
+                    yield event
+        finally:
+            speculations.release(scope)
+    yield _with_metrics(result, metrics, config)
+
+def _stream_research(topic, config, resume):
+    running_summary = None
+    stop_reason = None
+    try:
+        session_graph, graph_input, finished = _prepare_run(topic, config, resume)
+        if finished is not None:
+            yield _with_session({'event': 'result', **finished}, config)
+            return
+        for mode, data in session_graph.stream(graph_input, config, stream_mode=['tasks', 'updates', 'messages']):
+            if mode == 'tasks':
+                if 'result' in data:
+                    event = {'event': 'node_end', 'node': data['name']}
+                    if data.get('error'):
+                        event['error'] = str(data['error'])
+                    yield event
+                else:
+                    yield {'event': 'node_start', 'node': data['name']}
+            elif mode == 'updates':
+                for node, update in data.items():
+                    if not isinstance(update, dict):
+                        continue
+                    if update.get('search_query'):
+                        yield {'event': 'search_queries', 'node': node, 'queries': update.get('search_queries') or [update['search_query']]}
+                    if node == 'web_research':
+                        event = {'event': 'sources', 'loop': update.get('research_loop_count'), 'sources': update.get('sources_gathered', [])}
+                        if 'duplicate_sources_dropped' in update:
+                            event['duplicates_dropped'] = update['duplicate_sources_dropped']
+                            event['tokens_saved'] = update['duplicate_tokens_saved']
+                        yield event
+                    if update.get('running_summary'):
+                        running_summary = update['running_summary']
+                    if update.get('stop_reason'):
+                        stop_reason = update['stop_reason']
+            elif mode == 'messages':
+                chunk, metadata = data
+                # Only the summarizer (and the note merge of the incremental strategy)
+                # produces prose; the JSON-mode calls are not streamed
+                node = metadata.get('langgraph_node')
+                if node in ('summarize_sources', 'finalize_summary') and chunk.content:
+                    yield {'event': 'token', 'node': node, 'content': chunk.content}
+        _drop_finished_session(config)
+        result = {'event': 'result', 'summary': running_summary or 'No summary available'}
+        if stop_reason:
+            result['stop_reason'] = stop_reason
+        yield _with_session(result, config)
+    except Exception as e:
+        # Streaming keeps the latest summary, so partial results survive a failure
+        if running_summary:
+            yield _with_session({
+                'event': 'result',
+                'summary': f"{running_summary}\n\nNote: Research process ended early due to error: {str(e)}",
+                'error': str(e)
+            }, config)
+        else:
+            yield _with_session({'event': 'result', 'error': str(e)}, config)
+
+def run_job(job, write):
+    """Run a single worker job.
+
+    Args:
+        job (dict): Job with an ``id``, a ``topic`` and optional ``max_loops``,
+            ``llm_model``, ``planner_llm``, ``writer_llm``, ``search_api``,
+            ``configurable`` overrides, a
+            ``session_id`` to checkpoint under, a ``resume`` flag to continue
+            that session, and a ``stream`` flag to emit progress events before
+            the result
+        write (Callable): Receives each response dict tagged with the job ``id``
+    """
+    job_id = job.get('id')
+    topic = job.get('topic')
+    resume = bool(job.get('resume'))
+    if not topic and not resume:
+        write({'id': job_id, 'error': 'Job is missing a research topic'})
+        return
+    config = build_config(
+        job.get('max_loops'),
+        job.get('llm_model'),
+        job.get('search_api'),
+        job.get('configurable'),
+        job.get('session_id'),
+        job.get('planner_llm'),
+        job.get('writer_llm')
+    )
+    if job.get('stream'):
+        for event in stream_research(topic, config, resume):
+            write({'id': job_id, **event})
+    else:
+        write({'id': job_id, **research(topic, config, resume)})
+
+class JobDispatcher:
+    """Runs NDJSON jobs on a shared thread pool against the already compiled graph.
+
+    Jobs share the process-wide search cache and pooled HTTP clients.
+    ``defaults`` fills in job fields (e.g. ``max_loops``) a job does not set;
+    its ``configurable`` overrides are merged with the job's own.
+    A ``{"cancel": id}`` line cancels the running job with that id, which then
+    answers with the summary it has so far.
+    """
+
+    def __init__(self, concurrency, defaults=None):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='research')
+        self.defaults = defaults or {}
+        self.closing = False
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def cancel(self, job_id):
+        """Cancel the running jobs with ``job_id``; returns whether there were any."""
+        with self._lock:
+            scopes = list(self._jobs.get(job_id, []))
+        for scope in scopes:
+            scope.cancel()
+        return bool(scopes)
+
+    def cancel_all(self):
+        """Cancel every running job and refuse new ones, e.g. on SIGTERM."""
+        with self._lock:
+            self.closing = True
+            scopes = [scope for job_scopes in self._jobs.values() for scope in job_scopes]
+        for scope in scopes:
+            scope.cancel()
+
+    def submit(self, line, write, default_id=None):
+        """Parse one NDJSON line and schedule it; ``write`` receives the response dict.
+
+        A line holding just a JSON string is a job for that topic. Jobs without
+        an ``id`` are tagged with ``default_id``.
+        """
+        line = line.strip()
+        if not line:
+            return
+        try:
+            job = json.loads(line)
+            if isinstance(job, str):
+                job = {'topic': job}
+            if not isinstance(job, dict):
+                raise ValueError("Job must be a JSON object")
+        except ValueError as e:
+            write({'id': default_id, 'error': f"Invalid job: {str(e)}"})
+            return
+        if 'cancel' in job and 'topic' not in job:
+            if not self.cancel(job['cancel']):
+                print(f"No running job to cancel: {job['cancel']}", file=sys.stderr, flush=True)
+            return
+        # A job's configurable overrides are laid over the default ones, not in place of them
+        configurable = {**self.defaults.get('configurable', {}), **(job.get('configurable') or {})}
+        job = {**self.defaults, **job}
+        if configurable:
+            job['configurable'] = configurable
+        if job.get('id') is None:
+            job['id'] = default_id
+        if self.closing:
+            write({'id': job['id'], 'error': 'Worker is shutting down'})
+            return
+
+        # Registered right away, so a job can be cancelled while it is queued
+        scope = deadline.Deadline()
+        with self._lock:
+            self._jobs.setdefault(job['id'], []).append(scope)
+
+        def _run():
+            try:
+                with deadline.scope(scope):
+                    run_job(job, write)
+            except Exception as e:
+                write({'id': job.get('id'), 'error': str(e)})
+            finally:
+                with self._lock:
+                    self._jobs[job['id']].remove(scope)
+                    if not self._jobs[job['id']]:
+                        del self._jobs[job['id']]
+
+        self.executor.submit(_run)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def _line_writer(stream):
+    """Return a thread-safe function writing one JSON document per line to ``stream``."""
+    lock = threading.Lock()
+
+    def write(response):
+        data = json.dumps(response)
+        with lock:
+            stream.write(data + "\n")
+            stream.flush()
+
+    return write
+
+def serve_stdio(dispatcher):
+    """Read jobs from stdin until EOF and write one result line per job to stdout."""
+    write = _line_writer(sys.stdout)
+    write({'ready': True})
+    try:
+        for line in sys.stdin:
+            dispatcher.submit(line, write)
+    finally:
+        dispatcher.shutdown()
+
+def run_batch(lines, dispatcher, write):
+    """Run every job of a JSONL batch, writing each result as soon as it completes.
+
+    Jobs without an ``id`` are tagged with their line number.
+
+    Returns:
+        tuple: (number of jobs, number of failed jobs)
+    """
+    counts = {'jobs': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def _write(response):
+        if 'event' not in response or response['event'] == 'result':
+            with lock:
+                counts['jobs'] += 1
+                counts['failed'] += 1 if response.get('error') else 0
+        write(response)
+
+    for number, line in enumerate(lines, 1):
+        dispatcher.submit(line, _write, default_id=number)
+    dispatcher.shutdown()
+    return counts['jobs'], counts['failed']
+
+def serve_socket(dispatcher, host, port):
+    """Accept NDJSON jobs over a local TCP socket, one result line per job per connection."""
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            stream = self.wfile
+            lock = threading.Lock()
+
+            def write(response):
+                with lock:
+                    try:
+                        stream.write((json.dumps(response) + "\n").encode('utf-8'))
+                        stream.flush()
+                    except (BrokenPipeError, ConnectionResetError, ValueError):
+                        pass  # Client went away; drop the result
+
+            for raw in self.rfile:
+                dispatcher.submit(raw.decode('utf-8'), write)
+
+    class _Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    with _Server((host, port), _Handler) as server:
+        print(f"Research worker listening on {host}:{server.server_address[1]}", file=sys.stderr, flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            dispatcher.shutdown()
+
+def _on_sigterm(cancel, stop=False):
+    """Cancel running research on SIGTERM, so each run still answers with its summary so far.
+
+    With ``stop``, the handler also ends the serving loop the signal interrupted.
+    """
+    def handle(signum, frame):
+        print("Received SIGTERM: cancelling running research", file=sys.stderr, flush=True)
+        cancel()
+        if stop:
+            raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handle)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run deep research on a topic")
+    parser.add_argument('topic', nargs='?', help="The topic to research")
+    parser.add_argument('max_loops', nargs='?', help="Maximum number of research loops")
+    parser.add_argument('llm_model', nargs='?', help="Ollama model to use")
+    parser.add_argument('search_api', nargs='?', help="Search API to use")
+    parser.add_argument('--planner-model', default=None, help="Ollama model writing queries and reflections (default: llm_model)")
+    parser.add_argument('--writer-model', default=None, help="Ollama model writing the summary (default: llm_model)")
+    parser.add_argument('--stream', action='store_true', help="Emit NDJSON progress events, ending with a result event")
+    parser.add_argument('--session-id', default=None, help="Checkpoint the run under this id so it can be resumed")
+    parser.add_argument('--resume', metavar='SESSION_ID', default=None, help="Continue a checkpointed session from its last completed node")
+    parser.add_argument('--worker', action='store_true', help="Run as a long-lived worker reading NDJSON jobs")
+    parser.add_argument('--batch', metavar='FILE', default=None, help="Research every topic of a JSONL file ('-' for stdin), writing results as they complete")
+    parser.add_argument('--concurrency', type=int, default=4, help="Number of jobs a worker or batch runs at once")
+    parser.add_argument('--port', type=int, default=None, help="Worker listens on 127.0.0.1:PORT instead of stdin/stdout")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind when --port is given")
+    parser.add_argument('--metrics-file', default=None, help="Export each session's metrics to this file")
+    parser.add_argument('--metrics-format', choices=['jsonl', 'prometheus'], default=None, help="Metrics export format (default: jsonl)")
+    args = parser.parse_args()
+    try:
+        _run(args)
+    finally:
+        # Stop the prefetch pool of pipelined research before the process exits
+        speculations.shutdown()
+
+def _run(args):
+    """Run the worker, batch or single research run the arguments ask for."""
+
+    # Metrics export settings go in the config of each session rather than the
+    # environment, so they do not leak into sessions that set their own
+    exports = {key: value for key, value in (('metrics_path', args.metrics_file), ('metrics_format', args.metrics_format)) if value}
+
+    # Model flags fill in the jobs of a worker or batch that do not pick their own models
+    defaults = {key: value for key, value in (('planner_llm', args.planner_model), ('writer_llm', args.writer_model)) if value}
+    if exports:
+        defaults['configurable'] = exports
+
+    if args.worker:
+        dispatcher = JobDispatcher(max(1, args.concurrency), defaults)
+        _on_sigterm(dispatcher.cancel_all, stop=True)
+        if args.port is not None:
+            serve_socket(dispatcher, args.host, args.port)
+        else:
+            serve_stdio(dispatcher)
+        return
+
+    if args.batch:
+        # Settings shared by every job come from the environment (.env); jobs
+        # carry their own overrides
+        if args.topic:
+            print(json.dumps({'error': "Invalid arguments: --batch reads topics from the file, not the command line"}), flush=True)
+            return
+        try:
+            batch = contextlib.nullcontext(sys.stdin) if args.batch == '-' else open(args.batch)
+        except OSError as e:
+            print(json.dumps({'error': f"Invalid arguments: cannot read the batch file: {str(e)}"}), flush=True)
+            raise SystemExit(1)
+        dispatcher = JobDispatcher(max(1, args.concurrency), {**defaults, 'stream': True} if args.stream else defaults)
+        # Cancelled jobs finish with their partial results; the rest of the batch is refused
+        _on_sigterm(dispatcher.cancel_all)
+        started = time.perf_counter()
+        with batch as lines:
+            jobs, failed = run_batch(lines, dispatcher, _line_writer(sys.stdout))
+        print(f"Batch finished: {jobs} jobs, {failed} failed, in {time.perf_counter() - started:.1f}s", file=sys.stderr, flush=True)
+        return
+
+    try:
+        if not args.topic and not args.resume:
+            raise ValueError("a research topic is required")
+        config = build_config(
+            args.max_loops, args.llm_model, args.search_api,
+            overrides=exports,
+            session_id=args.resume or args.session_id,
+            planner_llm=args.planner_model,
+            writer_llm=args.writer_model
+        )
+    except ValueError as e:
+        print(json.dumps({'error': f"Invalid arguments: {str(e)}"}), flush=True)
+        return
+
+    run_scope = deadline.Deadline()
+    _on_sigterm(run_scope.cancel)
+    with deadline.scope(run_scope):
+        # Ensure we're writing to stderr for logs and stdout for JSON only
+        if args.stream:
+            events = stream_research(args.topic, config, resume=bool(args.resume))
+            try:
+                for event in events:
+                    print(json.dumps(event), flush=True)
+            except BrokenPipeError:
+                # The reader went away: stop researching early
+                events.close()
+            return
+        print(json.dumps(research(args.topic, config, resume=bool(args.resume))), flush=True)
 
 if __name__ == '__main__':
     main()
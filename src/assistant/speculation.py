@@ -0,0 +1,128 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from assistant import deadline
+from assistant.metrics import record
+
+# Prefetches outlive the node that started them, so they run on a pool of
+# their own rather than on LangGraph's node threads
+_MAX_WORKERS = 32
+# Backstop for speculations started outside a research session (e.g. a graph
+# run directly), which no session end releases; sessions release their own
+_MAX_AGE_SECONDS = 3600
+
+class Speculation:
+    """Follow-up queries written ahead of reflection, and the searches prefetched for them.
+
+    ``queries`` resolves to the query state update once the query writer
+    answered; ``responses`` resolves to ``(search responses,
+    include_raw_content)`` once the prefetched searches completed.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.started = time.monotonic()
+        self.queries: concurrent.futures.Future = concurrent.futures.Future()
+        self.responses: concurrent.futures.Future = concurrent.futures.Future()
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = threading.Event()
+        # The session that started the prefetch, and the prefetch's own scope
+        # within it: cancelling the scope stops its LLM call and searches
+        self.session = deadline.current()
+        self.scope = deadline.Deadline(parent=self.session)
+
+    def cancel(self) -> None:
+        """Stop the prefetch: its calls give up, searches not started yet are skipped and an async task is cancelled."""
+        self.cancelled.set()
+        self.scope.cancel("speculation discarded")
+        self.scope.close()
+        if self.task is not None:
+            try:
+                self.task.get_loop().call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                pass  # The event loop is already closed
+
+_lock = threading.Lock()
+_speculations: Dict[str, Speculation] = {}
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+def _register(speculation: Speculation) -> Speculation:
+    with _lock:
+        for stale in [s for s in _speculations.values() if speculation.started - s.started > _MAX_AGE_SECONDS]:
+            del _speculations[stale.id]
+            stale.cancel()
+        _speculations[speculation.id] = speculation
+    return speculation
+
+def start(run: Callable[[Speculation], None]) -> Speculation:
+    """Run `run(speculation)` on the prefetch pool, in a copy of the caller's context."""
+    global _executor
+    speculation = _register(Speculation())
+    with _lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="speculation")
+        executor = _executor
+    executor.submit(contextvars.copy_context().run, _run_in_scope, run, speculation)
+    return speculation
+
+def _run_in_scope(run: Callable[[Speculation], None], speculation: Speculation) -> None:
+    try:
+        with deadline.scope(speculation.scope):
+            run(speculation)
+    finally:
+        speculation.scope.close()
+
+async def _arun_in_scope(run: Callable[[Speculation], Any], speculation: Speculation) -> None:
+    try:
+        with deadline.scope(speculation.scope):
+            await run(speculation)
+    finally:
+        speculation.scope.close()
+
+def astart(run: Callable[[Speculation], Any]) -> Speculation:
+    """Run the coroutine `run(speculation)` as a task on the running event loop."""
+    speculation = _register(Speculation())
+    speculation.task = asyncio.get_running_loop().create_task(_arun_in_scope(run, speculation))
+    return speculation
+
+def take(speculation_id: Optional[str]) -> Optional[Speculation]:
+    """Claim a registered speculation, or None if it is unknown (e.g. after a restart)."""
+    if not speculation_id:
+        return None
+    with _lock:
+        return _speculations.pop(speculation_id, None)
+
+def discard(speculation_id: Optional[str]) -> None:
+    """Cancel a speculation whose prefetch will not be used, recording the waste."""
+    speculation = take(speculation_id)
+    if speculation is not None:
+        speculation.cancel()
+        record("speculation", "cancelled", 0.0)
+
+def release(session: Optional[deadline.Deadline]) -> None:
+    """Cancel the unclaimed speculations of a research session that ended."""
+    if session is None:
+        return
+    with _lock:
+        ended = [s for s in _speculations.values() if s.session is session]
+        for speculation in ended:
+            del _speculations[speculation.id]
+    for speculation in ended:
+        speculation.cancel()
+
+def shutdown() -> None:
+    """Cancel every speculation and stop the prefetch pool, e.g. before the process exits."""
+    global _executor
+    with _lock:
+        pending = list(_speculations.values())
+        _speculations.clear()
+        executor, _executor = _executor, None
+    for speculation in pending:
+        speculation.cancel()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,114 @@
+"""Cold-start check for run_research.py.
+
+Measures, in fresh interpreters, how long it takes to import
+``assistant.run_research``, build the research graph and create the first
+Ollama client, i.e. everything a spawned run does before its first LLM call.
+Reports the slowest imports from ``python -X importtime`` and fails when the
+median exceeds a budget or when a module loaded on demand (a search provider
+SDK) is imported before a run asks for it:
+
+    python -m assistant.startup --budget 1.0
+    python -m assistant.startup --runs 5 --top 30
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# Imported on demand by assistant.clients; none of them may load at startup
+LAZY_MODULES = ("tavily", "langchain_ollama")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import assistant.run_research
+imported = time.perf_counter()
+from assistant.graph import get_graph
+get_graph()
+built = time.perf_counter()
+lazy = [name for name in {lazy!r} if name in sys.modules]
+from assistant.configuration import Configuration
+from assistant.llm import chat_model
+configurable = Configuration()
+chat_model(configurable, configurable.local_llm)
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "graph_seconds": built - imported,
+    "client_seconds": ready - built,
+    "total_seconds": ready - started,
+    "eager_provider_modules": lazy,
+}}))
+"""
+
+def _run_probe(importtime: bool = False) -> subprocess.CompletedProcess:
+    source_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [source_root, os.environ.get("PYTHONPATH")]))}
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _PROBE.format(lazy=LAZY_MODULES)]
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr}")
+    return result
+
+def import_profile(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """The `top` top-level packages by self import time from ``-X importtime`` output.
+
+    Self times of a package's modules are summed, so the entries do not double
+    count nested imports and add up to the total import time.
+    """
+    packages: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": module, "seconds": round(micros / 1e6, 4)} for module, micros in ranked]
+
+def measure_startup(runs: int = 3, top: int = 15) -> Dict[str, Any]:
+    """Median cold-start timings over `runs` fresh interpreters, plus an import profile."""
+    samples = [json.loads(_run_probe().stdout) for _ in range(max(1, runs))]
+    report = {
+        key: round(statistics.median(sample[key] for sample in samples), 4)
+        for key in ("import_seconds", "graph_seconds", "client_seconds", "total_seconds")
+    }
+    report["eager_provider_modules"] = sorted({name for sample in samples for name in sample["eager_provider_modules"]})
+    report["import_profile"] = import_profile(_run_probe(importtime=True).stderr, top)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start of run_research.py against a time budget")
+    parser.add_argument('--budget', type=float, default=1.0, help="Maximum median seconds from interpreter start to the first LLM call")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters to time")
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports to report")
+    args = parser.parse_args()
+
+    report = measure_startup(args.runs, args.top)
+    print(
+        f"import {report['import_seconds']:.3f}s, graph {report['graph_seconds']:.3f}s, "
+        f"first client {report['client_seconds']:.3f}s, total {report['total_seconds']:.3f}s (budget {args.budget:.3f}s)",
+        file=sys.stderr
+    )
+    for entry in report["import_profile"]:
+        print(f"    {entry['module']:<28} {entry['seconds']:.4f}s", file=sys.stderr)
+
+    failures = []
+    if report["total_seconds"] > args.budget:
+        failures.append(f"startup took {report['total_seconds']}s, over the {args.budget}s budget")
+    if report["eager_provider_modules"]:
+        failures.append(f"provider modules imported at startup: {', '.join(report['eager_provider_modules'])}")
+    report["failures"] = failures
+    print(json.dumps(report), flush=True)
+    if failures:
+        for failure in failures:
+            print(f"Startup check failed: {failure}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,42 @@
 import operator
 from dataclasses import dataclass, field
-from typing_extensions import TypedDict, Annotated
+from typing import Optional
+from typing_extensions import Annotated
+
+# Loops of formatted search results kept in the state; only the latest is read
+RESULTS_WINDOW = 2
+
+def keep_recent(left: list, right: list) -> list:
+    """ Reducer appending new results and keeping the last RESULTS_WINDOW of them """
+    return (left + right)[-RESULTS_WINDOW:]
+
+@dataclass(slots=True)
+class SourceRecord:
+    """ One search result of the latest loop; its full page text lives in the content store """
+    url: str
+    title: str
+    content: str # Snippet returned by the search API
+    raw_key: Optional[str] = None # Content store key of the full page text
+    raw_content: Optional[str] = None # Full page text itself when the content store is disabled
 
 @dataclass
 class SummaryState:
     research_topic: str = field(default=None) # Report topic     
     search_query: str = field(default=None) # Search query
-    web_research_results: Annotated[list, operator.add] = field(default_factory=list) 
+    search_queries: list = field(default_factory=list) # Fan-out search queries for the next loop
+    speculation_id: str = field(default=None) # Prefetch running for the next loop's queries (pipelined mode)
+    web_research_results: Annotated[list, keep_recent] = field(default_factory=list) # Formatted snippets of the most recent loops
     sources_gathered: Annotated[list, operator.add] = field(default_factory=list) 
+    latest_sources: list = field(default_factory=list) # SourceRecords of the most recent loop
+    seen_sources: dict = field(default_factory=dict) # Canonical URLs and content fingerprints already processed
+    duplicate_sources_dropped: int = field(default=0) # Sources skipped because an earlier loop processed them
+    duplicate_tokens_saved: int = field(default=0) # Estimated prompt tokens those skipped sources would have cost
     research_loop_count: int = field(default=0) # Research loop count
     running_summary: str = field(default=None) # Final report
+    delta_notes: Annotated[list, operator.add] = field(default_factory=list) # Per-loop notes of the incremental summary strategy
+    loop_gains: Annotated[list, operator.add] = field(default_factory=list) # Marginal information gain of each loop (None if unknown)
+    new_source_share: float = field(default=None) # Share of the latest loop's sources not seen before
+    stop_reason: str = field(default=None) # Why research stopped
 
 @dataclass
 class SummaryStateInput:
@@ -18,3 +45,4 @@ class SummaryStateInput:
 @dataclass
 class SummaryStateOutput:
     running_summary: str = field(default=None) # Final report
+    stop_reason: str = field(default=None) # Why research stopped
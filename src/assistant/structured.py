@@ -0,0 +1,209 @@
+import functools
+import json
+from typing import Any, Dict, List, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ConfigDict, field_validator, model_validator
+
+M = TypeVar("M", bound=BaseModel)
+
+# Typed replies of the JSON calls. Their JSON schemas are passed to Ollama as
+# the output format, so generation is constrained to these shapes; the same
+# models validate the replies. Defaults only matter for replies generated
+# without a schema (json_schema_output off or a model that ignores it)
+
+class _Reply(BaseModel):
+    # Fields with defaults are still required in the serialization schema
+    model_config = ConfigDict(json_schema_serialization_defaults_required=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _drop_nulls(cls, value: Any) -> Any:
+        # A null field falls back to its default (or is reported missing)
+        if isinstance(value, dict):
+            return {key: item for key, item in value.items() if item is not None}
+        return value
+
+class SearchQuery(_Reply):
+    """Reply of the query writer for a single search query."""
+    query: str
+    aspect: str = ""
+    rationale: str = ""
+
+class SearchQueries(_Reply):
+    """Reply of the query writer when a loop searches several queries."""
+    queries: List[SearchQuery]
+
+    @field_validator("queries", mode="before")
+    @classmethod
+    def _bare_queries(cls, value: Any) -> Any:
+        # Accept a plain list of query strings
+        if isinstance(value, list):
+            return [{"query": item} if isinstance(item, str) else item for item in value]
+        return value
+
+class FollowUpQuery(_Reply):
+    """Reply of the reflection step for a single follow-up query."""
+    knowledge_gap: str = ""
+    follow_up_query: str
+
+class FollowUpQueries(_Reply):
+    """Reply of the reflection step when a loop searches several queries."""
+    knowledge_gaps: List[str] = []
+    follow_up_queries: List[str]
+
+    @field_validator("follow_up_queries", mode="before")
+    @classmethod
+    def _query_objects(cls, value: Any) -> Any:
+        # Accept [{"query": ...}] items, as the query writer produces
+        if isinstance(value, list):
+            return [item.get("query") if isinstance(item, dict) else item for item in value]
+        return value
+
+def json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """The JSON schema of a reply model, with every field required so the model always writes it.
+
+    Nested models are inlined rather than referenced through ``$defs``, which
+    not every Ollama version resolves.
+    """
+    schema = model.model_json_schema(mode="serialization")
+    definitions = schema.pop("$defs", {})
+
+    def inline(node: Any) -> Any:
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(item) for item in node]
+        return node
+
+    return inline(schema)
+
+@functools.lru_cache(maxsize=None)
+def schema_format(model: Type[BaseModel]) -> str:
+    """The serialized JSON schema of a reply model, as passed to Ollama."""
+    return json.dumps(json_schema(model), sort_keys=True)
+
+def strip_thinking(content: str) -> str:
+    """Remove <think>...</think> blocks from model output in one pass; an unclosed block is kept."""
+    if "<think>" not in content:
+        return content
+    pieces = []
+    position = 0
+    while True:
+        start = content.find("<think>", position)
+        if start == -1:
+            break
+        end = content.find("</think>", start)
+        if end == -1:
+            break
+        pieces.append(content[position:start])
+        position = end + len("</think>")
+    pieces.append(content[position:])
+    return "".join(pieces)
+
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+def repair_json(text: str) -> str:
+    """Rewrite near-valid JSON into valid JSON in one pass over the text.
+
+    Starts at the first object or array and ignores text after it (prose,
+    code fences), closes a reply truncated mid-string or mid-object, drops
+    trailing commas, converts single-quoted strings and Python literals,
+    quotes bare keys and escapes raw control characters in strings.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        raise ValueError("No JSON object in LLM response")
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None  # Quote character of the string being copied, if any
+    i = min(starts)
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if quote is not None:
+            if char == "\\" and i + 1 < n:
+                # An escaped single quote is not a valid JSON escape
+                out.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                i += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')  # Inside a single-quoted string
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\t":
+                out.append("\\t")
+            elif char < " ":
+                out.append(f"\\u{ord(char):04x}")
+            else:
+                out.append(char)
+            i += 1
+            continue
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+            out.append(char)
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break
+        elif char.isdigit() or char == "-":
+            end = i + 1
+            while end < n and text[end] in "0123456789.eE+-":
+                end += 1
+            out.append(text[i:end])
+            i = end
+            continue
+        elif char.isalpha() or char == "_":
+            end = i
+            while end < n and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[i:end]
+            out.append(_LITERALS.get(word) or json.dumps(word))
+            i = end
+            continue
+        else:
+            out.append(char)
+        i += 1
+    # Close a reply cut off by the reply length cap
+    if quote is not None:
+        out.append('"')
+    _drop_trailing_comma(out)
+    if stack and "".join(out).rstrip().endswith(":"):
+        out.append("null")
+    while stack:
+        out.append(stack.pop())
+    return "".join(out)
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    """Remove a comma (and the whitespace after it) at the end of the output."""
+    index = len(out) - 1
+    while index >= 0 and out[index].isspace():
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index:]
+
+def parse_reply(content: str, model: Type[M]) -> Tuple[M, bool]:
+    """Parse a JSON reply into `model`, repairing near-valid JSON.
+
+    Returns:
+        tuple: (validated reply, whether the JSON had to be repaired)
+
+    Raises:
+        ValueError: if the reply cannot be repaired or does not fit the model
+    """
+    content = strip_thinking(content).strip()
+    try:
+        return model.model_validate_json(content), False
+    except ValueError:
+        pass
+    return model.model_validate(json.loads(repair_json(content))), True
@@ -1,16 +1,25 @@
+import asyncio
+import contextvars
+import functools
+import json
 import os
 import sys
-import requests
-from typing import Dict, Any, List
-from langsmith import traceable
-from tavily import TavilyClient
-from langchain_exa import ExaSearchRetriever
-from langchain_core.documents import Document
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple, TypeVar
+from assistant import deadline
+from assistant.cache import SearchCache
+from assistant.context import trim_to_tokens
+from assistant.clients import DEFAULT_POOL_SIZE, get_async_http_client, get_async_tavily_client, get_http_session, get_tavily_client
+from assistant.metrics import timed
+from assistant.ratelimit import RateLimiter
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 def deduplicate_and_format_sources(search_response, max_tokens_per_source, include_raw_content=False):
     """
     Takes either a single search response or list of responses from search APIs and formats them.
-    Limits the raw_content to approximately max_tokens_per_source.
+    Limits the raw_content to approximately max_tokens_per_source, using the token estimator in assistant.context.
     include_raw_content specifies whether to include the raw_content from Tavily in the formatted string.
     
     Args:
@@ -47,15 +56,12 @@ def deduplicate_and_format_sources(search_response, max_tokens_per_source, inclu
         formatted_text += f"URL: {source['url']}\n===\n"
         formatted_text += f"Most relevant content from source: {source['content']}\n===\n"
         if include_raw_content:
-            # Using rough estimate of 4 characters per token
-            char_limit = max_tokens_per_source * 4
             # Handle None raw_content
             raw_content = source.get('raw_content', '')
             if raw_content is None:
                 raw_content = ''
                 print(f"Warning: No raw_content found for source {source['url']}", file=sys.stderr)
-            if len(raw_content) > char_limit:
-                raw_content = raw_content[:char_limit] + "... [truncated]"
+            raw_content = trim_to_tokens(raw_content, max_tokens_per_source)
             formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
                 
     return formatted_text.strip()
@@ -74,54 +80,233 @@ def format_sources(search_results):
         for source in search_results['results']
     )
 
-@traceable
-def tavily_search(query, include_raw_content=True, max_results=3):
-    """ Search the web using the Tavily API.
-    
+def bounded_map(fn: Callable[[T], R], items: List[T], max_concurrency: int = 4) -> Tuple[List[R], List[Exception]]:
+    """Call `fn` on every item on a thread pool, with at most `max_concurrency` calls at once.
+
+    Unlike parallel_search there is no per-call timeout; calls that must end
+    early are bounded by the node and session deadlines instead.
+
+    Returns:
+        tuple: (results, errors) with results in item order for the calls that succeeded
+    """
+    if not items:
+        return [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items))), thread_name_prefix="bounded-map") as executor:
+        # Each call runs in a copy of the caller's context (metrics recorder, deadlines)
+        futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+        results, errors = [], []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(e)
+    return results, errors
+
+async def abounded_map(fn: Callable[[T], Awaitable[R]], items: List[T], max_concurrency: int = 4) -> Tuple[List[R], List[Exception]]:
+    """Async counterpart of bounded_map: run one coroutine per item behind a semaphore."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _call(item):
+        async with semaphore:
+            return await fn(item)
+
+    outcomes = await asyncio.gather(*(_call(item) for item in items), return_exceptions=True)
+    results = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    return results, errors
+
+def parallel_search(search_fn: Callable[[str], Dict[str, Any]], queries: List[str], max_concurrency: int = 4, timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Exception]]:
+    """Run one search per query on a bounded thread pool.
+
     Args:
-        query (str): The search query to execute
-        include_raw_content (bool): Whether to include the raw_content from Tavily in the formatted string
-        max_results (int): Maximum number of results to return
-        
+        search_fn (Callable): Function taking a query and returning a search response
+        queries (list): Search queries to execute
+        max_concurrency (int): Maximum number of searches in flight at once
+        timeout (float): Per-call timeout in seconds; calls still running when their
+            slot's budget is spent are reported as timed out
+
     Returns:
-        dict: Search response containing:
-            - results (list): List of search result dictionaries, each containing:
-                - title (str): Title of the search result
-                - url (str): URL of the search result
-                - content (str): Snippet/summary of the content
-                - raw_content (str): Full content of the page if available"""
-    
-    # Get API key from environment
+        tuple: (responses, errors) with responses in query order for the calls that succeeded
+    """
+    max_concurrency = max(1, min(max_concurrency, len(queries)))
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="search")
+    try:
+        # Run each call in a copy of the caller's context, so context variables
+        # such as the session metrics recorder reach the pool threads
+        futures = [executor.submit(contextvars.copy_context().run, search_fn, query) for query in queries]
+        # Queued calls only start once a slot frees up, so the total wait is the
+        # per-call timeout times the number of rounds the pool needs
+        total_timeout = None
+        if timeout is not None:
+            rounds = -(-len(queries) // max_concurrency)
+            total_timeout = timeout * rounds
+        wait(futures, timeout=total_timeout)
+
+        responses, errors = [], []
+        for query, future in zip(queries, futures):
+            if not future.done():
+                future.cancel()
+                errors.append(TimeoutError(f"Search for '{query}' timed out after {timeout} seconds"))
+            elif future.exception() is not None:
+                errors.append(future.exception())
+            else:
+                responses.append(future.result())
+        return responses, errors
+    finally:
+        # Do not block on stragglers that overran the timeout; the search
+        # functions give their HTTP requests the same timeout, so they end too
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def aparallel_search(search_fn: Callable[[str], Awaitable[Dict[str, Any]]], queries: List[str], max_concurrency: int = 4, timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Exception]]:
+    """Async counterpart of parallel_search: run one coroutine per query behind a semaphore.
+
+    Args:
+        search_fn (Callable): Coroutine function taking a query and returning a search response
+        queries (list): Search queries to execute
+        max_concurrency (int): Maximum number of searches in flight at once
+        timeout (float): Per-call timeout in seconds, measured from when the call starts
+
+    Returns:
+        tuple: (responses, errors) with responses in query order for the calls that succeeded
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _search(query):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(search_fn(query), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Search for '{query}' timed out after {timeout} seconds")
+
+    outcomes = await asyncio.gather(*(_search(query) for query in queries), return_exceptions=True)
+    responses = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    return responses, errors
+
+def merge_search_responses(search_responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge several search responses into a single response with all results."""
+    return {"results": [result for response in search_responses for result in response['results']]}
+
+def _limited(limiter: Optional[RateLimiter], fn: Callable[[], Any], call: Dict[str, Any]) -> Any:
+    """Call `fn` through the provider's rate limiter and retry policy, if there is one."""
+    return limiter.call(fn, call) if limiter else fn()
+
+async def _alimited(limiter: Optional[RateLimiter], fn: Callable[[], Awaitable[Any]], call: Dict[str, Any]) -> Any:
+    """Async counterpart of _limited."""
+    return await limiter.acall(fn, call) if limiter else await fn()
+
+def _response_bytes(response: Dict[str, Any]) -> int:
+    """Size of a search response as UTF-8 JSON, for clients that do not expose the raw body."""
+    return len(json.dumps(response, ensure_ascii=False).encode("utf-8"))
+
+def _tracing_enabled() -> bool:
+    """Whether LangSmith tracing is on, as set from langsmith_tracing when a node starts."""
+    return any(os.environ.get(name, "").lower() == "true" for name in ("LANGCHAIN_TRACING_V2", "LANGSMITH_TRACING"))
+
+def traceable(func: Callable) -> Callable:
+    """Trace `func` with langsmith.traceable, importing langsmith on the first call made with tracing on."""
+    traced = []
+
+    def _traced() -> Callable:
+        if not traced:
+            from langsmith import traceable as langsmith_traceable
+            traced.append(langsmith_traceable(func))
+        return traced[0]
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _tracing_enabled():
+                return await _traced()(*args, **kwargs)
+            return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _tracing_enabled():
+            return _traced()(*args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+def _tavily_api_key() -> str:
+    """Return the Tavily API key from the environment."""
     api_key = os.environ.get('TAVILY_API_KEY')
     if not api_key:
         raise ValueError("TAVILY_API_KEY environment variable is required")
     
     # Keep the tvly- prefix intact
-    api_key = api_key.strip()
-    
-    # Initialize Tavily client with the full API key
-    tavily_client = TavilyClient(api_key=api_key)
-    return tavily_client.search(query, 
-                         max_results=max_results, 
-                         include_raw_content=include_raw_content)
+    return api_key.strip()
 
 @traceable
-def perplexity_search(query: str, perplexity_search_loop_count: int) -> Dict[str, Any]:
-    """Search the web using the Perplexity API.
+def tavily_search(query, include_raw_content=True, max_results=3, timeout=None, cache: Optional[SearchCache] = None, pool_size: int = DEFAULT_POOL_SIZE, limiter: Optional[RateLimiter] = None):
+    """ Search the web using the Tavily API.
     
     Args:
         query (str): The search query to execute
-        perplexity_search_loop_count (int): The loop step for perplexity search (starts at 0)
-  
+        include_raw_content (bool): Whether to include the raw_content from Tavily in the formatted string
+        max_results (int): Maximum number of results to return
+        timeout (float): Request timeout in seconds, shortened to the node and session deadlines (client default when None)
+        cache (SearchCache): Optional cache consulted before calling the API
+        pool_size (int): Connection pool size of the shared client
+        limiter (RateLimiter): Optional rate limiter and retry policy for the API calls
+        
     Returns:
         dict: Search response containing:
             - results (list): List of search result dictionaries, each containing:
                 - title (str): Title of the search result
                 - url (str): URL of the search result
                 - content (str): Snippet/summary of the content
-                - raw_content (str): Full content of the page if available
-    """
+                - raw_content (str): Full content of the page if available"""
+    
+    if cache:
+        cached = cache.get("tavily", query, max_results=max_results, include_raw_content=include_raw_content)
+        if cached is not None:
+            return cached
+
+    # Reuse the pooled Tavily client for the full API key
+    tavily_client = get_tavily_client(_tavily_api_key(), pool_size)
 
+    def _search():
+        # Each attempt ends by the node and session deadlines
+        call_timeout = deadline.client_timeout(timeout)
+        kwargs = {"timeout": call_timeout} if call_timeout is not None else {}
+        return tavily_client.search(query,
+                                    max_results=max_results,
+                                    include_raw_content=include_raw_content,
+                                    **kwargs)
+
+    with timed("search", "tavily") as call:
+        response = _limited(limiter, _search, call)
+        call["bytes"] = _response_bytes(response)
+    if cache:
+        cache.set("tavily", query, response, max_results=max_results, include_raw_content=include_raw_content)
+    return response
+
+@traceable
+async def atavily_search(query, include_raw_content=True, max_results=3, timeout=None, cache: Optional[SearchCache] = None, pool_size: int = DEFAULT_POOL_SIZE, limiter: Optional[RateLimiter] = None):
+    """Async version of tavily_search using AsyncTavilyClient."""
+    if cache:
+        cached = cache.get("tavily", query, max_results=max_results, include_raw_content=include_raw_content)
+        if cached is not None:
+            return cached
+
+    tavily_client = get_async_tavily_client(_tavily_api_key(), pool_size)
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+    with timed("search", "tavily") as call:
+        response = await _alimited(limiter, lambda: tavily_client.search(query,
+                                   max_results=max_results,
+                                   include_raw_content=include_raw_content,
+                                   **kwargs), call)
+        call["bytes"] = _response_bytes(response)
+    if cache:
+        cache.set("tavily", query, response, max_results=max_results, include_raw_content=include_raw_content)
+    return response
+
+PERPLEXITY_URL = "https://api.perplexity.ai/chat/completions"
+EXA_URL = "https://api.exa.ai/search"
+
+def _perplexity_request(query: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """Build the headers and payload for a Perplexity search request."""
     headers = {
         "accept": "application/json",
         "content-type": "application/json",
@@ -141,16 +326,10 @@ def perplexity_search(query: str, perplexity_search_loop_count: int) -> Dict[str
             }
         ]
     }
-    
-    response = requests.post(
-        "https://api.perplexity.ai/chat/completions",
-        headers=headers,
-        json=payload
-    )
-    response.raise_for_status()  # Raise exception for bad status codes
-    
-    # Parse the response
-    data = response.json()
+    return headers, payload
+
+def _perplexity_results(data: Dict[str, Any], perplexity_search_loop_count: int) -> Dict[str, Any]:
+    """Convert a Perplexity chat completion into our standard search response."""
     content = data["choices"][0]["message"]["content"]
 
     # Perplexity returns a list of citations for a single search result
@@ -176,13 +355,17 @@ def perplexity_search(query: str, perplexity_search_loop_count: int) -> Dict[str
     return {"results": results}
 
 @traceable
-def exa_search(query: str, max_results: int = 3) -> Dict[str, Any]:
-    """Search the web using the Exa API via LangChain.
-
+def perplexity_search(query: str, perplexity_search_loop_count: int, timeout: Optional[float] = None, cache: Optional[SearchCache] = None, pool_size: int = DEFAULT_POOL_SIZE, limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """Search the web using the Perplexity API.
+    
     Args:
         query (str): The search query to execute
-        max_results (int): Maximum number of results to return (default: 3)
-
+        perplexity_search_loop_count (int): The loop step for perplexity search (starts at 0)
+        timeout (float): Request timeout in seconds, shortened to the node and session deadlines (no timeout when None)
+        cache (SearchCache): Optional cache consulted before calling the API
+        pool_size (int): Connection pool size of the shared HTTP session
+        limiter (RateLimiter): Optional rate limiter and retry policy for the API calls
+  
     Returns:
         dict: Search response containing:
             - results (list): List of search result dictionaries, each containing:
@@ -192,41 +375,151 @@ def exa_search(query: str, max_results: int = 3) -> Dict[str, Any]:
                 - raw_content (str): Full content of the page if available
     """
 
-    # Get API key from environment
+    # The raw completion is cached so result titles still reflect the current loop
+    headers, payload = _perplexity_request(query)
+    data = cache.get("perplexity", query, model=payload["model"]) if cache else None
+    if data is None:
+        def _post():
+            response = get_http_session(pool_size).post(
+                PERPLEXITY_URL,
+                headers=headers,
+                json=payload,
+                timeout=deadline.client_timeout(timeout)
+            )
+            call["bytes"] = call.get("bytes", 0) + len(response.content)
+            response.raise_for_status()  # Raise exception for bad status codes
+            return response.json()
+
+        with timed("search", "perplexity") as call:
+            data = _limited(limiter, _post, call)
+        if cache:
+            cache.set("perplexity", query, data, model=payload["model"])
+    
+    # Parse the response
+    return _perplexity_results(data, perplexity_search_loop_count)
+
+@traceable
+async def aperplexity_search(query: str, perplexity_search_loop_count: int, timeout: Optional[float] = None, cache: Optional[SearchCache] = None, pool_size: int = DEFAULT_POOL_SIZE, limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """Async version of perplexity_search using an httpx.AsyncClient."""
+    headers, payload = _perplexity_request(query)
+    data = cache.get("perplexity", query, model=payload["model"]) if cache else None
+    if data is None:
+        client = get_async_http_client(pool_size)
+
+        async def _post():
+            response = await client.post(PERPLEXITY_URL, headers=headers, json=payload, timeout=timeout)
+            call["bytes"] = call.get("bytes", 0) + len(response.content)
+            response.raise_for_status()  # Raise exception for bad status codes
+            return response.json()
+
+        with timed("search", "perplexity") as call:
+            data = await _alimited(limiter, _post, call)
+        if cache:
+            cache.set("perplexity", query, data, model=payload["model"])
+    return _perplexity_results(data, perplexity_search_loop_count)
+
+def _exa_request(query: str, max_results: int) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """Build the headers and payload for an Exa search request with page text and highlights."""
     api_key = os.environ.get('EXA_API_KEY')
     if not api_key:
         raise ValueError("EXA_API_KEY environment variable is required")
 
-    # Initialize Exa retriever
-    retriever = ExaSearchRetriever(
-        api_key=api_key,
-        k=max_results,
-        highlights=True
-    )
-
-    # Perform search
-    documents: List[Document] = retriever.invoke(query)
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "x-api-key": api_key
+    }
+    payload = {
+        "query": query,
+        "numResults": max_results,
+        "type": "auto",
+        "contents": {"text": True, "highlights": True}
+    }
+    return headers, payload
 
-    # Convert LangChain documents to our standard format
+def _exa_results(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an Exa search response to our standard format."""
     results = []
-    for i, doc in enumerate(documents, 1):
-        # Extract metadata
-        metadata = doc.metadata
-        url = metadata.get('url', 'https://exa.ai')
-        title = metadata.get('title', f'Exa Search Result {i}')
-
-        # Get highlights if available, otherwise use page_content
-        highlights = metadata.get('highlights', [])
+    for i, result in enumerate(data.get("results", []), 1):
+        url = result.get('url') or 'https://exa.ai'
+        title = result.get('title') or f'Exa Search Result {i}'
+        text = result.get('text') or ""
+
+        # Get highlights if available, otherwise use the start of the page
+        highlights = result.get('highlights') or []
         if highlights:
             content = ' '.join(highlights)
         else:
-            content = doc.page_content[:500] + "..." if len(doc.page_content) > 500 else doc.page_content
+            content = text[:500] + "..." if len(text) > 500 else text
 
         results.append({
             "title": title,
             "url": url,
             "content": content,
-            "raw_content": doc.page_content
+            "raw_content": text
         })
 
     return {"results": results}
+
+@traceable
+def exa_search(query: str, max_results: int = 3, timeout: Optional[float] = None, cache: Optional[SearchCache] = None, pool_size: int = DEFAULT_POOL_SIZE, limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """Search the web using the Exa API.
+
+    Args:
+        query (str): The search query to execute
+        max_results (int): Maximum number of results to return (default: 3)
+        timeout (float): Request timeout in seconds, shortened to the node and session deadlines (no timeout when None)
+        cache (SearchCache): Optional cache consulted before calling the API
+        pool_size (int): Connection pool size of the shared HTTP session
+        limiter (RateLimiter): Optional rate limiter and retry policy for the API calls
+
+    Returns:
+        dict: Search response containing:
+            - results (list): List of search result dictionaries, each containing:
+                - title (str): Title of the search result
+                - url (str): URL of the search result
+                - content (str): Snippet/summary of the content
+                - raw_content (str): Full content of the page if available
+    """
+
+    if cache:
+        cached = cache.get("exa", query, max_results=max_results)
+        if cached is not None:
+            return cached
+
+    headers, payload = _exa_request(query, max_results)
+
+    def _post():
+        response = get_http_session(pool_size).post(EXA_URL, headers=headers, json=payload, timeout=deadline.client_timeout(timeout))
+        call["bytes"] = call.get("bytes", 0) + len(response.content)
+        response.raise_for_status()  # Raise exception for bad status codes
+        return response.json()
+
+    with timed("search", "exa") as call:
+        response = _exa_results(_limited(limiter, _post, call))
+    if cache:
+        cache.set("exa", query, response, max_results=max_results)
+    return response
+
+@traceable
+async def aexa_search(query: str, max_results: int = 3, timeout: Optional[float] = None, cache: Optional[SearchCache] = None, pool_size: int = DEFAULT_POOL_SIZE, limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """Async version of exa_search using an httpx.AsyncClient."""
+    if cache:
+        cached = cache.get("exa", query, max_results=max_results)
+        if cached is not None:
+            return cached
+
+    headers, payload = _exa_request(query, max_results)
+    client = get_async_http_client(pool_size)
+
+    async def _post():
+        response = await client.post(EXA_URL, headers=headers, json=payload, timeout=timeout)
+        call["bytes"] = call.get("bytes", 0) + len(response.content)
+        response.raise_for_status()  # Raise exception for bad status codes
+        return response.json()
+
+    with timed("search", "exa") as call:
+        response = _exa_results(await _alimited(limiter, _post, call))
+    if cache:
+        cache.set("exa", query, response, max_results=max_results)
+    return response
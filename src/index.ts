@@ -3,6 +3,7 @@ import { McpServer, ResourceTemplate } from "@modelcontextprotocol/sdk/server/mc
 import { StdioServerTransport } from "@modelcontextprotocol/sdk/server/stdio.js";
 import { McpError } from "@modelcontextprotocol/sdk/types.js";
 import { spawn, ChildProcess } from "child_process";
+import { randomUUID } from "crypto";
 import { dirname, join } from "path";
 import { fileURLToPath } from "url";
 import { z } from "zod";
@@ -48,6 +49,10 @@ function topicToUri(topic: string): string {
 interface ResearchConfig {
   maxLoops: number;
   llmModel: string;
+  // Optional models for query writing/reflection and for summarization;
+  // unset roles use llmModel
+  plannerModel?: string;
+  writerModel?: string;
   searchApi: "perplexity" | "tavily" | "exa";
 }
 
@@ -70,6 +75,194 @@ function validateApiKeys(searchApi: string): void {
   }
 }
 
+// Long-lived Python research worker. The worker loads the compiled graph
+// once and accepts newline-delimited JSON jobs on stdin, answering with one
+// JSON line per job id, so requests skip the interpreter/import cold start.
+interface WorkerJob {
+  max_loops: number;
+  llm_model: string;
+  planner_llm?: string;
+  writer_llm?: string;
+  search_api: string;
+  // Checkpoint id of the run; with resume set, continue that run instead
+  session_id: string;
+  resume?: boolean;
+  // Configuration overrides for this job, e.g. research_timeout
+  configurable?: Record<string, unknown>;
+}
+
+// Progress event streamed by the worker before the final "result" event
+interface WorkerEvent {
+  event: string;
+  node?: string;
+  queries?: string[];
+  loop?: number;
+  sources?: string[];
+  content?: string;
+}
+
+interface PendingJob {
+  resolve: (summary: string) => void;
+  reject: (error: Error) => void;
+  onEvent?: (event: WorkerEvent) => void;
+  timeout: NodeJS.Timeout;
+}
+
+// Larger models like gemma4:31b can take ~6 minutes per research loop
+const RESEARCH_TIMEOUT_MS = 1800000; // 30 minutes
+// The worker stops researching this long before the timeout to finalize the summary so far
+const FINALIZE_MARGIN_MS = 60000;
+// After the timeout, how long a cancelled job may take to answer with its partial summary
+const CANCEL_GRACE_MS = 30000;
+const WORKER_CONCURRENCY = parseInt(process.env.RESEARCH_WORKER_CONCURRENCY || "4", 10);
+
+class ResearchWorker {
+  private process: ChildProcess | null = null;
+  private pending: Map<string, PendingJob> = new Map();
+  private buffer = '';
+  private nextId = 0;
+
+  private start(): ChildProcess {
+    // In Docker the image installs dependencies with pip and has no uv,
+    // so run python3 directly; locally use uv to get the project venv.
+    const isDocker = process.env.DOCKER_CONTAINER === "true";
+    const scriptPath = isDocker
+      ? "/app/src/assistant/run_research.py"
+      : join(__dirname, "..", "src", "assistant", "run_research.py").replace(/\\/g, "/");
+    const [command, baseArgs] = isDocker
+      ? ["python3", [] as string[]]
+      : ["uv", ["run", "python"]];
+
+    const child: ChildProcess = spawn(command, [
+      ...baseArgs,
+      scriptPath,
+      "--worker",
+      "--concurrency",
+      String(WORKER_CONCURRENCY)
+    ], {
+      env: {
+        ...process.env,  // Pass through existing environment variables
+        PYTHONUNBUFFERED: "1",  // Ensure Python output is not buffered
+        PYTHONPATH: isDocker ? "/app/src" : join(__dirname, "..", "src").replace(/\\/g, "/"),  // Add src directory to Python path
+        TAVILY_API_KEY: process.env.TAVILY_API_KEY || "",  // Ensure API key is passed to Python process
+        PERPLEXITY_API_KEY: process.env.PERPLEXITY_API_KEY || "",  // Ensure API key is passed to Python process
+        EXA_API_KEY: process.env.EXA_API_KEY || ""  // Ensure API key is passed to Python process
+      },
+      cwd: isDocker ? "/app" : join(__dirname, "..").replace(/\\/g, "/")  // Set working directory
+    });
+
+    if (child.stdout) {
+      child.stdout.on("data", (data: Buffer) => this.onStdout(data));
+    }
+    if (child.stderr) {
+      child.stderr.on("data", (data: Buffer) => {
+        const error = data.toString().trim();
+        if (error) {
+          console.error(`[research error] ${error}`);
+        }
+      });
+    }
+
+    child.on("error", (error: Error) => {
+      this.failAll(new Error(`Failed to start Python process: ${error.message}`));
+    });
+
+    child.on("close", (code: number) => {
+      if (this.process === child) {
+        this.process = null;
+        this.buffer = '';
+      }
+      this.failAll(new Error(`Python research worker exited with code ${code}`));
+    });
+
+    return child;
+  }
+
+  private onStdout(data: Buffer): void {
+    this.buffer += data.toString();
+    let newline = this.buffer.indexOf("\n");
+    while (newline !== -1) {
+      const line = this.buffer.slice(0, newline).trim();
+      this.buffer = this.buffer.slice(newline + 1);
+      if (line) {
+        this.onLine(line);
+      }
+      newline = this.buffer.indexOf("\n");
+    }
+  }
+
+  private onLine(line: string): void {
+    let message: PythonResponse & Partial<WorkerEvent> & { id?: string | null; ready?: boolean };
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      console.error(`[research] ${line}`);
+      return;
+    }
+    if (message.ready) {
+      console.error("[research] worker ready");
+      return;
+    }
+    const job = message.id ? this.pending.get(message.id) : undefined;
+    if (!job) {
+      console.error(`[research] unmatched worker output: ${line}`);
+      return;
+    }
+    if (message.event && message.event !== "result") {
+      job.onEvent?.(message as WorkerEvent);
+      return;
+    }
+    this.pending.delete(message.id as string);
+    clearTimeout(job.timeout);
+    if (message.error) {
+      job.reject(new Error(message.error));
+    } else {
+      job.resolve(message.summary || 'No summary available');
+    }
+  }
+
+  private failAll(error: Error): void {
+    for (const [id, job] of this.pending) {
+      clearTimeout(job.timeout);
+      job.reject(error);
+      this.pending.delete(id);
+    }
+  }
+
+  run(topic: string, job: WorkerJob, onEvent?: (event: WorkerEvent) => void): Promise<string> {
+    if (!this.process) {
+      this.process = this.start();
+    }
+    const child = this.process;
+    const id = `job-${++this.nextId}`;
+
+    return new Promise<string>((resolve, reject) => {
+      const timeout = setTimeout(() => {
+        // Ask the worker to stop the run; it answers with the summary so far
+        child.stdin?.write(JSON.stringify({ cancel: id }) + "\n");
+        const pending = this.pending.get(id);
+        if (pending) {
+          pending.timeout = setTimeout(() => {
+            this.pending.delete(id);
+            reject(new Error('Research process timed out after 30 minutes'));
+          }, CANCEL_GRACE_MS);
+        }
+      }, RESEARCH_TIMEOUT_MS);
+      this.pending.set(id, { resolve, reject, onEvent, timeout });
+
+      if (!child.stdin) {
+        this.pending.delete(id);
+        clearTimeout(timeout);
+        reject(new Error('Python research worker has no stdin'));
+        return;
+      }
+      child.stdin.write(JSON.stringify({ id, topic, ...job, stream: onEvent !== undefined }) + "\n");
+    });
+  }
+}
+
+const researchWorker = new ResearchWorker();
+
 // Initialize server
 const server = new McpServer({
   name: "ollama-deep-researcher",
@@ -83,10 +276,15 @@ server.registerTool(
   {
     description: "Research a topic using web search and LLM synthesis",
     inputSchema: {
-      topic: z.string().describe("The topic to research")
+      topic: z.string().describe("The topic to research"),
+      sessionId: z.string().optional()
+        .describe("Resume an interrupted research session by the id reported when it failed")
     }
   },
-  async ({ topic }) => {
+  async ({ topic, sessionId }) => {
+    // Every run gets a session id so a failed run can be resumed; the worker
+    // deletes the checkpoints of runs that finish, so they do not pile up
+    const session = sessionId || randomUUID();
     try {
       // Semantic input validation: a non-empty topic is required for a useful
       // research run. Per MCP 2025-11-25 (SEP-1303) this kind of input
@@ -107,95 +305,51 @@ server.registerTool(
       // Validate API keys before starting research
       validateApiKeys(config.searchApi);
 
-      // In Docker the image installs dependencies with pip and has no uv,
-      // so run python3 directly; locally use uv to get the project venv.
-      const isDocker = process.env.DOCKER_CONTAINER === "true";
-      const scriptPath = isDocker
-        ? "/app/src/assistant/run_research.py"
-        : join(__dirname, "..", "src", "assistant", "run_research.py").replace(/\\/g, "/");
-      const [command, baseArgs] = isDocker
-        ? ["python3", [] as string[]]
-        : ["uv", ["run", "python"]];
-
-      const pythonProcess: ChildProcess = spawn(command, [
-        ...baseArgs,
-        scriptPath,
+      // Track progress from the worker's streamed events
+      const progress: ResearchState = {
         topic,
-        config.maxLoops.toString(),
-        config.llmModel,
-        config.searchApi
-      ], {
-        env: {
-          ...process.env,  // Pass through existing environment variables
-          PYTHONUNBUFFERED: "1",  // Ensure Python output is not buffered
-          PYTHONPATH: isDocker ? "/app/src" : join(__dirname, "..", "src").replace(/\\/g, "/"),  // Add src directory to Python path
-          TAVILY_API_KEY: process.env.TAVILY_API_KEY || "",  // Ensure API key is passed to Python process
-          PERPLEXITY_API_KEY: process.env.PERPLEXITY_API_KEY || "",  // Ensure API key is passed to Python process
-          EXA_API_KEY: process.env.EXA_API_KEY || ""  // Ensure API key is passed to Python process
-        },
-        cwd: isDocker ? "/app" : join(__dirname, "..").replace(/\\/g, "/")  // Set working directory
-      });
-
-      // Collect output using Promise with 30 minute timeout
-      // (larger models like gemma4:31b can take ~6 minutes per research loop)
-      const output = await new Promise<string>((resolve, reject) => {
-        const timeout = setTimeout(() => {
-          pythonProcess.kill();
-          reject(new Error('Research process timed out after 30 minutes'));
-        }, 1800000); // 30 minutes
-        let stdout = '';
-        let stderr = '';
-
-        if (pythonProcess.stdout) {
-          pythonProcess.stdout.on("data", (data: Buffer) => {
-            const output = data.toString().trim();
-            if (output) {
-              stdout += output;
-              console.error(`[research] ${output}`);
-            }
-          });
-        }
-        if (pythonProcess.stderr) {
-          pythonProcess.stderr.on("data", (data: Buffer) => {
-            const error = data.toString().trim();
-            if (error) {
-              stderr += error;
-              console.error(`[research error] ${error}`);
-            }
-          });
-        }
-
-        pythonProcess.on("error", (error: Error) => {
-          reject(new Error(`Failed to start Python process: ${error.message}`));
-        });
-
-        pythonProcess.on("close", (code: number) => {
-          clearTimeout(timeout);
-          if (code !== 0) {
-            reject(new Error(`Python process exited with code ${code}. Error: ${stderr}`));
-            return;
+        currentStep: "starting",
+        loopCount: 0,
+        summary: "",
+        sources: []
+      };
+      currentResearch = progress;
+      let restartSummary = false;
+
+      const output = await researchWorker.run(topic, {
+        max_loops: config.maxLoops,
+        llm_model: config.llmModel,
+        planner_llm: config.plannerModel,
+        writer_llm: config.writerModel,
+        search_api: config.searchApi,
+        session_id: session,
+        resume: sessionId !== undefined,
+        configurable: { research_timeout: (RESEARCH_TIMEOUT_MS - FINALIZE_MARGIN_MS) / 1000 }
+      }, (event) => {
+        if (event.event === "node_start" && event.node) {
+          progress.currentStep = event.node;
+          // A new summary (or the final merge of research notes) replaces the
+          // streamed text once its first token arrives
+          if (event.node === "summarize_sources" || event.node === "finalize_summary") {
+            restartSummary = true;
           }
-
-          try {
-            const result = JSON.parse(stdout.trim()) as PythonResponse;
-            if (result.error) {
-              reject(new Error(result.error));
-            } else if (result.summary) {
-              resolve(result.summary);
-            } else {
-              resolve('No summary available');
-            }
-          } catch (e) {
-            reject(new Error(`Failed to parse Python output: ${e}\nStdout: ${stdout}\nStderr: ${stderr}`));
+        } else if (event.event === "sources") {
+          progress.loopCount = event.loop ?? progress.loopCount;
+          progress.sources.push(...(event.sources ?? []));
+        } else if (event.event === "token" && event.content) {
+          if (restartSummary) {
+            progress.summary = "";
+            restartSummary = false;
           }
-        });
+          progress.summary += event.content;
+        }
       });
 
       // Store completed research result
       const result: ResearchResult = {
         topic,
         summary: output,
-        sources: [],
+        sources: progress.sources,
         timestamp: new Date().toISOString()
       };
       researchResults.set(topicToUri(topic), result);
@@ -206,9 +360,9 @@ server.registerTool(
       currentResearch = {
         topic,
         currentStep: "completed",
-        loopCount: config.maxLoops,
+        loopCount: progress.loopCount || config.maxLoops,
         summary: output,
-        sources: []
+        sources: progress.sources
       };
 
       return {
@@ -225,7 +379,7 @@ server.registerTool(
         content: [
           {
             type: "text" as const,
-            text: `Research failed: ${errorMessage}`,
+            text: `Research failed: ${errorMessage}\nCompleted steps are checkpointed; call research again with sessionId "${session}" to resume.`,
           },
         ],
         isError: true,
@@ -277,12 +431,17 @@ server.registerTool(
         .describe("Maximum number of research loops (1-10)"),
       llmModel: z.string().optional()
         .describe("Ollama model to use (e.g. gemma4:31b)"),
+      plannerModel: z.string().optional()
+        .describe("Ollama model writing search queries and reflections (empty to use llmModel)"),
+      writerModel: z.string().optional()
+        .describe("Ollama model writing the summary (empty to use llmModel)"),
       searchApi: z.enum(["perplexity", "tavily", "exa"]).optional()
         .describe("Search API to use for web research")
     }
   },
-  async ({ maxLoops, llmModel, searchApi }) => {
-    const hasUpdates = maxLoops !== undefined || llmModel !== undefined || searchApi !== undefined;
+  async ({ maxLoops, llmModel, plannerModel, writerModel, searchApi }) => {
+    const hasUpdates = maxLoops !== undefined || llmModel !== undefined || plannerModel !== undefined ||
+      writerModel !== undefined || searchApi !== undefined;
     let configMessage = 'Current research configuration:';
 
     if (hasUpdates) {
@@ -305,6 +464,8 @@ server.registerTool(
           ...config,
           ...(maxLoops !== undefined && { maxLoops }),
           ...(llmModel !== undefined && { llmModel }),
+          ...(plannerModel !== undefined && { plannerModel: plannerModel || undefined }),
+          ...(writerModel !== undefined && { writerModel: writerModel || undefined }),
           ...(searchApi !== undefined && { searchApi })
         };
         configMessage = 'Research configuration updated:';
@@ -328,6 +489,8 @@ server.registerTool(
           text: `${configMessage}
 Max Loops: ${config.maxLoops}
 LLM Model: ${config.llmModel}
+Planner Model: ${config.plannerModel ?? config.llmModel}
+Writer Model: ${config.writerModel ?? config.llmModel}
 Search API: ${config.searchApi}`,
         },
       ],
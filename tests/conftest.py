@@ -0,0 +1,43 @@
+import pytest
+
+from assistant import graph
+
+class FakeGraph:
+    """Record of the fake nodes' calls; summarizing fails on the loops in ``fail_loops``."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail_loops = set()
+
+@pytest.fixture
+def fake_graph(monkeypatch):
+    """Rebuild the research graphs with fake LLM and search nodes."""
+    fake = FakeGraph()
+
+    def generate_query(state, config):
+        fake.calls.append("generate_query")
+        return {"search_query": f"{state.research_topic} query", "search_queries": []}
+
+    def web_research(state, config):
+        fake.calls.append("web_research")
+        loop = state.research_loop_count + 1
+        return {"research_loop_count": loop, "web_research_results": [f"Sources: loop {loop}"], "sources_gathered": [f"* loop {loop} : http://x/{loop}"]}
+
+    def summarize_sources(state, config):
+        fake.calls.append("summarize_sources")
+        if state.research_loop_count in fake.fail_loops:
+            raise RuntimeError("ollama went away")
+        return {"running_summary": f"summary of {state.research_topic} after {state.research_loop_count} loops", "loop_gains": [1.0]}
+
+    def reflect_on_summary(state, config):
+        fake.calls.append("reflect_on_summary")
+        return {"search_query": "follow up", "search_queries": []}
+
+    for name, node in [("generate_query", generate_query), ("web_research", web_research),
+                       ("summarize_sources", summarize_sources), ("reflect_on_summary", reflect_on_summary)]:
+        monkeypatch.setattr(graph, name, node)
+    monkeypatch.setattr(graph, "_graphs", {})
+    monkeypatch.setattr("assistant.checkpoint._graphs", {})
+    monkeypatch.setenv("RESEARCH_STORE_ENABLED", "false")
+    monkeypatch.delenv("METRICS_PATH", raising=False)
+    return fake
@@ -0,0 +1,35 @@
+import copy
+
+from assistant.benchmark import BenchmarkSettings, _percentile, compare, run_benchmark
+
+def test_percentile_interpolates_between_samples():
+    assert _percentile([], 0.5) == 0.0
+    assert _percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+    assert _percentile([1.0, 2.0], 0.95) == 1.95
+
+def test_benchmark_smoke_run_and_regression_check():
+    settings = BenchmarkSettings(
+        concurrency=[1], sessions=1, loops=1, search_latency=0, payload_bytes=200,
+        llm_latency=0, prompt_token_latency=0, token_latency=0, summary_words=20
+    )
+    report = run_benchmark(settings)
+    assert report["settings"]["concurrency"] == [1]
+    [level] = report["levels"]
+    assert level["concurrency"] == 1
+    assert level["sessions"] == 1
+    assert level["sessions_per_minute"] > 0
+    assert set(level["session_seconds"]) == {"mean", "p50", "p95", "max"}
+    assert "node:web_research" in level["stage_seconds"]
+    assert "llm:summarize_sources" in level["stage_seconds"]
+    # The first search plus one follow-up loop, each summarized once
+    assert len(level["summary_prompt_tokens_per_loop"]) == 2
+    assert compare(report, report, tolerance=0.1) == []
+
+    # A baseline twice as fast flags both the throughput and the stage timings
+    baseline = copy.deepcopy(report)
+    [previous] = baseline["levels"]
+    previous["sessions_per_minute"] = level["sessions_per_minute"] * 2
+    previous["stage_seconds"]["node:web_research"]["p50"] = level["stage_seconds"]["node:web_research"]["p50"] / 2
+    regressions = compare(report, baseline, tolerance=0.1)
+    assert any("sessions/min" in regression for regression in regressions)
+    assert any("node:web_research p50" in regression for regression in regressions)
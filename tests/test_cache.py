@@ -0,0 +1,108 @@
+from assistant import cache as cache_module
+from assistant import graph
+from assistant.cache import LLMCache, SearchCache, get_content_store, get_search_cache
+from assistant.configuration import Configuration
+from assistant.context import format_source
+
+SOURCES = [{"url": "https://a.example", "title": "A", "content": "Snippet", "raw_content": "Full page text of A"}]
+
+def test_content_store_is_off_by_default():
+    assert Configuration().content_store_enabled is False
+
+def test_page_text_goes_to_the_content_store(tmp_path):
+    configurable = Configuration(content_store_enabled=True, content_store_path=str(tmp_path / "content.sqlite"))
+    records = graph._store_sources(configurable, SOURCES, include_raw_content=True)
+    assert records[0].raw_content is None
+    assert get_content_store(configurable).get(records[0].raw_key) == "Full page text of A"
+    assert graph._load_sources(configurable, records) == SOURCES
+
+def test_disabled_content_store_keeps_page_text_in_the_state(tmp_path):
+    configurable = Configuration(content_store_enabled=False, content_store_path=str(tmp_path / "content.sqlite"))
+    assert get_content_store(configurable) is None
+    records = graph._store_sources(configurable, SOURCES, include_raw_content=True)
+    assert records[0].raw_key is None
+    assert graph._load_sources(configurable, records) == SOURCES
+    assert not (tmp_path / "content.sqlite").exists()
+
+def test_evicted_page_text_falls_back_to_the_snippet(tmp_path):
+    configurable = Configuration(content_store_enabled=True, content_store_path=str(tmp_path / "content.sqlite"))
+    records = graph._store_sources(configurable, SOURCES, include_raw_content=True)
+    # Another page pushes the store over its cap, evicting the checkpointed one
+    store = get_content_store(configurable)
+    store.max_bytes = 1
+    store.put("Another page")
+    assert store.get(records[0].raw_key) is None
+    sources = graph._load_sources(configurable, records)
+    assert sources == [{**SOURCES[0], "raw_content": None}]
+    assert "Snippet" in format_source(sources[0], raw_content_tokens=100)
+    assert "Full source content" not in format_source(sources[0], raw_content_tokens=100)
+
+def test_search_cache_hits_normalized_queries_and_misses_other_params(tmp_path):
+    cache = SearchCache(str(tmp_path / "search.sqlite"))
+    assert cache.get("tavily", "ollama models", max_results=3) is None
+    cache.set("tavily", "ollama models", {"results": [1]}, max_results=3)
+    assert cache.get("tavily", "  Ollama   MODELS ", max_results=3) == {"results": [1]}
+    assert cache.get("tavily", "ollama models", max_results=5) is None
+    assert cache.get("exa", "ollama models", max_results=3) is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "evictions": 0, "entries": 1}
+
+def test_search_cache_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = SearchCache(str(tmp_path / "search.sqlite"), ttl_seconds=60)
+    cache.set("tavily", "old", {"results": []})
+    now[0] += 30
+    assert cache.get("tavily", "old") == {"results": []}
+    now[0] += 31
+    assert cache.get("tavily", "old") is None
+    assert cache.stats()["entries"] == 0
+
+def test_search_cache_evicts_least_recently_used_beyond_max_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = SearchCache(str(tmp_path / "search.sqlite"), max_entries=2)
+    for query in ("a", "b"):
+        now[0] += 1
+        cache.set("tavily", query, {"query": query})
+    now[0] += 1
+    cache.get("tavily", "a")
+    now[0] += 1
+    cache.set("tavily", "c", {"query": "c"})
+    assert cache.get("tavily", "b") is None
+    assert cache.get("tavily", "a") == {"query": "a"}
+    assert cache.get("tavily", "c") == {"query": "c"}
+    assert cache.stats()["evictions"] == 1
+    # The entry count survives reopening the database
+    assert SearchCache(str(tmp_path / "search.sqlite"), max_entries=2).stats()["entries"] == 2
+
+def test_search_cache_applies_a_lower_cap_and_ttl_to_the_open_cache(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    monkeypatch.setattr(cache_module, "_caches", {})
+    settings = dict(search_cache_enabled=True, search_cache_path=str(tmp_path / "search.sqlite"))
+    cache = get_search_cache(Configuration(**settings, search_cache_max_entries=10))
+    for query in ("a", "b", "c"):
+        now[0] += 1
+        cache.set("tavily", query, {"query": query})
+    assert get_search_cache(Configuration(**settings, search_cache_max_entries=2)) is cache
+    assert cache.stats()["entries"] == 2
+    assert cache.get("tavily", "a") is None
+    now[0] += 10
+    get_search_cache(Configuration(**settings, search_cache_max_entries=2, search_cache_ttl=5))
+    assert cache.stats()["entries"] == 0
+
+def test_llm_cache_evicts_least_recently_used_beyond_max_bytes(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = LLMCache(str(tmp_path / "llm.sqlite"), max_bytes=20)
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.set(key, "model", "x" * 10)
+    now[0] += 1
+    cache.set("a", "model", "y" * 10)  # Replacing an entry does not count its old size
+    assert cache.stats()["evictions"] == 0
+    now[0] += 1
+    cache.set("c", "model", "z" * 5)
+    assert cache.get("b") is None
+    assert cache.get("a") == "y" * 10
+    assert cache.stats()["bytes"] == 15
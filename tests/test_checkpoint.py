@@ -0,0 +1,38 @@
+import pytest
+
+from assistant import run_research
+from assistant.checkpoint import get_checkpointed_graph
+
+@pytest.fixture
+def checkpoints(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoints.sqlite")
+    monkeypatch.setenv("CHECKPOINT_PATH", path)
+    return path
+
+def test_failed_run_resumes_from_last_completed_node(fake_graph, checkpoints):
+    fake_graph.fail_loops.add(1)
+    calls = fake_graph.calls
+    config = run_research.build_config(max_loops=2, session_id="s1")
+
+    failed = run_research.research("topic", config)
+    assert failed["session_id"] == "s1" and "ollama went away" in failed["error"]
+    assert calls == ["generate_query", "web_research", "summarize_sources"]
+
+    fake_graph.fail_loops.clear()
+    calls.clear()
+    resumed = run_research.research(None, run_research.build_config(max_loops=2, session_id="s1"), resume=True)
+    assert "error" not in resumed
+    assert "summary of topic after" in resumed["summary"]
+    # The completed steps were not run again
+    assert calls[0] == "summarize_sources" and "generate_query" not in calls
+
+def test_finished_session_checkpoints_are_deleted(fake_graph, checkpoints):
+    config = run_research.build_config(max_loops=1, session_id="s2")
+    assert "error" not in run_research.research("topic", config)
+    assert not get_checkpointed_graph(checkpoints).get_state(config).values
+
+def test_finished_session_checkpoints_can_be_kept(fake_graph, checkpoints, monkeypatch):
+    monkeypatch.setenv("KEEP_FINISHED_SESSIONS", "true")
+    config = run_research.build_config(max_loops=1, session_id="s3")
+    run_research.research("topic", config)
+    assert get_checkpointed_graph(checkpoints).get_state(config).values
@@ -0,0 +1,35 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from assistant import context, graph
+from assistant.configuration import Configuration
+from assistant.context import calibrate_tokens, calibrated_budget, estimate_tokens, token_ratio
+
+def test_ratio_follows_reported_counts(monkeypatch):
+    monkeypatch.setattr(context, "_ratios", {})
+    assert token_ratio("writer") == 1.0
+    calibrate_tokens("writer", 1000, 1300)
+    assert token_ratio("writer") == 1.3
+    for _ in range(50):
+        calibrate_tokens("writer", 1000, 1100)
+    assert abs(token_ratio("writer") - 1.1) < 0.01
+    assert token_ratio("planner") == 1.0
+    assert calibrated_budget("writer", 6000) == int(6000 / token_ratio("writer"))
+
+def test_unreliable_counts_are_ignored(monkeypatch):
+    monkeypatch.setattr(context, "_ratios", {})
+    calibrate_tokens("writer", 50, 120)  # Mostly chat template
+    calibrate_tokens("writer", 1000, None)  # Not reported
+    calibrate_tokens("writer", 4000, 300)  # Prompt reused from Ollama's KV cache
+    assert token_ratio("writer") == 1.0
+
+def test_llm_calls_calibrate_the_writer_budget(monkeypatch):
+    monkeypatch.setattr(context, "_ratios", {})
+    messages = [SystemMessage(content="Summarize the sources."), HumanMessage(content="word " * 500)]
+    estimated = sum(estimate_tokens(message.content) for message in messages)
+    configurable = Configuration(local_llm="writer")
+
+    graph._calibrate({"model": "writer", "prompt_tokens": estimated * 2}, messages)
+    assert graph._context_budget(configurable) == configurable.context_token_budget // 2
+    # A cached reply reports no tokens of its own
+    graph._calibrate({"model": "writer", "prompt_tokens": estimated, "cached": True}, messages)
+    assert token_ratio("writer") == 2.0
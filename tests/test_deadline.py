@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+
+import pytest
+
+from assistant import deadline
+
+def _block(event):
+    """A cooperative call: checks the deadlines between steps until released."""
+    started = time.monotonic()
+    while not event.wait(0.01) and time.monotonic() - started < 5:
+        deadline.check()
+    return "done"
+
+def _cancel_soon(scope, reason=None, delay=0.05):
+    threading.Timer(delay, scope.cancel, args=(reason,)).start()
+
+def test_cancel_without_time_limit_raises_cancelled():
+    # node_timeout=0 and research_timeout=0: no time limit anywhere
+    release = threading.Event()
+    with deadline.session(0) as scope:
+        deadline.start_node(0)
+        _cancel_soon(scope)
+        with pytest.raises(deadline.ResearchCancelled):
+            deadline.call(_block, release)
+    release.set()
+
+def test_cancel_from_another_thread_is_reported_as_cancellation():
+    release = threading.Event()
+    with deadline.session(0) as scope:
+        deadline.start_node(600)
+        _cancel_soon(scope, "stopped by caller")
+        with pytest.raises(deadline.ResearchCancelled, match="stopped by caller"):
+            deadline.call(_block, release)
+    release.set()
+
+def test_session_deadline_is_reported_as_deadline():
+    release = threading.Event()
+    with deadline.session(0.1):
+        with pytest.raises(deadline.DeadlineExceeded, match="Research deadline"):
+            deadline.call(_block, release)
+    release.set()
+
+def test_node_timeout_gives_up_on_call():
+    release = threading.Event()
+    with deadline.session(0):
+        deadline.start_node(0.1)
+        started = time.monotonic()
+        with pytest.raises(deadline.DeadlineExceeded, match="Node deadline"):
+            deadline.call(_block, release)
+        assert time.monotonic() - started < 1
+    release.set()
+
+def test_call_runs_in_the_calling_thread():
+    with deadline.session(0):
+        deadline.start_node(600)
+        assert deadline.call(threading.current_thread) is threading.current_thread()
+
+def test_client_timeout_is_shortened_to_the_deadline():
+    assert deadline.client_timeout(60) == 60
+    with deadline.session(0):
+        deadline.start_node(5)
+        assert 4 < deadline.client_timeout(60) <= 5
+        assert deadline.client_timeout(1) == 1
+        deadline.start_node(0)
+        assert deadline.client_timeout(None) is None
+
+def test_wait_gives_up_on_a_future_when_cancelled():
+    import concurrent.futures
+
+    future = concurrent.futures.Future()
+    with deadline.session(0) as scope:
+        _cancel_soon(scope)
+        with pytest.raises(deadline.ResearchCancelled):
+            deadline.wait(future)
+    future.set_result("late")
+    with deadline.session(0):
+        deadline.start_node(0.05)
+        assert deadline.wait(future) == "late"
+
+def test_nested_scope_follows_parent_cancellation():
+    parent = deadline.Deadline()
+    child = deadline.Deadline(parent=parent)
+    parent.cancel("shutdown")
+    assert child.stop_reason() == "shutdown"
+    assert isinstance(child.error(), deadline.ResearchCancelled)
+
+def test_failing_callback_does_not_stop_the_others(capsys):
+    scope = deadline.Deadline()
+    called = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    scope.on_cancel(fail)
+    scope.on_cancel(lambda: called.append(True))
+    scope.cancel()
+    assert called == [True]
+    assert "boom" in capsys.readouterr().err
+
+def test_async_call_is_cancelled():
+    import asyncio
+
+    async def main():
+        with deadline.session(0) as scope:
+            asyncio.get_running_loop().call_later(0.05, scope.cancel)
+            with pytest.raises(deadline.ResearchCancelled):
+                await deadline.acall(asyncio.sleep(5))
+
+    asyncio.run(main())
+
+def test_worker_cancel_line_without_time_limits(monkeypatch):
+    from assistant import run_research
+
+    release = threading.Event()
+    started = threading.Event()
+
+    def run_job(job, write):
+        deadline.start_node(0)
+        started.set()
+        try:
+            deadline.call(_block, release)
+        except deadline.ResearchCancelled as e:
+            write({'id': job['id'], 'summary': 'partial', 'stop_reason': str(e)})
+
+    monkeypatch.setattr(run_research, "run_job", run_job)
+    dispatcher = run_research.JobDispatcher(2)
+    responses = []
+    dispatcher.submit('{"id": "a", "topic": "t"}', responses.append)
+    assert started.wait(5)
+    dispatcher.submit('{"cancel": "a"}', responses.append)
+    dispatcher.shutdown()
+    release.set()
+    assert responses == [{'id': 'a', 'summary': 'partial', 'stop_reason': 'Research cancelled'}]
+
+def test_worker_cancel_line_stops_a_call_waiting_for_the_first_chunk(monkeypatch):
+    from assistant import run_research
+    from assistant.benchmark import BenchmarkSettings, StubOllamaServer
+
+    monkeypatch.setenv("RESEARCH_STORE_ENABLED", "false")
+    monkeypatch.delenv("OLLAMA_BASE_URL", raising=False)
+    monkeypatch.delenv("LOCAL_LLM", raising=False)
+    responses = []
+    # The stub Ollama takes 5s to read the prompt before it sends anything
+    with StubOllamaServer(BenchmarkSettings(llm_latency=5)) as server:
+        dispatcher = run_research.JobDispatcher(1)
+        configurable = {"ollama_base_url": server.base_url, "local_llm": "benchmark", "llm_cache_enabled": False}
+        dispatcher.submit(json.dumps({"id": "a", "topic": "t", "configurable": configurable}), responses.append)
+        time.sleep(0.3)
+        cancelled = time.monotonic()
+        dispatcher.submit('{"cancel": "a"}', responses.append)
+        dispatcher.shutdown()
+        assert time.monotonic() - cancelled < 1.5
+    [response] = responses
+    assert response["id"] == "a" and "cancelled" in response["error"]
@@ -0,0 +1,40 @@
+from assistant.dedup import canonicalize_url, empty_index, filter_seen_sources, minhash_signature, similarity
+
+def test_canonicalize_url_ignores_trivial_differences():
+    canonical = canonicalize_url("https://example.com/page?a=1&b=2")
+    for url in [
+        "http://www.Example.com/page/?b=2&a=1",
+        "https://example.com/page?a=1&b=2&utm_source=news&gclid=x",
+        "https://example.com/page?a=1&b=2#section",
+        "  https://EXAMPLE.com/page?a=1&b=2  ",
+    ]:
+        assert canonicalize_url(url) == canonical
+    assert canonicalize_url("https://example.com") == canonicalize_url("https://example.com/")
+    assert canonicalize_url("https://example.com/page?a=2") != canonical
+    assert canonicalize_url("https://example.com/other") != canonical
+
+def test_minhash_similarity_tracks_overlap():
+    words = [f"word{i}" for i in range(400)]
+    page = " ".join(words)
+    assert similarity(minhash_signature(page), minhash_signature(page.upper())) == 1.0
+    # A few changed words keep most shingles; an unrelated page shares none
+    edited = " ".join(words[:390] + ["changed"] * 10)
+    assert similarity(minhash_signature(page), minhash_signature(edited)) >= 0.8
+    other = " ".join(f"other{i}" for i in range(400))
+    assert similarity(minhash_signature(page), minhash_signature(other)) <= 0.1
+    # Signatures do not depend on the process that computed them
+    assert minhash_signature("a fixed text") == minhash_signature("a fixed text")
+
+def test_filter_seen_sources_across_loops():
+    page = " ".join(f"word{i}" for i in range(400))
+    first, index, dropped, _ = filter_seen_sources([{"url": "https://a.example/x", "content": "A", "raw_content": page}], empty_index(), 0.85, 100)
+    assert len(first) == 1 and dropped == 0
+    sources = [
+        {"url": "http://www.a.example/x/", "content": "Same URL"},
+        {"url": "https://mirror.example/x", "content": "Same page", "raw_content": page.replace("word399", "changed")},
+        {"url": "https://b.example/y", "content": "New", "raw_content": " ".join(f"other{i}" for i in range(400))},
+    ]
+    kept, index, dropped, tokens_saved = filter_seen_sources(sources, index, 0.85, 100)
+    assert [source["url"] for source in kept] == ["https://b.example/y"]
+    assert dropped == 2 and tokens_saved > 0
+    assert len(index["urls"]) == 2 and len(index["signatures"]) == 2
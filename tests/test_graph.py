@@ -0,0 +1,21 @@
+import asyncio
+
+from assistant import graph
+from assistant.benchmark import BenchmarkSettings, stubbed_environment
+
+def test_async_graph_runs_end_to_end_on_the_stubs():
+    settings = BenchmarkSettings(search_latency=0, payload_bytes=200, llm_latency=0, prompt_token_latency=0, token_latency=0, summary_words=20)
+    with stubbed_environment(settings) as server:
+        config = {"configurable": {
+            "ollama_base_url": server.base_url,
+            "local_llm": "benchmark",
+            "search_api": "tavily",
+            "max_web_research_loops": 1,
+            "early_stopping": False,
+            "search_cache_enabled": False
+        }}
+        result = asyncio.run(graph.get_graph(asynchronous=True).ainvoke({"research_topic": "async topic"}, config))
+    assert result["running_summary"].startswith("## Summary")
+    # Sources of both loops, found through the async search fakes
+    assert result["running_summary"].count("https://bench.example/") >= 2
+    assert result["stop_reason"] == "Reached the maximum of 1 research loops"
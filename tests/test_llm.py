@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from assistant import deadline, llm
+from assistant.configuration import Configuration
+from assistant.llm import PRIORITY_JSON, OllamaDispatcher, PrioritySlots, ainvoke_chat, invoke_chat
+
+class StubModel:
+    model = "stub"
+    base_url = "http://stub"
+    format = None
+    num_ctx = None
+    num_predict = None
+    temperature = 0
+
+    def __init__(self, delay=0.0, chunks=1):
+        self.delay = delay
+        self.chunks = chunks
+        self.calls = []
+        self.closed = False
+
+    def stream(self, messages, config=None):
+        self.calls.append(messages)
+        try:
+            for _ in range(self.chunks):
+                time.sleep(self.delay / self.chunks)
+                yield AIMessageChunk(content=messages[0].content)
+        finally:
+            self.closed = True
+
+    async def ainvoke(self, messages, config=None):
+        self.calls.append(messages)
+        await asyncio.sleep(self.delay)
+        return messages
+
+def test_slots_serve_best_priority_first():
+    slots = PrioritySlots(1)
+    slots.acquire(1)
+    order = []
+
+    def wait(priority):
+        slots.acquire(priority)
+        order.append(priority)
+        slots.release()
+
+    threads = [threading.Thread(target=wait, args=(priority,)) for priority in (1, 0)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    slots.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1]
+
+def test_cancelled_session_stops_waiting_for_a_slot():
+    slots = PrioritySlots(1)
+    slots.acquire(PRIORITY_JSON)
+    errors = []
+
+    def wait(scope):
+        with deadline.scope(scope):
+            try:
+                slots.acquire(PRIORITY_JSON)
+            except deadline.ResearchCancelled as e:
+                errors.append(e)
+
+    scope = deadline.Deadline()
+    thread = threading.Thread(target=wait, args=(scope,))
+    thread.start()
+    time.sleep(0.05)
+    scope.cancel()
+    thread.join(1)
+    assert not thread.is_alive() and len(errors) == 1
+    # The cancelled waiter does not take the slot once it frees up
+    slots.release()
+    assert slots.in_flight == 0
+
+def test_cancelled_call_never_reaches_ollama():
+    dispatcher = OllamaDispatcher(1)
+    model = StubModel()
+    dispatcher.slots.acquire(PRIORITY_JSON)
+    with deadline.session(0) as scope:
+        threading.Timer(0.05, scope.cancel).start()
+        with pytest.raises(deadline.ResearchCancelled):
+            deadline.call(dispatcher.invoke, model, [HumanMessage(content="cancelled")], PRIORITY_JSON, {})
+    dispatcher.slots.release()
+    time.sleep(0.1)
+    assert model.calls == []
+    assert dispatcher.slots.in_flight == 0
+
+def test_sync_call_stops_between_chunks_and_releases_its_slot():
+    dispatcher = OllamaDispatcher(1)
+    model = StubModel(delay=5, chunks=100)
+    with deadline.session(0) as scope:
+        threading.Timer(0.1, scope.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(deadline.ResearchCancelled):
+            deadline.call(dispatcher.invoke, model, [HumanMessage(content="slow")], PRIORITY_JSON, {})
+    assert time.monotonic() - started < 1
+    assert model.closed
+    assert dispatcher.slots.in_flight == 0
+
+def test_deadline_ends_the_wait_for_the_first_chunk():
+    from assistant.benchmark import BenchmarkSettings, StubOllamaServer
+
+    # The stub Ollama takes 5s to read the prompt before it sends anything
+    with StubOllamaServer(BenchmarkSettings(llm_latency=5)) as server:
+        configurable = Configuration(ollama_base_url=server.base_url, local_llm="benchmark", node_timeout=600, llm_cache_enabled=False)
+        with deadline.session(0.3):
+            started = time.monotonic()
+            with pytest.raises(deadline.DeadlineExceeded):
+                invoke_chat(configurable, [HumanMessage(content="slow prefill")])
+        assert time.monotonic() - started < 1.5
+
+def test_streamed_chunks_are_joined_into_one_message():
+    model = StubModel(chunks=3)
+    reply = OllamaDispatcher(1).invoke(model, [HumanMessage(content="ab")], PRIORITY_JSON, {})
+    assert reply.content == "ababab" and reply.type == "ai"
+
+def test_async_cancelled_call_releases_its_slot():
+    dispatcher = OllamaDispatcher(1)
+    model = StubModel(delay=5)
+
+    async def main():
+        with deadline.session(0) as scope:
+            asyncio.get_running_loop().call_later(0.05, scope.cancel)
+            with pytest.raises(deadline.ResearchCancelled):
+                await deadline.acall(dispatcher.ainvoke(model, [HumanMessage(content="slow")], PRIORITY_JSON, {}))
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert dispatcher.slots.in_flight == 0
+
+def test_follower_retries_when_the_leader_is_cancelled():
+    dispatcher = OllamaDispatcher(2)
+    model = StubModel(delay=0.3)
+
+    async def main():
+        with deadline.session(0) as leader_scope:
+            leader = asyncio.ensure_future(deadline.acall(dispatcher.ainvoke(model, [HumanMessage(content="same")], PRIORITY_JSON, {})))
+        await asyncio.sleep(0.05)
+        stats = {}
+        follower = asyncio.ensure_future(dispatcher.ainvoke(model, [HumanMessage(content="same")], PRIORITY_JSON, stats))
+        await asyncio.sleep(0.05)
+        leader_scope.cancel()
+        with pytest.raises(deadline.ResearchCancelled):
+            await leader
+        assert (await follower)[0].content == "same"
+        assert not stats.get("coalesced")
+
+    asyncio.run(main())
+
+class FailingModel(StubModel):
+    def stream(self, messages, config=None):
+        time.sleep(self.delay)
+        raise ConnectionError("Ollama is down")
+        yield
+
+    async def ainvoke(self, messages, config=None):
+        await asyncio.sleep(self.delay)
+        raise ConnectionError("Ollama is down")
+
+def test_only_completed_writer_calls_are_latency_samples(monkeypatch):
+    dispatcher = OllamaDispatcher(2)
+    monkeypatch.setattr(llm, "get_dispatcher", lambda configurable: dispatcher)
+    configurable = Configuration(planner_llm="planner", writer_llm="writer", writer_latency_budget=10.0)
+    messages = [HumanMessage(content="summarize")]
+
+    monkeypatch.setattr(llm, "chat_model", lambda *args: FailingModel())
+    with pytest.raises(ConnectionError):
+        invoke_chat(configurable, messages)
+    with pytest.raises(ConnectionError):
+        asyncio.run(ainvoke_chat(configurable, messages))
+    assert dispatcher.latency("writer").average is None
+
+    monkeypatch.setattr(llm, "chat_model", lambda *args: StubModel(delay=0.05))
+    invoke_chat(configurable, messages)
+    assert dispatcher.latency("writer").average >= 0.05
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from assistant import run_research
+from assistant.configuration import Configuration
+from assistant.metrics import MetricsRegistry, collect_metrics, current_metrics, record, timed
+
+def test_collect_metrics_records_only_inside_the_block():
+    record("llm", "outside", 1.0)
+    with collect_metrics("s1") as metrics:
+        assert current_metrics() is metrics
+        record("llm", "generate_query", 0.5, prompt_tokens=10, completion_tokens=5)
+        record("llm", "generate_query", 1.5, prompt_tokens=20, completion_tokens=None)
+    assert current_metrics() is None
+    summary = metrics.summary()
+    assert summary["session_id"] == "s1"
+    [stage] = summary["stages"]
+    assert stage["calls"] == 2
+    assert stage["total_seconds"] == 2.0
+    assert stage["max_seconds"] == 1.5
+    assert stage["mean_seconds"] == 1.0
+    assert (stage["prompt_tokens"], stage["completion_tokens"]) == (30, 5)
+
+def test_timed_records_fields_added_in_the_block_and_errors():
+    with collect_metrics() as metrics:
+        with timed("search", "tavily") as fields:
+            fields["bytes"] = 42
+        with pytest.raises(ValueError):
+            with timed("search", "tavily"):
+                raise ValueError("boom")
+    ok, failed = metrics.events
+    assert ok["bytes"] == 42 and "error" not in ok
+    assert failed["error"] == "ValueError"
+    [stage] = metrics.summary()["stages"]
+    assert (stage["calls"], stage["errors"], stage["bytes"]) == (2, 1, 42)
+
+def test_summary_reports_speculation_outcomes():
+    with collect_metrics() as metrics:
+        record("speculation", "hit", 0.0)
+        record("speculation", "hit", 0.0)
+        record("speculation", "cancelled", 0.0)
+    assert metrics.summary()["speculation"] == {"hits": 2, "misses": 0, "cancelled": 1, "hit_rate": 0.667}
+
+def test_jsonl_export_appends_one_line_per_event(tmp_path):
+    path = tmp_path / "metrics" / "sessions.jsonl"
+    configurable = Configuration(metrics_path=str(path))
+    for session_id in ("a", "b"):
+        with collect_metrics(session_id) as metrics:
+            record("node", "web_research", 0.25)
+        run_research.export_metrics(metrics, configurable)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(line["session_id"], line["kind"], line["name"], line["seconds"]) for line in lines] == [
+        ("a", "node", "web_research", 0.25),
+        ("b", "node", "web_research", 0.25),
+    ]
+
+def test_export_is_skipped_without_a_path(tmp_path):
+    with collect_metrics() as metrics:
+        record("node", "web_research", 0.25)
+    run_research.export_metrics(metrics, Configuration())
+    assert list(tmp_path.iterdir()) == []
+
+def test_prometheus_export_totals_sessions():
+    registry = MetricsRegistry()
+    for _ in range(2):
+        with collect_metrics() as metrics:
+            record("llm", "summarize", 1.5, completion_tokens=7)
+            record("llm", "summarize", 0.5, error="ValueError")
+        registry.add(metrics)
+    text = registry.to_prometheus()
+    assert "research_sessions_total 2\n" in text
+    assert '# TYPE research_stage_calls_total counter' in text
+    assert 'research_stage_calls_total{kind="llm",name="summarize"} 4\n' in text
+    assert 'research_stage_errors_total{kind="llm",name="summarize"} 2\n' in text
+    assert 'research_stage_seconds_total{kind="llm",name="summarize"} 4\n' in text
+    assert 'research_llm_completion_tokens_total{kind="llm",name="summarize"} 14\n' in text
+
+def test_prometheus_export_rewrites_the_file(tmp_path):
+    path = tmp_path / "metrics.prom"
+    configurable = Configuration(metrics_path=str(path), metrics_format="prometheus")
+    with collect_metrics() as metrics:
+        record("node", "web_research", 0.25)
+    run_research.export_metrics(metrics, configurable)
+    run_research.export_metrics(metrics, configurable)
+    assert path.read_text().count("# TYPE research_sessions_total counter") == 1
+    assert not (tmp_path / "metrics.prom.tmp").exists()
+
+def test_worker_export_settings_reach_each_job_without_the_environment(monkeypatch):
+    monkeypatch.delenv("METRICS_PATH", raising=False)
+    jobs = []
+    monkeypatch.setattr(run_research, "run_job", lambda job, write: jobs.append(job))
+    dispatcher = run_research.JobDispatcher(1, {"configurable": {"metrics_path": "/tmp/metrics.jsonl"}})
+    dispatcher.submit('{"id": "a", "topic": "t"}', print)
+    dispatcher.submit('{"id": "b", "topic": "t", "configurable": {"fetch_full_page": true}}', print)
+    dispatcher.shutdown()
+    assert [job["configurable"] for job in jobs] == [
+        {"metrics_path": "/tmp/metrics.jsonl"},
+        {"metrics_path": "/tmp/metrics.jsonl", "fetch_full_page": True},
+    ]
+    config = run_research.build_config(overrides=jobs[1]["configurable"])
+    assert Configuration.from_runnable_config(config).metrics_path == "/tmp/metrics.jsonl"
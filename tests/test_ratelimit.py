@@ -0,0 +1,93 @@
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+from assistant import deadline
+from assistant.ratelimit import RateLimiter, TokenBucket, retry_after, status_code
+
+def _http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status} error", response=response)
+
+def _limiter(**overrides):
+    settings = dict(rate=0, burst=1, max_retries=3, backoff_base=1.0, backoff_max=30.0)
+    settings.update(overrides)
+    return RateLimiter(**settings)
+
+def test_bucket_spaces_requests_beyond_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert 0.09 < bucket.reserve() <= 0.1
+
+def test_bucket_halves_rate_on_429_and_recovers():
+    bucket = TokenBucket(rate=4, burst=1)
+    bucket.penalize()
+    assert bucket.rate == 2
+    bucket.penalize()
+    bucket.penalize()
+    assert bucket.rate == 1  # Never below a quarter of the configured rate
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.rate == 4
+
+def test_status_and_retry_after_from_response():
+    error = _http_error(429, {"Retry-After": "12"})
+    assert status_code(error) == 429
+    assert retry_after(error) == 12.0
+
+def test_status_code_from_httpx_errors_only():
+    request = httpx.Request("POST", "https://api.exa.ai/search")
+    response = httpx.Response(503, request=request)
+    assert status_code(httpx.HTTPStatusError("busy", request=request, response=response)) == 503
+    assert status_code(ValueError("Request failed with status code 503: busy")) is None
+
+def test_retry_after_is_not_capped_by_backoff_max():
+    limiter = _limiter(backoff_max=30.0)
+    assert limiter.backoff(_http_error(429, {"Retry-After": "60"}), 0) == 60.0
+
+def test_computed_backoff_is_capped():
+    limiter = _limiter(backoff_base=100.0, backoff_max=2.0)
+    assert all(0 <= limiter.backoff(_http_error(503), attempt) <= 2.0 for attempt in range(3))
+
+def test_retry_after_past_the_deadline_fails_fast():
+    limiter = _limiter()
+    with deadline.session(10):
+        assert limiter.backoff(_http_error(429, {"Retry-After": "60"}), 0) is None
+        assert limiter.backoff(_http_error(429, {"Retry-After": "1"}), 0) == 1.0
+
+def test_gives_up_on_client_errors_and_after_max_retries():
+    limiter = _limiter(max_retries=2)
+    assert limiter.backoff(_http_error(400), 0) is None
+    assert limiter.backoff(_http_error(503), 2) is None
+
+def test_call_retries_transient_failures():
+    limiter = _limiter(backoff_base=0.001, backoff_max=0.001)
+    failures = [_http_error(503), requests.ConnectionError("reset")]
+
+    def flaky():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    stats = {}
+    assert limiter.call(flaky, stats) == "ok"
+    assert stats["retries"] == 2
+
+def test_cancelled_session_stops_sleeping_through_retry_after():
+    limiter = _limiter()
+
+    def limited():
+        raise _http_error(429, {"Retry-After": "60"})
+
+    with deadline.session(0) as scope:
+        threading.Timer(0.1, scope.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(deadline.ResearchCancelled):
+            limiter.call(limited)
+    assert time.monotonic() - started < 1
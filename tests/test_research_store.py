@@ -0,0 +1,81 @@
+from assistant import graph, research_store
+from assistant.configuration import Configuration
+from assistant.dedup import canonicalize_url
+from assistant.research_store import ResearchStore
+from assistant.run_research import _reused_summary
+from assistant.state import SummaryState
+
+def _page(url, text):
+    return {"url": url, "title": "Page", "content": "snippet", "raw_content": text}
+
+def _configuration(tmp_path, **overrides):
+    return Configuration(research_store_enabled=True, research_store_path=str(tmp_path / "research.sqlite"), **overrides)
+
+def test_summary_is_reused_only_above_the_match_threshold(tmp_path):
+    store = ResearchStore(str(tmp_path / "research.sqlite"))
+    store.add_summary("Ollama quantization formats compared", "Stored summary")
+    match = store.find_summary("compared: ollama quantization formats", threshold=0.8, max_age=3600)
+    assert match["summary"] == "Stored summary" and match["similarity"] == 1.0
+    # Three of five terms shared: similar, but below the threshold
+    assert store.find_summary("ollama quantization benchmarks latency", threshold=0.8, max_age=3600) is None
+    assert store.find_summary("ollama quantization benchmarks latency", threshold=0.3, max_age=3600) is not None
+    assert store.stats()["summary_hits"] == 2 and store.stats()["summary_misses"] == 1
+
+def test_stale_summaries_are_not_reused(tmp_path, monkeypatch):
+    store = ResearchStore(str(tmp_path / "research.sqlite"))
+    now = [1000.0]
+    monkeypatch.setattr(research_store.time, "time", lambda: now[0])
+    store.add_summary("Ollama quantization formats", "Old summary")
+    now[0] += 7200
+    assert store.find_summary("Ollama quantization formats", threshold=0.8, max_age=3600) is None
+
+def test_runs_reuse_stored_summaries_unless_disabled(tmp_path):
+    configurable = _configuration(tmp_path)
+    research_store.get_research_store(configurable).add_summary("Ollama quantization formats", "Stored summary")
+    config = {"configurable": {"research_store_enabled": True, "research_store_path": configurable.research_store_path}}
+    assert _reused_summary("ollama quantization formats", config)["summary"] == "Stored summary"
+    config["configurable"]["summary_reuse"] = False
+    assert _reused_summary("ollama quantization formats", config) is None
+
+def test_oldest_passages_are_evicted_beyond_max_passages(tmp_path):
+    store = ResearchStore(str(tmp_path / "research.sqlite"), max_passages=2)
+    for index, word in enumerate(("alpha", "bravo", "charlie")):
+        assert store.add_passages("topic", [_page(f"https://{word}.example", f"{word} passage number {index}")]) == 1
+    assert store.add_passages("topic", [_page("https://charlie.example", "charlie passage number 2")]) == 0
+    assert store.stats()["passages"] == 2
+    assert store.search_passages("alpha", 5) == []
+    assert {passage["url"] for passage in store.search_passages("bravo charlie", 5)} == {"https://bravo.example", "https://charlie.example"}
+    # The count survives reopening the database
+    assert ResearchStore(str(tmp_path / "research.sqlite"), max_passages=2).stats()["passages"] == 2
+
+def test_search_passages_pages_past_excluded_urls(tmp_path):
+    store = ResearchStore(str(tmp_path / "research.sqlite"))
+    excluded = [_page(f"https://seen{index}.example", f"gpu offloading layers note {index}") for index in range(10)]
+    store.add_passages("topic", excluded + [_page("https://new.example", "gpu offloading")])
+    seen = {canonicalize_url(page["url"]) for page in excluded}
+    passages = store.search_passages("gpu offloading", 1, exclude_urls=seen)
+    assert [passage["url"] for passage in passages] == ["https://new.example"]
+    assert passages[0]["coverage"] == 1.0
+
+def test_local_passages_augment_or_replace_the_web_search(tmp_path):
+    state = SummaryState(research_topic="gpu offloading")
+    queries = ["gpu offloading layers"]
+    augment = _configuration(tmp_path, local_passages_k=1)
+    research_store.get_research_store(augment).add_passages("topic", [_page("https://a.example", "How gpu offloading of layers works")])
+
+    local, sufficient = graph._local_search(state, augment, queries)
+    assert [source["url"] for source in local["results"]] == ["https://a.example"]
+    assert local["results"][0]["local"] and not sufficient
+
+    prefer = _configuration(tmp_path, local_passages_k=1, local_passages="prefer")
+    assert graph._local_search(state, prefer, queries)[1]
+    # Too few covering passages: the web search still runs
+    prefer_more = _configuration(tmp_path, local_passages_k=2, local_passages="prefer")
+    assert not graph._local_search(state, prefer_more, queries)[1]
+
+    off = _configuration(tmp_path, local_passages="off")
+    assert graph._local_search(state, off, queries) == (None, False)
+
+    # Pages the session already used are not served again
+    seen = SummaryState(research_topic="gpu offloading", seen_sources={"urls": [canonicalize_url("https://a.example")]})
+    assert graph._local_search(seen, augment, queries) == (None, False)
@@ -0,0 +1,89 @@
+import io
+import json
+
+import pytest
+
+from assistant import run_research
+
+def _serve(dispatcher, lines, monkeypatch):
+    """Run serve_stdio over ``lines`` and return the NDJSON documents it wrote."""
+    stdout = io.StringIO()
+    monkeypatch.setattr("sys.stdin", io.StringIO("".join(line + "\n" for line in lines)))
+    monkeypatch.setattr("sys.stdout", stdout)
+    run_research.serve_stdio(dispatcher)
+    return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+def test_failed_run_without_session_reports_the_error(fake_graph, capsys):
+    fake_graph.fail_loops.add(1)
+    response = run_research.research("topic", run_research.build_config(max_loops=1))
+    assert response["error"] == "ollama went away"
+    assert "summary" not in response and "session_id" not in response
+    assert "metrics" in response
+    # Without a checkpointer there is no state to read partial results from
+    assert "partial results" not in capsys.readouterr().err
+
+def test_failed_session_returns_its_partial_summary(fake_graph, tmp_path, monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite"))
+    fake_graph.fail_loops.add(2)
+    response = run_research.research("topic", run_research.build_config(max_loops=1, session_id="s1"))
+    assert response["session_id"] == "s1"
+    assert response["error"] == "ollama went away"
+    assert response["summary"].startswith("summary of topic after 1 loops\n\nNote: Research process ended early")
+
+def test_worker_answers_each_job_line(fake_graph, monkeypatch):
+    responses = _serve(run_research.JobDispatcher(2, {"max_loops": 0}), [
+        '{"id": "a", "topic": "alpha"}',
+        '"beta"',
+        '{"id": "c"}',
+        'not json',
+    ], monkeypatch)
+    assert responses[0] == {"ready": True}
+    assert len(responses) == 5
+    by_id = {response["id"]: response for response in responses[1:] if response["id"] is not None}
+    assert "summary of alpha after 1 loops" in by_id["a"]["summary"]
+    assert by_id["a"]["metrics"]["stages"]
+    assert by_id["c"] == {"id": "c", "error": "Job is missing a research topic"}
+    # A bare topic string is a job, a line that is not JSON is answered with an error
+    untagged = [response for response in responses[1:] if response["id"] is None]
+    assert any("summary of beta after 1 loops" in response.get("summary", "") for response in untagged)
+    assert any(response.get("error", "").startswith("Invalid job") for response in untagged)
+
+def test_stream_job_emits_progress_events_then_the_result(fake_graph, monkeypatch):
+    responses = _serve(run_research.JobDispatcher(1), ['{"id": "s", "topic": "alpha", "max_loops": 1, "stream": true}'], monkeypatch)
+    events = responses[1:]
+    assert all(event["id"] == "s" for event in events)
+    kinds = [event["event"] for event in events]
+    assert kinds[-1] == "result" and kinds.count("result") == 1
+    assert kinds[0] == "node_start" and "node_end" in kinds
+    assert [event["loop"] for event in events if event["event"] == "sources"] == [1, 2]
+    assert {"event": "search_queries", "node": "generate_query", "queries": ["alpha query"], "id": "s"} in events
+    assert "summary of alpha after 2 loops" in events[-1]["summary"]
+    assert "metrics" in events[-1]
+
+def test_batch_writes_every_result_and_counts_failures(fake_graph):
+    fake_graph.fail_loops.add(2)
+    lines = [
+        '{"topic": "alpha", "max_loops": 0}',
+        '',
+        '{"id": "b", "topic": "beta", "max_loops": 1}',
+        '{"topic": "gamma", "max_loops": 0, "stream": true}',
+    ]
+    output = io.StringIO()
+    jobs, failed = run_research.run_batch(lines, run_research.JobDispatcher(2), run_research._line_writer(output))
+    assert (jobs, failed) == (3, 1)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    results = {response["id"]: response for response in responses if response.get("event", "result") == "result"}
+    # Jobs without an id are tagged with their line number
+    assert set(results) == {1, "b", 4}
+    assert "summary of alpha after 1 loops" in results[1]["summary"]
+    assert results["b"]["error"] == "ollama went away"
+    assert "summary of gamma after 1 loops" in results[4]["summary"]
+    assert any(response.get("event") == "node_start" and response["id"] == 4 for response in responses)
+
+def test_unreadable_batch_file_is_an_argument_error(monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr("sys.argv", ["run_research", "--batch", str(tmp_path / "missing.jsonl")])
+    with pytest.raises(SystemExit) as exit_info:
+        run_research.main()
+    assert exit_info.value.code == 1
+    [line] = capsys.readouterr().out.splitlines()
+    assert json.loads(line)["error"].startswith("Invalid arguments: cannot read the batch file")
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from assistant import deadline, graph, speculation as speculations
+from assistant.metrics import collect_metrics
+from assistant.state import SummaryState
+
+CONFIG = {"configurable": {"max_web_research_loops": 3}}
+
+def _outcomes(metrics):
+    return [event["name"] for event in metrics.events if event["kind"] == "speculation"]
+
+def _prefetch(queries=None, responses=None, error=None):
+    def run(speculation):
+        speculation.queries.set_result(queries or {"search_query": "next", "search_queries": []})
+        if error is not None:
+            speculation.responses.set_exception(error)
+        else:
+            speculation.responses.set_result(responses)
+    return run
+
+def test_prefetch_hit_is_claimed_once():
+    with collect_metrics() as metrics:
+        speculation = speculations.start(_prefetch(responses=([{"results": []}], False)))
+        update = graph._speculation_update(speculation)
+        assert update == {"search_query": "next", "search_queries": [], "speculation_id": speculation.id}
+        claimed = graph._claim_prefetch(SummaryState(speculation_id=speculation.id))
+        assert graph._wait_for_prefetch(claimed) == ([{"results": []}], False)
+        assert speculations.take(speculation.id) is None
+    assert _outcomes(metrics) == ["hit"]
+
+def test_failed_or_unknown_prefetch_is_a_miss():
+    with collect_metrics() as metrics:
+        speculation = speculations.start(_prefetch(error=ConnectionError("search down")))
+        graph._speculation_update(speculation)
+        assert graph._wait_for_prefetch(graph._claim_prefetch(SummaryState(speculation_id=speculation.id))) is None
+        # A checkpoint resumed in another process refers to a prefetch it does not have
+        assert graph._claim_prefetch(SummaryState(speculation_id="unknown")) is None
+    assert _outcomes(metrics) == ["miss", "miss"]
+
+def test_query_wait_is_bounded_by_the_node_deadline():
+    release = threading.Event()
+    with collect_metrics() as metrics, deadline.session(0):
+        deadline.start_node(0.1)
+        speculation = speculations.start(lambda s: release.wait(5))
+        started = time.monotonic()
+        assert graph._speculation_update(speculation) == {}
+        assert time.monotonic() - started < 1
+    release.set()
+    assert speculation.cancelled.is_set()
+    assert _outcomes(metrics) == ["cancelled"]
+
+def test_discarded_prefetch_stops_its_calls():
+    stopped = threading.Event()
+
+    def run(speculation):
+        speculation.queries.set_result({"search_query": "next", "search_queries": []})
+        try:
+            while True:
+                deadline.check()
+                time.sleep(0.01)
+        except deadline.ResearchCancelled:
+            stopped.set()
+
+    with collect_metrics() as metrics:
+        speculation = speculations.start(run)
+        speculations.discard(speculation.id)
+    assert stopped.wait(1)
+    assert _outcomes(metrics) == ["cancelled"]
+
+def test_ended_session_releases_its_unclaimed_prefetches():
+    with deadline.session(0) as session:
+        speculation = speculations.start(_prefetch(responses=([], False)))
+    with deadline.session(0) as other:
+        kept = speculations.start(_prefetch(responses=([], False)))
+    speculations.release(session)
+    assert speculation.cancelled.is_set() and speculations.take(speculation.id) is None
+    assert speculations.take(kept.id) is kept
+    speculations.release(other)
+
+def test_shutdown_cancels_prefetches_and_stops_the_pool():
+    speculation = speculations.start(_prefetch(responses=([], False)))
+    speculations.shutdown()
+    assert speculation.cancelled.is_set() and speculations.take(speculation.id) is None
+    assert speculations._executor is None
+    # The pool starts again on the next prefetch
+    speculations.start(_prefetch(responses=([], False)))
+    speculations.shutdown()
+
+def test_summaries_are_reflected_on_unless_queries_were_prefetched():
+    state = SummaryState(research_topic="t", research_loop_count=1)
+    assert graph.route_summary(state, CONFIG) == "reflect_on_summary"
+    # The last loop still gets its reflection before research ends
+    last = SummaryState(research_topic="t", research_loop_count=4)
+    assert graph.route_summary(last, CONFIG) == "reflect_on_summary"
+    assert graph.route_research(last, CONFIG) == "finalize_summary"
+    assert graph.route_research(state, CONFIG) == "web_research"
+    pipelined = SummaryState(research_topic="t", research_loop_count=1, speculation_id="s")
+    assert graph.route_summary(pipelined, CONFIG) == "web_research"
+    with deadline.session(0) as session:
+        session.cancel()
+        assert graph.route_summary(state, CONFIG) == "finalize_summary"
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from assistant.structured import FollowUpQueries, SearchQueries, SearchQuery, json_schema, parse_reply, repair_json, strip_thinking
+
+@pytest.mark.parametrize("text, expected", [
+    # Prose and code fences around the object
+    ('Sure! ```json\n{"query": "a"}\n``` Hope this helps.', {"query": "a"}),
+    # Trailing commas
+    ('{"queries": [{"query": "a",}, {"query": "b"},],}', {"queries": [{"query": "a"}, {"query": "b"}]}),
+    # Single quotes, bare keys and Python literals
+    ("{'query': 'it\\'s \"quoted\"', done: True, extra: None}", {"query": "it's \"quoted\"", "done": True, "extra": None}),
+    # Raw control characters inside strings
+    ('{"rationale": "line one\nline\ttwo"}', {"rationale": "line one\nline\ttwo"}),
+    # Truncated by the reply length cap mid-string, mid-object and after a key
+    ('{"queries": [{"query": "a"}, {"query": "b', {"queries": [{"query": "a"}, {"query": "b"}]}),
+    ('{"query": "a", "aspect":', {"query": "a", "aspect": None}),
+    # Numbers and a top-level array
+    ("[1, -2.5, 3e2,]", [1, -2.5, 300.0]),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+def test_repair_json_without_json():
+    with pytest.raises(ValueError):
+        repair_json("I could not think of a query.")
+
+def test_parse_reply_reports_repairs():
+    reply, repaired = parse_reply('{"query": "solar cells", "aspect": "cost", "rationale": "why"}', SearchQuery)
+    assert reply.query == "solar cells" and not repaired
+    reply, repaired = parse_reply("<think>Hmm, {not json}</think>{'query': 'solar cells',}", SearchQuery)
+    assert reply == SearchQuery(query="solar cells") and repaired
+
+def test_parse_reply_accepts_near_shapes():
+    # Plain query strings, nulls for defaulted fields and query objects in reflections
+    reply, _ = parse_reply('{"queries": ["a", {"query": "b", "aspect": null}]}', SearchQueries)
+    assert [query.query for query in reply.queries] == ["a", "b"]
+    reply, _ = parse_reply('{"knowledge_gaps": null, "follow_up_queries": [{"query": "c"}, "d"]}', FollowUpQueries)
+    assert reply.follow_up_queries == ["c", "d"] and reply.knowledge_gaps == []
+
+def test_parse_reply_rejects_the_wrong_shape():
+    with pytest.raises(ValueError):
+        parse_reply('{"aspect": "cost"}', SearchQuery)
+
+def test_json_schema_inlines_nested_models_and_requires_every_field():
+    schema = json_schema(SearchQueries)
+    assert "$defs" not in json.dumps(schema)
+    assert set(schema["properties"]["queries"]["items"]["required"]) == {"query", "aspect", "rationale"}
+
+def test_strip_thinking():
+    assert strip_thinking("<think>a</think>b<think>c</think>d") == "bd"
+    assert strip_thinking("b<think>unclosed") == "b<think>unclosed"
@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import requests
+
+from assistant import utils
+from assistant.utils import abounded_map, aexa_search, bounded_map, exa_search
+
+_label = contextvars.ContextVar("label", default=None)
+
+def test_bounded_map_keeps_order_and_bounds_concurrency():
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def work(item):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.02 * (5 - item))
+        with lock:
+            running["now"] -= 1
+        if item == 3:
+            raise ValueError("three")
+        return (item, _label.get())
+
+    _label.set("session")
+    results, errors = bounded_map(work, [0, 1, 2, 3, 4], max_concurrency=2)
+    assert results == [(0, "session"), (1, "session"), (2, "session"), (4, "session")]
+    assert [str(e) for e in errors] == ["three"]
+    assert running["peak"] == 2
+
+def test_abounded_map_keeps_order_and_bounds_concurrency():
+    running = {"now": 0, "peak": 0}
+
+    async def work(item):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.01 * (5 - item))
+        running["now"] -= 1
+        if item == 0:
+            raise ValueError("zero")
+        return item
+
+    results, errors = asyncio.run(abounded_map(work, [0, 1, 2, 3, 4], max_concurrency=3))
+    assert results == [1, 2, 3, 4]
+    assert len(errors) == 1
+    assert running["peak"] == 3
+
+def test_bounded_map_of_nothing():
+    assert bounded_map(lambda item: item, []) == ([], [])
+
+class _ExaHandler(BaseHTTPRequestHandler):
+    # Answers "slow" queries only after the client has given up
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.headers["x-api-key"], body))
+        if body["query"] == "slow":
+            time.sleep(2)
+        reply = json.dumps({"results": [
+            {"url": "https://a.example", "title": "A", "text": "Page A", "highlights": ["Best bit of A"]},
+            {"url": "https://b.example", "title": None, "text": "Page B"}
+        ]}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def exa_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ExaHandler)
+    server.daemon_threads = True
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(utils, "EXA_URL", f"http://127.0.0.1:{server.server_port}/search")
+    monkeypatch.setenv("EXA_API_KEY", "exa-key")
+    yield server
+    server.shutdown()
+
+def test_exa_search_converts_results(exa_server):
+    response = exa_search("fast", max_results=2)
+    assert response["results"] == [
+        {"title": "A", "url": "https://a.example", "content": "Best bit of A", "raw_content": "Page A"},
+        {"title": "Exa Search Result 2", "url": "https://b.example", "content": "Page B", "raw_content": "Page B"}
+    ]
+    api_key, body = exa_server.requests[0]
+    assert api_key == "exa-key"
+    assert body["numResults"] == 2 and body["contents"] == {"text": True, "highlights": True}
+
+def test_exa_search_requests_end_at_the_timeout(exa_server):
+    started = time.perf_counter()
+    with pytest.raises(requests.Timeout):
+        exa_search("slow", timeout=0.2)
+    with pytest.raises(httpx.TimeoutException):
+        asyncio.run(aexa_search("slow", timeout=0.2))
+    assert time.perf_counter() - started < 1.5
+
+def test_traceable_imports_langsmith_only_when_tracing(monkeypatch):
+    probe = "import sys, assistant.utils; print('langsmith' in sys.modules)"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, env=env)
+    assert result.stdout.strip() == "False"
+
+    monkeypatch.delenv("LANGCHAIN_TRACING_V2", raising=False)
+    monkeypatch.delenv("LANGSMITH_TRACING", raising=False)
+
+    @utils.traceable
+    def search(query):
+        return query.upper()
+
+    @utils.traceable
+    async def asearch(query):
+        return query.upper()
+
+    assert search("ollama") == "OLLAMA"
+    assert asyncio.run(asearch("ollama")) == "OLLAMA"
+    assert asearch.__name__ == "asearch" and asyncio.iscoroutinefunction(asearch)